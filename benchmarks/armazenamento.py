@@ -0,0 +1,77 @@
+"""Compara a carga do arquivo chave-valor em dict com o indice mapeado em memoria.
+
+Gera um arquivo 'chave valor' com N chaves, converte-o com build_key_value_index e,
+para cada formato, sobe um Node num processo novo (spawn, para o RSS partir do zero).
+Mede o tempo ate o no estar pronto, o RSS acrescentado pela tabela e a vazao de
+buscas locais (metade acertos, metade chaves inexistentes).
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.armazenamento --chaves 100000 1000000 3000000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.transporte import rss_kb
+from node import Node, build_key_value_index
+
+LOOKUPS = 200_000
+
+
+def load(path: str, keys: int, conn):
+    rss_before = rss_kb(os.getpid())
+    started = time.perf_counter()
+    node = Node("127.0.0.1", 0, key_value_file=path, verbose=False)
+    startup = time.perf_counter() - started
+    rss_after = rss_kb(os.getpid())
+    rng = random.Random(1)
+    probes = [f"chave{rng.randrange(keys)}" if i % 2 else f"ausente{i}" for i in range(LOOKUPS)]
+    started = time.perf_counter()
+    found = sum(1 for key in probes if node.key_value_store.get(key) is not None)
+    lookup = time.perf_counter() - started
+    node.stop(grace=0)
+    conn.send({"inicio_s": startup, "rss_kb": rss_after - rss_before, "buscas_s": LOOKUPS / lookup,
+               "encontradas": found})
+
+
+def measure(path: str, keys: int) -> dict:
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    proc = context.Process(target=load, args=(path, keys, child_conn))
+    proc.start()
+    result = parent_conn.recv()
+    proc.join()
+    return result
+
+
+def write_key_values(path: str, keys: int):
+    with open(path, "w") as f:
+        for i in range(keys):
+            f.write(f"chave{i} valor_{i:08d}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chaves", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="armazenamento_")
+    print(f"{'chaves':>9} {'formato':>7} {'arquivo_mb':>10} {'inicio_s':>9} {'rss_mb':>8} {'buscas/s':>10}")
+    for keys in args.chaves:
+        text_path = os.path.join(work_dir, f"chaves{keys}.txt")
+        index_path = os.path.join(work_dir, f"chaves{keys}.idx")
+        write_key_values(text_path, keys)
+        started = time.perf_counter()
+        build_key_value_index(text_path, index_path)
+        print(f"{keys:>9} (indice gerado em {time.perf_counter() - started:.1f} s)")
+        for label, path in (("dict", text_path), ("indice", index_path)):
+            result = measure(path, keys)
+            print(f"{keys:>9} {label:>7} {os.path.getsize(path) / 2**20:>10.1f} {result['inicio_s']:>9.3f} "
+                  f"{result['rss_kb'] / 1024:>8.1f} {result['buscas_s']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Stress de buscas RW/BP simultaneas, que compartilham os nos do caminho.
+
+Sobe a topologia no mesmo processo com as chaves de key_values/ e dispara
+centenas de buscas ao mesmo tempo, a partir de todos os nos, por chaves que
+estao em outros nos. Mede a taxa de sucesso (VALs recebidos / buscas), a media
+de saltos, o tempo total e o tamanho das tabelas de estado por busca.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.buscas_concorrentes --topologia topologia_grid3x3 --buscas 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import time
+
+from benchmarks.cluster import start_cluster, stop_cluster, topology_files
+
+HOPS = {"RW": "random_walk_hops", "BP": "depth_first_hops"}
+
+
+def key_value_files(topology: str) -> dict:
+    files = {}
+    for number in topology_files(topology):
+        path = os.path.join("key_values", f"key_value{number}.txt")
+        if os.path.exists(path):
+            files[number] = path
+    return files
+
+
+def run(topology: str, mode: str, searches: int, base_port: int, wait: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        nodes = start_cluster(topology, base_port, key_value_files(topology), cache_size=0)
+        all_keys = [key for node in nodes for key in node.key_value_store]
+        started = time.perf_counter()
+        issued = 0
+        for _ in range(searches):
+            node = rng.choice(nodes)
+            remote_keys = [key for key in all_keys if key not in node.key_value_store]
+            if not remote_keys:
+                continue
+            node.start_search(mode, rng.choice(remote_keys))
+            issued += 1
+        deadline = time.monotonic() + wait
+        found = 0
+        while time.monotonic() < deadline:
+            found = sum(len(node.stats[HOPS[mode]]) for node in nodes)
+            if found >= issued:
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        hops = [hop for node in nodes for hop in node.stats[HOPS[mode]]]
+        states = max(len(node.search_states) for node in nodes)
+        stop_cluster(nodes)
+    return {
+        "modo": mode,
+        "buscas": issued,
+        "sucesso": found / issued if issued else 0.0,
+        "saltos": statistics.mean(hops) if hops else 0.0,
+        "tempo_s": elapsed,
+        "estados_max": states,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologia", default="topologia_grid3x3")
+    parser.add_argument("--buscas", type=int, default=300)
+    parser.add_argument("--espera", type=float, default=10.0, help="segundos para esperar as respostas")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'modo':>4} {'buscas':>6} {'sucesso':>8} {'saltos':>7} {'tempo_s':>8} {'estados_max':>11}")
+    for offset, mode in enumerate(HOPS):
+        result = run(args.topologia, mode, args.buscas, args.porta + 100 * offset, args.espera, args.seed)
+        print(f"{result['modo']:>4} {result['buscas']:>6} {result['sucesso']:>8.1%} {result['saltos']:>7.2f} "
+              f"{result['tempo_s']:>8.2f} {result['estados_max']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Sobe os nos de um diretorio topologia_* no mesmo processo, em portas remapeadas.
+
+Os arquivos <N>.txt usam as portas 5000 + N; aqui cada porta p vira base + (p - 5000)
+para que varias execucoes seguidas nao esbarrem em portas em TIME_WAIT.
+"""
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from hospedeiro import topology_files
+from node import Node
+
+
+def remap_topology(directory: str, base_port: int, output_dir: str) -> Dict[int, str]:
+    remapped = {}
+    for number, path in topology_files(directory).items():
+        with open(path) as f:
+            neighbors = [line.strip() for line in f if line.strip()]
+        lines = []
+        for neighbor in neighbors:
+            ip, port = neighbor.split(':')
+            lines.append(f"127.0.0.1:{base_port + int(port) - 5000}")
+        remapped[number] = os.path.join(output_dir, f"{number}.txt")
+        with open(remapped[number], "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return remapped
+
+
+def start_cluster(directory: str, base_port: int, key_value_files: Optional[Dict[int, str]] = None,
+                  settle: float = 1.0, **node_options) -> List[Node]:
+    output_dir = tempfile.mkdtemp(prefix="cluster_")
+    nodes = []
+    for number, neighbors_file in remap_topology(directory, base_port, output_dir).items():
+        key_value_file = (key_value_files or {}).get(number)
+        node = Node("127.0.0.1", base_port + number, neighbors_file, key_value_file, verbose=False, **node_options)
+        node.start(interactive=False)
+        nodes.append(node)
+    time.sleep(settle)
+    return nodes
+
+
+def stop_cluster(nodes: List[Node]):
+    for node in nodes:
+        node.stop(grace=0)
@@ -0,0 +1,72 @@
+"""Soak da tabela de deduplicacao (message_seen/search_received) com relogio simulado.
+
+Insere ids de mensagens SEARCH numa taxa fixa durante N horas simuladas, com uma
+fracao de duplicatas, e imprime a cada hora o numero de entradas, a memoria
+alocada (tracemalloc) e a taxa de acerto. A memoria deve ficar estavel.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.deduplicacao --horas 24 --taxa 50 --modo exact bloom
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from node import DEDUP_MAX_AGE, DEDUP_MAX_ENTRIES, DEDUP_MODES, BloomDedupTable, DedupTable
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def soak(mode: str, hours: float, rate: float, duplicates: float, max_entries: int, max_age: float, seed: int):
+    clock = SimulatedClock()
+    table_class = BloomDedupTable if mode == "bloom" else DedupTable
+    rng = random.Random(seed)
+    tracemalloc.start()
+    table = table_class(max_entries, max_age, clock)
+    recent = []
+    seqno = 0
+    step = 1.0 / rate
+    started = time.perf_counter()
+    print(f"modo={mode} taxa={rate}/s max_entries={max_entries} max_age={max_age}s")
+    print(f"{'hora':>5} {'entradas':>9} {'memoria_KB':>11} {'acerto':>7}")
+    for hour in range(1, int(hours) + 1):
+        for _ in range(int(3600 * rate)):
+            clock.now += step
+            if recent and rng.random() < duplicates:
+                message_id = rng.choice(recent)
+            else:
+                seqno += 1
+                message_id = ("127.0.0.1", str(5000 + seqno % 50), f"127.0.0.1:{5000 + seqno % 97}", str(seqno))
+                recent.append(message_id)
+                if len(recent) > 1000:
+                    recent.pop(0)
+            if message_id not in table:
+                table.add(message_id)
+        current, _ = tracemalloc.get_traced_memory()
+        print(f"{hour:>5} {len(table):>9} {current / 1024:>11.0f} {table.hit_rate:>7.1%}")
+    tracemalloc.stop()
+    print(f"tempo real: {time.perf_counter() - started:.1f}s\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--horas", type=float, default=24)
+    parser.add_argument("--taxa", type=float, default=50, help="mensagens SEARCH por segundo")
+    parser.add_argument("--duplicatas", type=float, default=0.3, help="fracao de mensagens repetidas")
+    parser.add_argument("--modo", choices=DEDUP_MODES, nargs="+", default=list(DEDUP_MODES))
+    parser.add_argument("--max-entries", type=int, default=DEDUP_MAX_ENTRIES)
+    parser.add_argument("--max-age", type=float, default=DEDUP_MAX_AGE)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for mode in args.modo:
+        soak(mode, args.horas, args.taxa, args.duplicatas, args.max_entries, args.max_age, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Mede as buscas com vizinhos travados, com e sem o detector de falhas (--heartbeat).
+
+Sobe N nos reais (sockets locais) num grafo aleatorio, cada um com uma chave propria,
+e trava alguns deles: continuam aceitando conexoes, mas descartam tudo o que recebem e
+param de mandar HEARTBEAT, como um processo pendurado. Depois de --espera segundos os
+nos vivos buscam chaves de outros nos vivos; em seguida os travados voltam e as buscas
+incluem as chaves deles, para mostrar a readmissao. Mede sucesso e percentis de latencia.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.falhas --nos 40 --travados 4 --buscas 200 --heartbeat 0 0.2 --modos RW BP
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from node import Node
+from simulador import random_graph
+
+
+def start_nodes(graph, base_port: int, heartbeat: float, transport: str):
+    directory = tempfile.mkdtemp(prefix="falhas_")
+    nodes = []
+    for number, neighbors in graph.items():
+        neighbors_file = os.path.join(directory, f"{number}.txt")
+        key_value_file = os.path.join(directory, f"key_value{number}.txt")
+        with open(neighbors_file, "w") as f:
+            f.write("".join(f"127.0.0.1:{base_port + neighbor}\n" for neighbor in sorted(neighbors)))
+        with open(key_value_file, "w") as f:
+            f.write(f"k{number} v{number}\n")
+        node = Node("127.0.0.1", base_port + number, neighbors_file, key_value_file, transport=transport,
+                    verbose=False, cache_size=0, heartbeat=heartbeat)
+        node.start(interactive=False)
+        nodes.append(node)
+    return nodes
+
+
+def hang(node: Node):
+    # Atributos da instancia escondem os metodos da classe; apaga-los desfaz o travamento
+    node.process_messages = lambda messages, client_socket: None
+    node.send_heartbeats = lambda rounds: None
+
+
+def recover(node: Node):
+    del node.process_messages
+    del node.send_heartbeats
+
+
+def search(nodes, targets, mode: str, count: int, timeout: float, rng: random.Random) -> dict:
+    origins = [node for node in nodes if "process_messages" not in vars(node)]
+    by_origin = {}
+    for _ in range(count):
+        origin = rng.choice(origins)
+        target = rng.choice([target for target in targets if target is not origin])
+        key = next(iter(target.key_value_store))
+        by_origin.setdefault(origin, []).append((mode, key))
+    queries = []
+    for origin, batch in by_origin.items():
+        queries += origin.run_batch(batch, 16, timeout)
+    # Buscas sem resposta entram nos percentis com a latencia do proprio prazo
+    latencies = [query.latency * 1000 for query in queries]
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    answered = sum(query.status == "ok" for query in queries)
+    return {"sucesso": answered / len(queries), "p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nos", type=int, default=30)
+    parser.add_argument("--grau", type=int, default=4)
+    parser.add_argument("--travados", type=int, default=3)
+    parser.add_argument("--buscas", type=int, default=100)
+    parser.add_argument("--modos", nargs="+", choices=("FL", "RW", "BP"), default=["RW", "BP"])
+    parser.add_argument("--heartbeat", type=float, nargs="+", default=[0.0, 0.2], help="segundos (0 desliga)")
+    parser.add_argument("--espera", type=float, default=1.5, help="segundos entre travar (ou soltar) e buscar")
+    parser.add_argument("--timeout", type=float, default=2.0, help="prazo de cada busca, em segundos")
+    parser.add_argument("--transport", choices=("thread", "async"), default="thread")
+    parser.add_argument("--porta", type=int, default=random.randint(20000, 50000), help="porta base")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = random_graph(args.nos, args.grau, random.Random(args.seed))
+    print(f"{'heartbeat':>9} {'fase':>11} {'modo':>4} {'sucesso':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for heartbeat in args.heartbeat:
+        random.seed(args.seed)
+        rng = random.Random(args.seed)
+        with redirect_stdout(io.StringIO()):
+            nodes = start_nodes(graph, args.porta, heartbeat, args.transport)
+        args.porta += args.nos + 10
+        time.sleep(1.0)
+        hung = rng.sample(nodes[1:], args.travados)
+        for node in hung:
+            hang(node)
+        time.sleep(args.espera)
+        alive = [node for node in nodes if node not in hung]
+        for phase, targets in (("travados", alive), ("recuperados", nodes)):
+            if phase == "recuperados":
+                for node in hung:
+                    recover(node)
+                time.sleep(args.espera)
+            for mode in args.modos:
+                with redirect_stdout(io.StringIO()):
+                    result = search(nodes, targets, mode, args.buscas, args.timeout, random.Random(args.seed))
+                print(f"{heartbeat:>9.2f} {phase:>11} {mode:>4} {result['sucesso']:>8.1%} {result['p50']:>9.1f} "
+                      f"{result['p95']:>9.1f} {result['p99']:>9.1f}")
+        with redirect_stdout(io.StringIO()):
+            for node in nodes:
+                node.stop(grace=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Latencia de encaminhamento por salto do flooding, fanout sequencial x concorrente.
+
+Sobe a topologia no mesmo processo, dispara buscas FL por uma chave inexistente
+(a inundacao cobre a rede toda) e mede, para cada copia encaminhada, o tempo entre
+o no comecar a encaminhar e a copia ser escrita no socket do vizinho. Com
+--buraco-negro cada no ganha um vizinho que aceita SYN mas nunca completa a
+conexao, como um par que caiu sem mandar BYE.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.fanout --topologias topologia_grid3x3 topologia_tres_triangulos --buraco-negro
+"""
+import argparse
+import contextlib
+import io
+import random
+import socket
+import statistics
+import time
+
+import node as node_module
+from benchmarks.cluster import start_cluster, stop_cluster
+from node import FANOUT_MODES
+
+
+def black_hole() -> tuple:
+    # Com backlog 0 e uma conexao pendente, os proximos connect ficam sem resposta ate o timeout
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    filler = socket.create_connection(listener.getsockname())
+    return listener, filler
+
+
+def measure(topology: str, fanout: str, base_port: int, searches: int, with_black_hole: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        nodes = start_cluster(topology, base_port, fanout=fanout)
+        holes = []
+        if with_black_hole:
+            listener, filler = black_hole()
+            holes = [listener, filler]
+            addr = "127.0.0.1:%d" % listener.getsockname()[1]
+            for node in nodes:
+                node.neighbors.insert(0, addr)
+        started = time.perf_counter()
+        for _ in range(searches):
+            rng.choice(nodes).start_search("FL", "chave_inexistente")
+        time.sleep(node_module.CONNECT_TIMEOUT * 2 if with_black_hole else 1.0)
+        elapsed = time.perf_counter() - started
+        latencies = [latency for node in nodes for latency in node.connection_manager.forward_latencies]
+        stop_cluster(nodes)
+        for sock in holes:
+            sock.close()
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else [0.0] * 99
+    return {
+        "topologia": topology,
+        "fanout": fanout,
+        "envios": len(latencies),
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "tempo_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologias", nargs="+", default=["topologia_grid3x3", "topologia_tres_triangulos"])
+    parser.add_argument("--buscas", type=int, default=5)
+    parser.add_argument("--buraco-negro", action="store_true", help="adiciona um vizinho que nao responde a cada no")
+    parser.add_argument("--connect-timeout", type=float, default=1.0,
+                        help="substitui CONNECT_TIMEOUT do node.py para o teste terminar mais rapido")
+    parser.add_argument("--porta", type=int, default=7000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    node_module.CONNECT_TIMEOUT = args.connect_timeout
+
+    print(f"{'topologia':>26} {'fanout':>10} {'envios':>6} {'p50_ms':>8} {'p95_ms':>8} {'max_ms':>8}")
+    port = args.porta
+    for topology in args.topologias:
+        for fanout in reversed(FANOUT_MODES):
+            result = measure(topology, fanout, port, args.buscas, args.buraco_negro, args.seed)
+            port += 100
+            print(f"{result['topologia']:>26} {result['fanout']:>10} {result['envios']:>6} "
+                  f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['max_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
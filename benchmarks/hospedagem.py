@@ -0,0 +1,133 @@
+"""Compara subir a rede com um processo node.py por no e com todos os nos em hospedeiro.py.
+
+Gera um grafo aleatorio de N nos num diretorio temporario (arquivos <N>.txt e
+key_value<N>.txt) e mede, para cada forma de subir, o tempo ate todos os nos terem todos
+os vizinhos do arquivo na tabela, o RSS somado e o numero de threads. No hospedeiro
+(async e thread) a checagem e direta; com um processo por no ela e feita com STATS de
+TTL 1 a cada no, a partir de um coletor local. O tempo de encerramento e o de todos os
+BYE enviados e servidores fechados.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.hospedagem --nos 500 --processos 50 --formas async thread processos
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+
+from hospedeiro import resident_memory, start_host, stop_host, wait_neighbors
+from node import Node
+from simulador import random_graph
+
+FORMS = ("async", "thread", "processos")
+
+
+def write_topology(graph, base_port: int) -> str:
+    directory = tempfile.mkdtemp(prefix="hospedagem_")
+    for number, neighbors in graph.items():
+        with open(os.path.join(directory, f"{number}.txt"), "w") as f:
+            f.write("".join(f"127.0.0.1:{base_port + neighbor}\n" for neighbor in sorted(neighbors)))
+        with open(os.path.join(directory, f"key_value{number}.txt"), "w") as f:
+            f.write(f"k{number} v{number}\n")
+    return directory
+
+
+def process_memory(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def process_threads(pid: int) -> int:
+    return len(os.listdir(f"/proc/{pid}/task"))
+
+
+def hosted(directory: str, graph, base_port: int, transport: str) -> dict:
+    memory_before = resident_memory()
+    threads_before = threading.active_count()
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        nodes = start_host(directory, directory, transport=transport, base_port=base_port, verbose=False)
+        linked = wait_neighbors(nodes, 60.0)
+    elapsed = time.perf_counter() - started
+    memory = resident_memory() - memory_before
+    threads = threading.active_count() - threads_before
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        stop_host(nodes)
+    return {"nos": len(nodes), "ligado": linked, "tempo": elapsed, "rss": memory, "threads": threads,
+            "saida": time.perf_counter() - started}
+
+
+def one_process_per_node(directory: str, graph, base_port: int, count: int) -> dict:
+    numbers = sorted(graph)[:count]
+    # So os primeiros nos sobem, entao cada um espera apenas os vizinhos entre eles
+    expected = {f"127.0.0.1:{base_port + number}": len([n for n in graph[number] if n in numbers])
+                for number in numbers}
+    started = time.perf_counter()
+    processes = []
+    for number in numbers:
+        command = [sys.executable, "node.py", f"127.0.0.1:{base_port + number}",
+                   os.path.join(directory, f"{number}.txt"), os.path.join(directory, f"key_value{number}.txt"),
+                   "--transport", "async", "--quiet", "--headless"]
+        processes.append(subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL))
+    with redirect_stdout(io.StringIO()):
+        collector = Node("127.0.0.1", base_port - 1, verbose=False, transport="async")
+        collector.start(interactive=False)
+        linked = False
+        deadline = time.monotonic() + 120.0
+        while not linked and time.monotonic() < deadline:
+            snapshots = collector.collect_stats(1, 0.5, list(expected))
+            linked = all(addr in snapshots and snapshots[addr]["vizinhos"] >= neighbors
+                         for addr, neighbors in expected.items())
+        elapsed = time.perf_counter() - started
+        collector.stop(grace=0)
+    memory = sum(process_memory(process.pid) for process in processes)
+    threads = sum(process_threads(process.pid) for process in processes)
+    # O SIGINT faz cada node.py --headless mandar BYE e sair
+    started = time.perf_counter()
+    for process in processes:
+        process.send_signal(signal.SIGINT)
+    for process in processes:
+        process.wait()
+    return {"nos": len(processes), "ligado": linked, "tempo": elapsed, "rss": memory, "threads": threads,
+            "saida": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nos", type=int, default=500)
+    parser.add_argument("--grau", type=int, default=4)
+    parser.add_argument("--processos", type=int, default=50, help="nos subidos com um processo cada")
+    parser.add_argument("--formas", nargs="+", choices=FORMS, default=list(FORMS))
+    parser.add_argument("--porta", type=int, default=random.randint(20000, 30000), help="porta base")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = random_graph(args.nos, args.grau, random.Random(args.seed))
+    print(f"{'forma':>9} {'nos':>5} {'ligado':>6} {'no ar (s)':>9} {'RSS (MB)':>9} {'RSS/no (MB)':>11} "
+          f"{'threads':>7} {'saida (s)':>9}")
+    for form in args.formas:
+        directory = write_topology(graph, args.porta)
+        if form == "processos":
+            result = one_process_per_node(directory, graph, args.porta, args.processos)
+        else:
+            # Cada hospedeiro roda num processo novo, para que o RSS de um nao entre na conta do outro
+            with multiprocessing.get_context("fork").Pool(1) as pool:
+                result = pool.apply(hosted, (directory, graph, args.porta, form))
+        print(f"{form:>9} {result['nos']:>5} {'sim' if result['ligado'] else 'nao':>6} {result['tempo']:>9.2f} "
+              f"{result['rss'] / 2 ** 20:>9.1f} {result['rss'] / 2 ** 20 / result['nos']:>11.2f} "
+              f"{result['threads']:>7} {result['saida']:>9.2f}")
+        args.porta += args.nos + 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compara buscas de uma chave por SEARCH com buscas de varias chaves num SEARCH so.
+
+Monta um grafo no simulador e, para cada modo (FL, RW, BP) e numero de chaves por
+SEARCH, faz as mesmas consultas: cada rodada sorteia uma origem e K chaves que ela nao
+tem e as busca uma a uma (K = 1) ou juntas com start_multi_search. Mede a fracao de
+chaves respondidas, mensagens por chave (SEARCH, VAL e VALS), bytes de SEARCH por chave
+e latencia virtual ate a resposta de cada chave.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.multichave --nos 1000 --chaves 1 8 32 --rodadas 50 --modos RW BP
+"""
+import argparse
+import random
+import statistics
+
+from node import MULTI_KEY_MODES
+from simulador import SimulatedNetwork, add_graph_arguments, build_network_from_args, forget_searches
+
+
+def multi_key_rounds(network: SimulatedNetwork, nodes, mode: str, keys_per_search: int, rounds: int, ttl: int,
+                     rng: random.Random) -> dict:
+    keys = sorted({key for node in nodes for key in node.key_value_store})
+    queries = []
+    sent = 0
+    search_bytes = 0
+    for _ in range(rounds):
+        origin = rng.choice(nodes)
+        wanted = [key for key in rng.sample(keys, keys_per_search * 2) if key not in origin.key_value_store]
+        wanted = wanted[:keys_per_search]
+        origin.ttl_default = ttl
+        before = sum(network.messages.values())
+        bytes_before = network.bytes[b"SEARCH"]
+        if keys_per_search == 1:
+            started = [origin.start_search(mode, key, 60.0) for key in wanted]
+        else:
+            started = origin.start_multi_search(mode, wanted, 60.0)
+        network.run()
+        origin.expire_queries()
+        sent += sum(network.messages.values()) - before
+        search_bytes += network.bytes[b"SEARCH"] - bytes_before
+        queries += started
+        for node in nodes:
+            forget_searches(node, {})
+    answered = [query for query in queries if query.status == "ok"]
+    return {
+        "sucesso": len(answered) / len(queries) if queries else 0.0,
+        "mensagens": sent / len(queries) if queries else 0.0,
+        "bytes": search_bytes / len(queries) if queries else 0.0,
+        "latencia": statistics.median(query.latency for query in answered) if answered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_graph_arguments(parser, nodes=500, replicas=10)
+    parser.add_argument("--chaves", type=int, nargs="+", default=[1, 8, 32], help="chaves por SEARCH")
+    parser.add_argument("--rodadas", type=int, default=20)
+    parser.add_argument("--modos", nargs="+", choices=MULTI_KEY_MODES, default=list(MULTI_KEY_MODES))
+    parser.add_argument("--ttl", type=int, default=100)
+    args = parser.parse_args()
+
+    network, nodes, _ = build_network_from_args(args, cache_size=0)
+
+    print(f"{'modo':>4} {'chaves':>6} {'sucesso':>8} {'msgs/chave':>11} {'bytes SEARCH/chave':>19} {'lat. med (ms)':>14}")
+    for mode in args.modos:
+        for keys_per_search in args.chaves:
+            # Cada linha recomeca da mesma seed, entao sorteia as mesmas origens
+            result = multi_key_rounds(network, nodes, mode, keys_per_search, args.rodadas, args.ttl,
+                                      random.Random(args.seed))
+            print(f"{mode:>4} {keys_per_search:>6} {result['sucesso']:>8.1%} {result['mensagens']:>11.1f} "
+                  f"{result['bytes']:>19.0f} {result['latencia'] * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
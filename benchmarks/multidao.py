@@ -0,0 +1,78 @@
+"""Mede o coalescimento de buscas iguais sob uma multidao de clientes (flash crowd).
+
+Monta um grafo no simulador e dispara, numa janela curta de tempo virtual, muitas
+buscas pelas mesmas poucas chaves a partir de origens diferentes, com e sem --coalesce
+nos nos. Mede taxa de sucesso, mensagens por busca, latencia virtual e a fracao das
+buscas que chegaram a um no intermediario e ficaram presas a outra ja repassada.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.multidao --nos 2000 --buscas 500 --janela 50 --modos FL ER
+"""
+import argparse
+import random
+import statistics
+
+from node import COALESCE_MODES, CoalescingTable
+from simulador import SimulatedNetwork, add_graph_arguments, build_network_from_args, forget_searches
+
+
+def flash_crowd(network: SimulatedNetwork, nodes, mode: str, keys, count: int, window: float, ttl: int,
+                rng: random.Random, coalesce: bool) -> dict:
+    for node in nodes:
+        forget_searches(node, {})
+        node.coalescing = CoalescingTable(clock=node.clock) if coalesce else None
+        node.ttl_default = ttl
+    queries = []
+
+    def start(origin, key):
+        queries.append(origin.start_search(mode, key, 60.0))
+
+    for _ in range(count):
+        origin = rng.choice(nodes)
+        key = rng.choice(keys)
+        if key not in origin.key_value_store:
+            network.schedule(rng.uniform(0, window), lambda origin=origin, key=key: start(origin, key))
+    before = sum(network.messages.values())
+    network.run()
+    sent = sum(network.messages.values()) - before
+    for node in nodes:
+        node.expire_queries()
+    answered = [query for query in queries if query.status == "ok"]
+    coalesced = forwarded = 0
+    if coalesce:
+        coalesced = sum(node.coalescing.coalesced for node in nodes)
+        forwarded = sum(node.coalescing.forwarded for node in nodes)
+    return {
+        "sucesso": len(answered) / len(queries) if queries else 0.0,
+        "mensagens": sent / len(queries) if queries else 0.0,
+        "latencia": statistics.median(query.latency for query in answered) if answered else 0.0,
+        "coalescencia": coalesced / (coalesced + forwarded) if coalesced + forwarded else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_graph_arguments(parser)
+    parser.add_argument("--quentes", type=int, default=1, help="numero de chaves buscadas pela multidao")
+    parser.add_argument("--buscas", type=int, default=300)
+    parser.add_argument("--janela", type=float, default=50.0, help="ms em que as buscas comecam")
+    parser.add_argument("--modos", nargs="+", choices=COALESCE_MODES, default=list(COALESCE_MODES))
+    parser.add_argument("--ttl", type=int, default=100)
+    args = parser.parse_args()
+
+    network, nodes, _ = build_network_from_args(args, cache_size=0)
+    keys = sorted({key for node in nodes for key in node.key_value_store})
+    hot_keys = random.Random(args.seed).sample(keys, args.quentes)
+
+    print(f"{'modo':>4} {'coalesce':>8} {'sucesso':>8} {'msgs/busca':>11} {'lat. med (ms)':>14} {'coalescidas':>12}")
+    for mode in args.modos:
+        for coalesce in (False, True):
+            # As duas rodadas de cada modo fazem as mesmas buscas nos mesmos instantes
+            result = flash_crowd(network, nodes, mode, hot_keys, args.buscas, args.janela / 1000, args.ttl,
+                                 random.Random(args.seed), coalesce)
+            print(f"{mode:>4} {'sim' if coalesce else 'nao':>8} {result['sucesso']:>8.1%} {result['mensagens']:>11.1f} "
+                  f"{result['latencia'] * 1000:>14.2f} {result['coalescencia']:>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
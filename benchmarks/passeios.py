@@ -0,0 +1,46 @@
+"""Compara flooding, random walk e k random walks (KW) no simulador.
+
+Monta um grafo no simulador de eventos discretos (mesma logica de busca do node.py,
+relogio virtual) e roda o mesmo conjunto de buscas em FL, RW e KW com varios valores
+de k e do intervalo de consulta a origem. Mede taxa de sucesso, mensagens por busca
+(SEARCH, VAL, CHECK e CONTINUE) e latencia virtual ate a primeira resposta.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.passeios --nos 5000 --walkers 2 4 8 --checkback 2 4 8
+"""
+import argparse
+import random
+
+from simulador import add_graph_arguments, build_network_from_args, run_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_graph_arguments(parser, replicas=10)
+    parser.add_argument("--buscas", type=int, default=200)
+    parser.add_argument("--ttl", type=int, default=100)
+    parser.add_argument("--walkers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--checkback", type=int, nargs="+", default=[4])
+    args = parser.parse_args()
+
+    node_options = {"cache_size": 0}
+    network, nodes, _ = build_network_from_args(args, **node_options)
+
+    runs = [("FL", None, None), ("RW", None, None)]
+    runs += [("KW", walkers, checkback) for walkers in args.walkers for checkback in args.checkback]
+    print(f"{'modo':>4} {'k':>3} {'checkback':>9} {'sucesso':>8} {'msgs/busca':>11} {'saltos':>7} "
+          f"{'lat. med (ms)':>14} {'lat. p95 (ms)':>14}")
+    for mode, walkers, checkback in runs:
+        for node in nodes:
+            node.walkers = walkers or 1
+            node.checkback = checkback or 0
+        # Cada modo recomeca da mesma seed, entao todos fazem as mesmas buscas
+        result = run_queries(network, nodes, mode, args.ttl, args.buscas, random.Random(args.seed), 60.0,
+                             node_options)
+        print(f"{mode:>4} {walkers or '-':>3} {checkback or '-':>9} {result['sucesso']:>8.1%} "
+              f"{result['mensagens']:>11.1f} {result['saltos']:>7.2f} {result['latencia'] * 1000:>14.2f} "
+              f"{result['latencia_p95'] * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark da codificacao de SEARCH e VAL em texto e no protocolo binario.
+
+Mede, por mensagem, o custo de codificar, de separar e decodificar do stream
+(MessageFramer + parse de process_message, ou decode_binary) e de encaminhar: em texto
+a linha e refeita; em binario o frame recebido e copiado com TTL, ultimo salto e
+saltos trocados no lugar. Tambem mostra o tamanho de cada mensagem.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.protocolo --chave 8 64 --valor 16 256 --mensagens 200000
+"""
+import argparse
+import timeit
+
+from node import MessageFramer, WireMessage, decode_binary
+
+ORIGIN = "127.0.0.1:5001"
+LAST_HOP = "127.0.0.1:5002"
+
+
+def parse_text(framer: MessageFramer, data: bytes):
+    for message in framer.feed(data):
+        parts = message.split()
+        origin, seqno, ttl, operation = parts[:4]
+        int(ttl)
+        if operation == "SEARCH":
+            mode, last_hop_ip, last_hop_port, key, hop_count = parts[4:9]
+        else:
+            mode, key, value, hop_count = parts[4:8]
+        int(hop_count)
+
+
+def parse_binary(framer: MessageFramer, data: bytes):
+    for frame in framer.feed(data):
+        decode_binary(frame)
+
+
+def measure(operation: str, key: str, extra: str, count: int) -> dict:
+    def message(frame=None):
+        return WireMessage(ORIGIN, "123456", 50, operation, "FL", LAST_HOP, 7, key, extra, frame)
+
+    text = message().text()
+    binary = bytes(message().binary())
+    received = bytearray(binary)
+    framer = MessageFramer()
+    # O timeit devolve o total; dividido por count da o custo de uma mensagem, em microssegundos
+    per_message = {
+        "cod_texto": timeit.timeit(lambda: message().text(), number=count),
+        "cod_binario": timeit.timeit(lambda: message().binary(), number=count),
+        "dec_texto": timeit.timeit(lambda: parse_text(framer, text), number=count),
+        "dec_binario": timeit.timeit(lambda: parse_binary(framer, binary), number=count),
+        "enc_texto": timeit.timeit(lambda: message().text(), number=count),
+        "enc_binario": timeit.timeit(lambda: message(received).binary(), number=count),
+    }
+    result = {name: seconds / count * 1e6 for name, seconds in per_message.items()}
+    result["bytes_texto"] = len(text)
+    result["bytes_binario"] = len(binary)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chave", type=int, nargs="+", default=[8, 64], help="tamanhos de chave, em bytes")
+    parser.add_argument("--valor", type=int, nargs="+", default=[16], help="tamanhos de valor do VAL, em bytes")
+    parser.add_argument("--mensagens", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'op':>6} {'chave':>5} {'valor':>5} {'bytes txt/bin':>13} {'codifica txt/bin (us)':>22} "
+          f"{'decodifica txt/bin (us)':>24} {'encaminha txt/bin (us)':>23}")
+    for key_size in args.chave:
+        key = "k" * key_size
+        runs = [("SEARCH", 0, "")] + [("VAL", value_size, "v" * value_size) for value_size in args.valor]
+        for operation, value_size, extra in runs:
+            r = measure(operation, key, extra, args.mensagens)
+            forward = f"{r['enc_texto']:.2f}/{r['enc_binario']:.2f}" if operation == "SEARCH" else "-"
+            print(f"{operation:>6} {key_size:>5} {value_size or '-':>5} "
+                  f"{str(r['bytes_texto']) + '/' + str(r['bytes_binario']):>13} "
+                  f"{r['cod_texto']:>10.2f}/{r['cod_binario']:<11.2f} {r['dec_texto']:>11.2f}/{r['dec_binario']:<12.2f} "
+                  f"{forward:>23}")
+
+
+if __name__ == "__main__":
+    main()
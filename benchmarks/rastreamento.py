@@ -0,0 +1,95 @@
+"""Mede o custo do rastreamento por salto (--trace) e se rastros.py acha os nos lentos.
+
+Sobe N nos reais com hospedeiro.py (transporte thread, para que um no lento nao segure os
+outros) num grafo aleatorio e deixa alguns nos lentos: cada consulta a tabela local
+demora --atraso ms a mais. Faz as mesmas buscas com e sem rastro e mostra sucesso,
+latencia, bytes enviados por busca e quantos dos nos lentos rastros.py poe entre os
+primeiros da lista de nos mais lentos.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.rastreamento --nos 100 --lentos 3 --atraso 5 --buscas 200 --modos RW BP
+"""
+import argparse
+import io
+import random
+import statistics
+import time
+from contextlib import redirect_stdout
+
+from benchmarks.hospedagem import write_topology
+from hospedeiro import start_host, stop_host, wait_neighbors
+from rastros import merge_traces
+from simulador import random_graph
+
+
+def slow_down(node, delay: float):
+    # Atributo da instancia esconde o metodo da classe: o atraso entra no processamento da busca
+    lookup_key = node.lookup_key
+
+    def slowed(key):
+        time.sleep(delay)
+        return lookup_key(key)
+
+    node.lookup_key = slowed
+
+
+def sent_bytes(nodes) -> int:
+    return sum(stats["bytes"] for node in nodes for stats in node.connection_manager.backpressure_stats().values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nos", type=int, default=60)
+    parser.add_argument("--grau", type=int, default=4)
+    parser.add_argument("--lentos", type=int, default=3)
+    parser.add_argument("--atraso", type=float, default=5.0, help="ms a mais por consulta nos nos lentos")
+    parser.add_argument("--buscas", type=int, default=100)
+    parser.add_argument("--modos", nargs="+", choices=("FL", "RW", "BP"), default=["RW", "BP"])
+    parser.add_argument("--timeout", type=float, default=3.0, help="prazo de cada busca, em segundos")
+    parser.add_argument("--porta", type=int, default=random.randint(20000, 30000), help="porta base")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = random_graph(args.nos, args.grau, random.Random(args.seed))
+    print(f"{'modo':>4} {'rastro':>6} {'sucesso':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'bytes/busca':>11} "
+          f"{'lentos no topo':>14}")
+    for mode in args.modos:
+        for trace in (False, True):
+            random.seed(args.seed)
+            rng = random.Random(args.seed)
+            directory = write_topology(graph, args.porta)
+            with redirect_stdout(io.StringIO()):
+                nodes = start_host(directory, directory, transport="thread", base_port=args.porta, verbose=False,
+                                   cache_size=0, trace=trace)
+                wait_neighbors(nodes, 30.0)
+            args.porta += args.nos + 10
+            slow = rng.sample(nodes, args.lentos)
+            for node in slow:
+                slow_down(node, args.atraso / 1000)
+            by_origin = {}
+            for _ in range(args.buscas):
+                origin = rng.choice(nodes)
+                target = rng.choice([node for node in nodes if node is not origin])
+                by_origin.setdefault(origin, []).append((mode, next(iter(target.key_value_store))))
+            before = sent_bytes(nodes)
+            queries = []
+            with redirect_stdout(io.StringIO()):
+                for origin, batch in by_origin.items():
+                    queries += origin.run_batch(batch, 8, args.timeout)
+            sent = sent_bytes(nodes) - before
+            answered = [query.latency * 1000 for query in queries if query.status == "ok"]
+            cuts = statistics.quantiles(answered, n=100, method="inclusive") if len(answered) > 1 else [0.0] * 99
+            found = "-"
+            if trace:
+                merged = merge_traces([query.trace for query in queries if query.trace is not None])
+                ranking = sorted(merged["nos"], key=lambda node: merged["nos"][node]["processamento"]["p95"],
+                                 reverse=True)
+                found = f"{len({f'{node.ip}:{node.port}' for node in slow} & set(ranking[:args.lentos]))}/{args.lentos}"
+            print(f"{mode:>4} {'sim' if trace else 'nao':>6} {len(answered) / len(queries):>8.1%} {cuts[49]:>9.1f} "
+                  f"{cuts[94]:>9.1f} {sent / len(queries):>11.0f} {found:>14}")
+            with redirect_stdout(io.StringIO()):
+                stop_host(nodes)
+
+
+if __name__ == "__main__":
+    main()
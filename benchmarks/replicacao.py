@@ -0,0 +1,51 @@
+"""Mede a replicacao de caminho (--replication) sob uma carga de buscas com popularidade Zipf.
+
+Monta um grafo no simulador e roda, para cada modo (FL, RW, BP) e politica (off, path,
+sample), as mesmas buscas com chaves sorteadas por uma distribuicao Zipf. Quem responde
+copia o par para os nos do caminho, entao as chaves populares ficam mais perto das
+origens a medida que as buscas avancam: a tabela compara a media de saltos da primeira e
+da segunda metade das buscas, alem de sucesso, mensagens por busca (REPLICA incluida) e
+o total de replicas guardadas.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.replicacao --nos 1000 --buscas 400 --zipf 0.8 1.2 --modos RW BP
+"""
+import argparse
+import random
+
+from node import REPLICATION_POLICIES
+from simulador import add_graph_arguments, build_network_from_args, forget_replicas, run_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_graph_arguments(parser, nodes=500, replicas=5)
+    parser.add_argument("--buscas", type=int, default=300)
+    parser.add_argument("--zipf", type=float, nargs="+", default=[1.0], help="expoentes da popularidade das chaves")
+    parser.add_argument("--modos", nargs="+", choices=("FL", "RW", "BP"), default=["FL", "RW", "BP"])
+    parser.add_argument("--politicas", nargs="+", choices=REPLICATION_POLICIES, default=list(REPLICATION_POLICIES))
+    parser.add_argument("--ttl", type=int, default=100)
+    args = parser.parse_args()
+
+    node_options = {"cache_size": 0}
+    network, nodes, _ = build_network_from_args(args, replication="path", **node_options)
+
+    print(f"{'zipf':>5} {'modo':>4} {'politica':>8} {'sucesso':>8} {'msgs/busca':>11} {'saltos':>7} "
+          f"{'1a metade':>10} {'2a metade':>10} {'replicas':>9}")
+    for zipf in args.zipf:
+        for mode in args.modos:
+            for policy in args.politicas:
+                # Todas as politicas de um modo fazem as mesmas buscas, a partir de depositos vazios
+                forget_replicas(nodes)
+                for node in nodes:
+                    node.replication = policy
+                result = run_queries(network, nodes, mode, args.ttl, args.buscas, random.Random(args.seed), 60.0,
+                                     node_options, zipf)
+                stored = sum(len(node.replica_store) for node in nodes)
+                print(f"{zipf:>5.2f} {mode:>4} {policy:>8} {result['sucesso']:>8.1%} {result['mensagens']:>11.1f} "
+                      f"{result['saltos']:>7.2f} {result['saltos_inicio']:>10.2f} {result['saltos_fim']:>10.2f} "
+                      f"{stored:>9}")
+
+
+if __name__ == "__main__":
+    main()
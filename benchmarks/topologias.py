@@ -0,0 +1,270 @@
+"""Suite reprodutivel: um cluster real de node.py por topologia, em 127.0.0.1.
+
+Para cada diretorio topologia_* e cada modo (FL, RW, BP, BG, ER e KW) sobe um processo
+`node.py --headless --quiet` por no, com as chaves de key_values/ e o cache de
+resultados desligado, e dispara um conjunto fixo de buscas sorteado a partir de
+--seed (origem e chave, sempre uma chave de outro no). Cada no de origem roda as
+suas buscas com --queries; os demais so encaminham.
+
+Ao final de cada rodada sao lidos, por no, o tempo de CPU e a memoria residente
+(/proc, Linux) e o total de mensagens recebidas (estatisticas impressas na saida).
+O resultado vai para um arquivo JSON que pode ser comparado com o de outro commit.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.topologias --buscas 40 --saida resultados.json
+    python -m benchmarks.topologias --saida novo.json --comparar resultados.json
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.buscas_concorrentes import key_value_files
+from benchmarks.cluster import remap_topology, topology_files
+from node import SEARCH_MODES
+
+TOPOLOGIES = ("topologia_linha", "topologia_ciclo_3", "topologia_grid3x3", "topologia_arvore_binaria",
+              "topologia_tres_triangulos")
+MODES = SEARCH_MODES
+SUMMARY_DEPTH = 3
+SUMMARY_INTERVAL = 0.5
+RESULT_LINE = re.compile(rf"^({'|'.join(SEARCH_MODES)}) (\S+) (\S+) (\S+) ms (\S+) saltos$")
+RECEIVED_LINE = re.compile(r"Total de mensagens recebidas: (\d+)")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class NodeProcess:
+    """Um node.py filho, com a saida lida numa thread para o pipe nunca encher."""
+
+    def __init__(self, number: int, command: List[str]):
+        self.number = number
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.lines: List[str] = []
+        self.finished_batch = threading.Event()
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        for line in self.process.stdout:
+            self.lines.append(line.rstrip("\n"))
+            if line.startswith("Consultas:"):
+                self.finished_batch.set()
+
+    def usage(self) -> Dict[str, Optional[float]]:
+        usage: Dict[str, Optional[float]] = {"cpu_s": None, "rss_kb": None, "rss_pico_kb": None}
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                # O nome do executavel pode ter espacos; os campos contam a partir do ')'
+                fields = f.read().rsplit(")", 1)[1].split()
+            usage["cpu_s"] = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        usage["rss_kb"] = int(line.split()[1])
+                    elif line.startswith("VmHWM:"):
+                        usage["rss_pico_kb"] = int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return usage
+
+    def interrupt(self):
+        self.process.send_signal(signal.SIGINT)
+
+    def wait(self, timeout: float = 15.0):
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def received(self) -> Optional[int]:
+        for line in self.lines:
+            match = RECEIVED_LINE.search(line)
+            if match:
+                return int(match.group(1))
+        return None
+
+
+def query_set(topology: str, mode: str, searches: int, seed: int) -> Dict[int, List[str]]:
+    """Sorteia (origem, chave) de forma deterministica a partir da seed, da topologia e do modo."""
+    rng = random.Random(f"{seed}-{os.path.basename(topology)}-{mode}")
+    stores = {}
+    for number, path in key_value_files(topology).items():
+        with open(path) as f:
+            stores[number] = {line.split()[0] for line in f if line.strip()}
+    numbers = list(topology_files(topology))
+    all_keys = sorted({key for keys in stores.values() for key in keys}, key=str)
+    queries: Dict[int, List[str]] = {}
+    for _ in range(searches):
+        origin = rng.choice(numbers)
+        remote_keys = [key for key in all_keys if key not in stores.get(origin, ())]
+        if remote_keys:
+            queries.setdefault(origin, []).append(f"{mode} {rng.choice(remote_keys)}")
+    return queries
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if len(values) < 2:
+        value = values[0] if values else None
+        return {"p50": value, "p95": value, "p99": value, "max": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(values)}
+
+
+def run(topology: str, mode: str, searches: int, base_port: int, seed: int, in_flight: int,
+        query_timeout: float, wait: float) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="suite_")
+    neighbors_files = remap_topology(topology, base_port, work_dir)
+    key_values = key_value_files(topology)
+    queries = query_set(topology, mode, searches, seed)
+    # Os nos que so encaminham sobem primeiro; o warmup cobre a subida dos que buscam
+    order = sorted(neighbors_files, key=lambda number: number in queries)
+    warmup = 1.0 + 0.2 * len(queries)
+    if mode == "BG":
+        # A busca guiada precisa dos resumos ja propagados ate a profundidade escolhida
+        warmup += SUMMARY_DEPTH * SUMMARY_INTERVAL
+    processes = []
+    for number in order:
+        command = [sys.executable, "-u", "node.py", f"127.0.0.1:{base_port + number}", neighbors_files[number]]
+        if number in key_values:
+            command.append(key_values[number])
+        command += ["--headless", "--quiet", "--cache-size", "0"]
+        if mode == "BG":
+            command += ["--summary-depth", str(SUMMARY_DEPTH), "--summary-interval", str(SUMMARY_INTERVAL)]
+        if number in queries:
+            queries_file = os.path.join(work_dir, f"consultas{number}.txt")
+            with open(queries_file, "w") as f:
+                f.write("\n".join(queries[number]) + "\n")
+            command += ["--queries", queries_file, "--in-flight", str(in_flight),
+                        "--query-timeout", str(query_timeout), "--warmup", str(warmup)]
+        processes.append(NodeProcess(number, command))
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + wait
+    for process in processes:
+        if process.number in queries:
+            process.finished_batch.wait(max(0.0, deadline - time.monotonic()))
+    elapsed = time.perf_counter() - started
+    usage = {process.number: process.usage() for process in processes}
+    # Todos saem ao mesmo tempo: cada no ainda espera o BYE e o prazo de envio antes de terminar
+    for process in processes:
+        process.interrupt()
+    for process in processes:
+        process.wait()
+
+    latencies: List[float] = []
+    hops: List[int] = []
+    issued = sum(len(lines) for lines in queries.values())
+    answered = 0
+    nodes = {}
+    for process in processes:
+        for line in process.lines:
+            match = RESULT_LINE.match(line)
+            if match and match.group(3) != "timeout":
+                answered += 1
+                latencies.append(float(match.group(4)))
+                hops.append(int(match.group(5)))
+        nodes[str(process.number)] = dict(usage[process.number], mensagens=process.received())
+    messages = sum(node["mensagens"] or 0 for node in nodes.values())
+    return {
+        "topologia": os.path.basename(topology),
+        "modo": mode,
+        "nos": len(processes),
+        "buscas": issued,
+        "respondidas": answered,
+        "sucesso": answered / issued if issued else 0.0,
+        "mensagens": messages,
+        "mensagens_por_busca": messages / issued if issued else 0.0,
+        "saltos_media": statistics.mean(hops) if hops else None,
+        "latencia_ms": percentiles(latencies),
+        "tempo_s": elapsed,
+        "nos_detalhe": nodes,
+    }
+
+
+def git_revision() -> Dict[str, Optional[str]]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "alterado": None}
+    return {"commit": commit, "alterado": dirty}
+
+
+def format_ms(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_table(results: List[dict]):
+    print(f"{'topologia':<26} {'modo':>4} {'buscas':>6} {'sucesso':>8} {'msgs':>6} {'saltos':>6} "
+          f"{'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'cpu_s':>6} {'rss_max_kb':>10}")
+    for result in results:
+        cpu = sum(node["cpu_s"] or 0.0 for node in result["nos_detalhe"].values())
+        rss = max((node["rss_pico_kb"] or 0 for node in result["nos_detalhe"].values()), default=0)
+        latency = result["latencia_ms"]
+        hops = f"{result['saltos_media']:.2f}" if result["saltos_media"] is not None else "-"
+        print(f"{result['topologia']:<26} {result['modo']:>4} {result['buscas']:>6} {result['sucesso']:>8.1%} "
+              f"{result['mensagens']:>6} {hops:>6} {format_ms(latency['p50']):>8} {format_ms(latency['p95']):>8} "
+              f"{format_ms(latency['p99']):>8} {cpu:>6.2f} {rss:>10}")
+
+
+def print_comparison(previous: dict, results: List[dict]):
+    before = {(result["topologia"], result["modo"]): result for result in previous["resultados"]}
+    print(f"\nComparacao com {previous.get('commit') or 'arquivo anterior'} (antes -> agora):")
+    for result in results:
+        old = before.get((result["topologia"], result["modo"]))
+        if old is None:
+            continue
+        print(f"{result['topologia']:<26} {result['modo']:>4} "
+              f"sucesso {old['sucesso']:.1%} -> {result['sucesso']:.1%}, "
+              f"msgs {old['mensagens']} -> {result['mensagens']}, "
+              f"p50 {format_ms(old['latencia_ms']['p50'])} -> {format_ms(result['latencia_ms']['p50'])} ms, "
+              f"p95 {format_ms(old['latencia_ms']['p95'])} -> {format_ms(result['latencia_ms']['p95'])} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologias", nargs="+", default=list(TOPOLOGIES))
+    parser.add_argument("--modos", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--buscas", type=int, default=40, help="buscas por topologia e modo")
+    parser.add_argument("--in-flight", type=int, default=4, help="buscas simultaneas por no de origem")
+    parser.add_argument("--query-timeout", type=float, default=5.0, help="segundos")
+    parser.add_argument("--espera", type=float, default=60.0, help="limite em segundos para cada rodada")
+    parser.add_argument("--porta", type=int, default=11000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--saida", default="resultados.json", help="arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execucao anterior para comparar")
+    args = parser.parse_args()
+
+    results = []
+    for offset, (topology, mode) in enumerate((t, m) for t in args.topologias for m in args.modos):
+        # Cada rodada usa portas novas para nao esbarrar nas que ficaram em TIME_WAIT
+        results.append(run(topology, mode, args.buscas, args.porta + 100 * offset, args.seed, args.in_flight,
+                           args.query_timeout, args.espera))
+        print(f"{topology} {mode}: {results[-1]['respondidas']}/{results[-1]['buscas']} respondidas "
+              f"em {results[-1]['tempo_s']:.1f} s", flush=True)
+    report = dict(git_revision(), data=datetime.datetime.now().isoformat(timespec="seconds"),
+                  python=sys.version.split()[0], seed=args.seed, buscas=args.buscas, in_flight=args.in_flight,
+                  resultados=results)
+    with open(args.saida, "w") as f:
+        json.dump(report, f, indent=2)
+    print_table(results)
+    print(f"Resultados gravados em {args.saida}")
+    if args.comparar:
+        with open(args.comparar) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
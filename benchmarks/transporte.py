@@ -0,0 +1,125 @@
+"""Compara o transporte thread-por-conexao com o transporte asyncio do node.py.
+
+Para cada modo sobe um no em um processo separado, abre N conexoes de clientes e
+envia mensagens VAL em rodadas. Em cada rodada cada conexao escreve uma rajada de
+mensagens num unico sendall, o que exercita o enquadramento por linha. Mede a vazao
+em mensagens por segundo, o RSS gasto por conexao e o numero de threads do no.
+
+Uso (na raiz do repositorio):
+    python -m benchmarks.transporte --conexoes 10 100 300 --rodadas 50 --rajada 1 20
+"""
+import argparse
+import multiprocessing
+import socket
+import time
+
+from node import Node
+
+COUNTER = "Total de mensagens de flooding vistas"
+# So os transportes com sockets de verdade: "memory" nao abre porta para os clientes
+SOCKET_TRANSPORTS = ("thread", "async")
+# Prazo para o no responder pelo pipe; a espera do no por rodada e de 10 s
+PIPE_TIMEOUT = 30.0
+
+
+def read_proc_status(pid: int) -> dict:
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            status[name] = value.strip()
+    return status
+
+
+def rss_kb(pid: int) -> int:
+    return int(read_proc_status(pid)["VmRSS"].split()[0])
+
+
+def threads(pid: int) -> int:
+    return int(read_proc_status(pid)["Threads"])
+
+
+def serve(transport: str, port: int, conn):
+    node = Node("127.0.0.1", port, transport=transport, verbose=False)
+    node.start(interactive=False)
+    conn.send("pronto")
+    while True:
+        target = conn.recv()
+        if target is None:
+            break
+        deadline = time.monotonic() + 10
+        while node.stats[COUNTER] < target and time.monotonic() < deadline:
+            time.sleep(0.0002)
+        conn.send(node.stats[COUNTER])
+    node.stop(grace=0)
+
+
+def receive(conn, proc):
+    # Se o no morrer (ou travar) o recv bloquearia para sempre
+    if not conn.poll(PIPE_TIMEOUT):
+        proc.terminate()
+        raise RuntimeError(f"no do benchmark nao respondeu em {PIPE_TIMEOUT:.0f} s (codigo de saida {proc.exitcode})")
+    return conn.recv()
+
+
+def run(transport: str, port: int, connections: int, rounds: int, burst: int) -> dict:
+    parent_conn, child_conn = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=serve, args=(transport, port, child_conn), daemon=True)
+    proc.start()
+    receive(parent_conn, proc)
+    rss_before = rss_kb(proc.pid)
+
+    sockets = [socket.create_connection(("127.0.0.1", port)) for _ in range(connections)]
+    time.sleep(0.5)
+    rss_after = rss_kb(proc.pid)
+    thread_count = threads(proc.pid)
+
+    start = time.perf_counter()
+    processed = 0
+    for r in range(rounds):
+        for i, sock in enumerate(sockets):
+            sock.sendall(f"127.0.0.1:{10000 + i} {r} 1 VAL FL chave valor 1\n".encode() * burst)
+        parent_conn.send((r + 1) * connections * burst)
+        processed = receive(parent_conn, proc)
+    elapsed = time.perf_counter() - start
+
+    for sock in sockets:
+        sock.close()
+    parent_conn.send(None)
+    proc.join(timeout=10)
+
+    sent = rounds * connections * burst
+    return {
+        "transporte": transport,
+        "conexoes": connections,
+        "rajada": burst,
+        "enviadas": sent,
+        "processadas": processed,
+        "msgs_por_s": processed / elapsed if elapsed else 0.0,
+        "kb_por_conexao": (rss_after - rss_before) / connections,
+        "threads": thread_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conexoes", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--rodadas", type=int, default=50)
+    parser.add_argument("--rajada", type=int, nargs="+", default=[1, 20],
+                        help="mensagens escritas de uma vez por conexao em cada rodada")
+    parser.add_argument("--porta", type=int, default=6100)
+    args = parser.parse_args()
+
+    print(f"{'transporte':>10} {'conexoes':>8} {'rajada':>6} {'enviadas':>8} {'processadas':>11} {'msgs/s':>10} {'KB/conexao':>10} {'threads':>7}")
+    port = args.porta
+    for connections in args.conexoes:
+        for burst in args.rajada:
+            for transport in SOCKET_TRANSPORTS:
+                result = run(transport, port, connections, args.rodadas, burst)
+                port += 1
+                print(f"{result['transporte']:>10} {result['conexoes']:>8} {result['rajada']:>6} {result['enviadas']:>8} {result['processadas']:>11} "
+                      f"{result['msgs_por_s']:>10.0f} {result['kb_por_conexao']:>10.1f} {result['threads']:>7}")
+
+
+if __name__ == "__main__":
+    main()
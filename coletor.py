@@ -0,0 +1,38 @@
+"""Coleta as metricas de toda a rede sobreposta por mensagens STATS.
+
+Sobe um no sem chaves no endereco dado e manda STATS a um ou mais nos de entrada, sem
+HELLO e sem entrar na rede. O STATS inunda a rede ate o TTL e cada no responde direto
+ao coletor com um STATS_OK: mensagens por operacao, descartes, bytes, histogramas de
+processamento e de buscas, filas e conexoes. Com --json imprime as respostas cruas.
+
+Uso:
+    python coletor.py 127.0.0.1:6000 --entrada 127.0.0.1:5001
+    python coletor.py 127.0.0.1:6000 --entrada 127.0.0.1:5001 127.0.0.1:5005 --ttl 8 --espera 3 --json
+"""
+import argparse
+import json
+
+from node import STATS_TTL, STATS_WAIT, Node
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("endereco", help="endereco:porta em que o coletor recebe os STATS_OK")
+    parser.add_argument("--entrada", nargs="+", required=True, help="nos da rede que recebem o STATS")
+    parser.add_argument("--ttl", type=int, default=STATS_TTL)
+    parser.add_argument("--espera", type=float, default=STATS_WAIT, help="segundos de espera pelas respostas")
+    parser.add_argument("--json", action="store_true", help="imprime as metricas de cada no em JSON")
+    args = parser.parse_args()
+
+    ip, port = args.endereco.split(":")
+    collector = Node(ip, int(port), verbose=False)
+    collector.start(interactive=False)
+    try:
+        snapshots = collector.collect_stats(args.ttl, args.espera, args.entrada)
+        # O proprio coletor nao faz parte da rede
+        snapshots.pop(args.endereco, None)
+        if args.json:
+            print(json.dumps(snapshots, indent=2, sort_keys=True))
+        else:
+            collector.print_overlay_stats(snapshots)
+    finally:
+        collector.stop(grace=0)
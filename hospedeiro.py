@@ -0,0 +1,138 @@
+"""Hospeda todos os nos de um diretorio de topologia num unico processo, sem menu.
+
+Le os arquivos <N>.txt do diretorio (vizinhos do no da porta 5000 + N, como nos scripts
+start_nodes_*.ps1) e, se houver, os arquivos key_value<N>.txt (ou o indice .idx) do
+diretorio de chaves. Cada no escuta no seu proprio socket local, mas todos dividem um
+unico event loop (transporte async, padrao) ou as threads do mesmo processo (thread),
+sem pagar o interpretador e a memoria de um processo por no. Primeiro todos os
+servidores sobem, depois cada no manda HELLO aos vizinhos do arquivo, entao nenhum HELLO
+encontra a porta fechada. Nos de outros processos podem entrar na rede com HELLO e
+coletor.py coleta as metricas de todos.
+
+Com Ctrl+C (ou SIGTERM, ou ao fim de --duracao) todos os nos mandam BYE aos vizinhos
+enquanto os servidores ainda aceitam conexoes, e so depois fecham.
+
+Uso:
+    python hospedeiro.py topologia_grid3x3 --chaves key_values
+    python hospedeiro.py /tmp/topologia_500 --transport thread --heartbeat 1 --duracao 60
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import threading
+import time
+from typing import Dict, List, Optional
+
+from node import SUSPECT_AFTER, WIRE_PROTOCOLS, Node
+
+BASE_PORT = 5000
+KEY_VALUE_FILE = re.compile(r"key_value(\d+)\.(txt|idx)$")
+
+
+def topology_files(directory: str) -> Dict[int, str]:
+    files = {}
+    for name in os.listdir(directory):
+        number, extension = os.path.splitext(name)
+        if extension == ".txt" and number.isdigit():
+            files[int(number)] = os.path.join(directory, name)
+    return dict(sorted(files.items()))
+
+
+def key_value_files(directory: Optional[str]) -> Dict[int, str]:
+    # Com o .txt e o .idx do mesmo no, fica o indice
+    files = {}
+    for name in sorted(os.listdir(directory)) if directory else ():
+        match = KEY_VALUE_FILE.match(name)
+        if match and (match.group(2) == "idx" or int(match.group(1)) not in files):
+            files[int(match.group(1))] = os.path.join(directory, name)
+    return files
+
+
+def resident_memory() -> int:
+    """RSS atual do processo em bytes (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def start_host(directory: str, key_value_dir: Optional[str] = None, ip: str = "127.0.0.1",
+               transport: str = "async", base_port: int = BASE_PORT, **node_options) -> List[Node]:
+    """Sobe um no por arquivo <N>.txt, na porta base_port + N, e liga os vizinhos de todos."""
+    loop = None
+    if transport == "async":
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+    key_values = key_value_files(key_value_dir)
+    neighbor_files = topology_files(directory)
+    nodes = []
+    for number in neighbor_files:
+        # Sem arquivo de vizinhos o construtor nao manda HELLO: os vizinhos so sao lidos
+        # depois que todos os servidores estiverem aceitando conexoes
+        node = Node(ip, base_port + number, None, key_values.get(number), transport=transport, loop=loop,
+                    **node_options)
+        node.start(interactive=False)
+        nodes.append(node)
+    for node, neighbors_file in zip(nodes, neighbor_files.values()):
+        node.load_file(neighbors_file, node.neighbors_possiveis)
+        node.initialize_neighbors()
+    return nodes
+
+
+def wait_neighbors(nodes: List[Node], timeout: float) -> bool:
+    """Espera cada no ter na tabela todos os vizinhos do seu arquivo."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(set(node.neighbors_possiveis) <= set(node.neighbors) for node in nodes):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stop_host(nodes: List[Node], grace: float = 0.5):
+    # Todos se despedem antes de qualquer servidor fechar, para que nenhum BYE encontre a
+    # porta do vizinho fechada e fique tentando reconectar
+    for node in nodes:
+        node.leave()
+    time.sleep(grace)
+    for node in nodes:
+        node.shutdown(grace=0)
+    if nodes and nodes[0].loop is not None:
+        nodes[0].loop.call_soon_threadsafe(nodes[0].loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topologia", help="diretorio com os arquivos <N>.txt")
+    parser.add_argument("--chaves", help="diretorio com os arquivos key_value<N>.txt (padrao: o da topologia)")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--transport", choices=("async", "thread"), default="async",
+                        help="async: um event loop para todos os nos; thread: threads por conexao, como o node.py")
+    parser.add_argument("--wire", choices=WIRE_PROTOCOLS, default="text")
+    parser.add_argument("--heartbeat", type=float, default=0.0,
+                        help=f"segundos entre HEARTBEAT; vizinho sem noticia por {SUSPECT_AFTER} intervalos sai das "
+                             f"buscas (0 desliga)")
+    parser.add_argument("--verbose", action="store_true", help="imprime o trafego de mensagens de todos os nos")
+    parser.add_argument("--duracao", type=float, help="segundos no ar antes de sair (padrao: ate Ctrl+C)")
+    parser.add_argument("--espera", type=float, default=30.0, help="prazo em segundos para todos os vizinhos se ligarem")
+    args = parser.parse_args()
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    started = time.perf_counter()
+    nodes = start_host(args.topologia, args.chaves or args.topologia, args.ip, args.transport,
+                       verbose=args.verbose, wire=args.wire, heartbeat=args.heartbeat)
+    linked = wait_neighbors(nodes, args.espera)
+    links = sum(len(node.neighbors) for node in nodes) // 2
+    print(f"{len(nodes)} nos ({links} ligacoes) no ar em {time.perf_counter() - started:.2f} s, "
+          f"RSS {resident_memory() / 2 ** 20:.0f} MB, {threading.active_count()} threads")
+    if not linked:
+        missing = sum(len(set(node.neighbors_possiveis) - set(node.neighbors)) for node in nodes)
+        print(f"Aviso: {missing} vizinhos nao responderam ao HELLO em {args.espera:.0f} s")
+    stopping.wait(args.duracao)
+    print("Saindo...")
+    started = time.perf_counter()
+    stop_host(nodes)
+    print(f"{len(nodes)} nos encerrados em {time.perf_counter() - started:.2f} s")
@@ -0,0 +1,21 @@
+"""Converte um arquivo chave-valor em texto ('chave valor' por linha) no indice
+mapeado em memoria que o node.py abre sem carregar as chaves.
+
+Uso:
+    python indexar_chaves.py key_values/key_value1.txt key_value1.idx
+    python node.py 127.0.0.1:5001 topologia_linha/1.txt key_value1.idx
+"""
+import argparse
+import time
+
+from node import build_key_value_index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("entrada", help="arquivo texto 'chave valor'")
+    parser.add_argument("saida", help="arquivo de indice a gerar")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    count = build_key_value_index(args.entrada, args.saida)
+    print(f"{count} chaves indexadas em {args.saida} ({time.perf_counter() - started:.2f} s)")
@@ -1,46 +1,1484 @@
+import argparse
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import math
+import mmap
+import os
+import queue
 import socket
 import threading
 import random
+import struct
 import sys
-from typing import List, Dict, Optional, Tuple, Set
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from typing import Callable, Hashable, Iterable, List, Dict, Optional, Tuple, Set
 import statistics
 import time
+import zlib
+
+# "memory" entrega as mensagens por uma rede em memoria (ver simulador.py) em vez de sockets
+TRANSPORTS = ("thread", "async", "memory")
+RECV_BUFFER_SIZE = 64 * 1024
+MAX_MESSAGE_SIZE = 1024 * 1024
+DEDUP_MODES = ("exact", "bloom")
+DEDUP_MAX_ENTRIES = 100_000
+DEDUP_MAX_AGE = 300.0
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 60.0
+SEND_QUEUE_SIZE = 1000
+SEND_BATCH_BYTES = 64 * 1024
+CONNECT_TIMEOUT = 5.0
+RECONNECT_ATTEMPTS = 5
+# Writer sem nada para enviar por este tempo fecha o socket e sai (thread ou task); o proximo
+# envio para o mesmo destino abre outro. Sem isso cada origem respondida, replica ou coletor
+# deixaria uma conexao e uma thread para sempre
+WRITER_IDLE_TIMEOUT = 30.0
+# Detector de falhas: HEARTBEAT a cada intervalo; sem noticia de um vizinho por SUSPECT_AFTER
+# intervalos ele fica suspeito (fora das buscas) e por DEAD_AFTER, morto (so uma sonda a cada
+# DEAD_PROBE_EVERY intervalos). Qualquer mensagem dele o readmite
+PEER_STATES = ("alive", "suspect", "dead")
+SUSPECT_AFTER = 3
+DEAD_AFTER = 10
+DEAD_PROBE_EVERY = 5
+RECONNECT_BACKOFF_MIN = 0.1
+RECONNECT_BACKOFF_MAX = 5.0
+FANOUT_MODES = ("concurrent", "sequential")
+SEND_DEADLINE = 2.0
+LATENCY_SAMPLES = 10_000
+# Histogramas do caminho quente: balde i guarda latencias de 2^(i-1) a 2^i microssegundos
+HISTOGRAM_BUCKETS = 32
+STATS_TTL = 16
+STATS_WAIT = 2.0
+SEARCH_STATE_IDLE_TIMEOUT = 60.0
+# BG (busca guiada) segue os resumos de chaves dos vizinhos e cai para random walk sem eles;
+# ER (anel expansivo) repete o flooding com raio 1, 2, 4... ate alguem responder;
+# KW solta k random walks de uma vez, que a cada poucos saltos perguntam a origem se continuam
+SEARCH_MODES = ("FL", "RW", "BP", "BG", "ER", "KW")
+RING_HOP_TIMEOUT = 0.05
+WALKERS = 4
+CHECKBACK_HOPS = 4
+SUMMARY_CAPACITY = 1024
+SUMMARY_ERROR_RATE = 0.01
+# O resumo tem tamanho fixo para que os niveis possam ser unidos. Com chaves demais (um indice
+# .idx com milhoes delas, ou a uniao dos vizinhos) o filtro satura e diz "talvez" para qualquer
+# chave; acima desta taxa estimada de falsos positivos o nivel e anunciado vazio ("-")
+SUMMARY_MAX_FALSE_RATE = 0.1
+SUMMARY_SATURATED = "-"
+SUMMARY_INTERVAL = 5.0
+BATCH_IN_FLIGHT = 8
+QUERY_TIMEOUT = 5.0
+# Busca de varias chaves num SEARCH so (campo B=1, chaves separadas por virgula): cada no responde
+# num unico VALS as que tem e repassa so as que faltam. Os passeios com varios walkers (KW), o anel
+# e a busca guiada decidem por chave e continuam com um SEARCH por chave
+MULTI_KEY_MODES = ("FL", "RW", "BP")
+MULTI_KEY_SEPARATOR = ","
+MULTI_KEY_MAX = 64
+# Uma busca repassada segura as buscas iguais ate a origem dela responder ou desistir. So FL e
+# ER coalescem: cobrem todo o raio do TTL, enquanto um passeio que falha faria falhar os presos
+COALESCE_MODES = ("FL", "ER")
+COALESCE_TIMEOUT = QUERY_TIMEOUT
+COALESCE_ANSWERS = 1024
+# Replicacao de caminho: quem responde copia o par para os nos por onde a busca passou (campo R=
+# do SEARCH), todos ("path") ou alguns sorteados ("sample"), que o guardam num deposito de replicas
+REPLICATION_POLICIES = ("off", "path", "sample")
+REPLICA_PATH_MAX = 16
+REPLICA_SAMPLE = 2
+REPLICA_STORE_SIZE = 1024
+REPLICA_TTL = 300.0
+# Rastreamento por salto (campo T= do SEARCH, opcional): o primeiro item e o instante em que a
+# origem comecou a busca, em microssegundos de relogio de parede; cada no acrescenta
+# "endereco/chegada/fila/processamento", a chegada em microssegundos desde esse instante e as
+# outras duas como duracoes. O rastro cresce a cada salto, entao num passeio longo pesa nos bytes.
+# O VAL o leva de volta e a origem o guarda. Nos de maquinas diferentes precisam de relogios
+# sincronizados (NTP)
+TRACE_SEPARATOR = ";"
+TRACE_STORE = 10_000
+# Arquivo de indice chave-valor: cabecalho, registros (tamanho da chave, tamanho do valor,
+# chave, valor) e uma tabela hash de slots (hash de 64 bits da chave, offset do registro)
+INDEX_MAGIC = b"KVIDX001"
+INDEX_HEADER = struct.Struct("<8sQQQ")  # magic, numero de chaves, offset dos slots, numero de slots
+INDEX_RECORD = struct.Struct("<HI")
+INDEX_SLOT = struct.Struct("<QQ")
+# Protocolo binario para SEARCH e VAL, negociado no HELLO (WIRE=binary): byte 0x00, tamanho do
+# resto, cabecalho fixo e os bytes da chave e dos campos extras (o valor, no VAL). Texto nunca
+# comeca com 0x00, entao as duas codificacoes convivem na mesma conexao.
+WIRE_PROTOCOLS = ("text", "binary")
+BINARY_OPS = ("SEARCH", "VAL")
+BINARY_CODES = {(operation, mode): bytes((i, j)) for i, operation in enumerate(BINARY_OPS)
+                for j, mode in enumerate(SEARCH_MODES)}
+BINARY_MARKER = 0
+# marker, tamanho, origem (ip e porta), seqno, ttl, op e modo, ultimo salto (ip e porta), saltos,
+# tamanho da chave, tamanho dos extras
+BINARY_HEADER = struct.Struct("!BI6sIH2s6sHHH")
+BINARY_PREFIX = struct.Struct("!BI")
+# Campos trocados por quem encaminha: ttl e (ultimo salto, saltos)
+BINARY_TTL = struct.Struct("!H")
+BINARY_TTL_OFFSET = 15
+BINARY_OP_OFFSET = 17
+BINARY_ROUTE = struct.Struct("!6sH")
+BINARY_ROUTE_OFFSET = 19
+
+# Item das filas de saida: (bytes, instante em que o encaminhamento comecou, prazo para o envio)
+OutboundItem = Tuple[bytes, Optional[float], Optional[float]]
+
+
+class BloomFilter:
+    """Filtro de Bloom com m bits e k funcoes de hash derivadas de um unico blake2b."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for index in self._indexes(item):
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    def false_positive_rate(self) -> float:
+        """Taxa estimada de falsos positivos: fracao de bits ligados elevada ao numero de hashes."""
+        ones = bin(int.from_bytes(self.bits, "little")).count("1")
+        return (ones / self.size) ** self.hash_count
+
+    def update(self, other: "BloomFilter"):
+        """Uniao com um filtro do mesmo tamanho."""
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(other.bits, "little")
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+        self.count += other.count
+
+    def encode(self) -> str:
+        # Filtros pouco cheios comprimem bem; base64 nao tem espacos nem virgulas
+        return base64.b64encode(zlib.compress(bytes(self.bits))).decode()
+
+    @classmethod
+    def decode(cls, text: str, capacity: int, error_rate: float = 0.01) -> "BloomFilter":
+        bloom = cls(capacity, error_rate)
+        try:
+            bits = zlib.decompress(base64.b64decode(text, validate=True))
+        except zlib.error as e:
+            raise ValueError(f"filtro de Bloom invalido: {e}")
+        if len(bits) != len(bloom.bits):
+            raise ValueError(f"filtro de Bloom com {len(bits)} bytes, esperado {len(bloom.bits)}")
+        bloom.bits = bytearray(bits)
+        return bloom
+
+
+class DedupTable:
+    """Conjunto de ids ja vistos, limitado em numero de entradas e em idade.
+
+    As entradas ficam em ordem de insercao, entao as mais antigas saem primeiro
+    quando a tabela passa de max_entries ou quando ficam mais velhas que max_age.
+    """
+
+    def __init__(self, max_entries: int = DEDUP_MAX_ENTRIES, max_age: float = DEDUP_MAX_AGE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.entries: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.clock = clock
+        self.lookups = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def _expire(self, now: float):
+        entries = self.entries
+        while entries:
+            oldest, added = next(iter(entries.items()))
+            if len(entries) <= self.max_entries and now - added <= self.max_age:
+                break
+            entries.popitem(last=False)
+
+    def __contains__(self, item: Hashable) -> bool:
+        with self.lock:
+            self._expire(self.clock())
+            self.lookups += 1
+            if item in self.entries:
+                self.hits += 1
+                return True
+            return False
+
+    def add(self, item: Hashable):
+        with self.lock:
+            now = self.clock()
+            self.entries[item] = now
+            self.entries.move_to_end(item)
+            self._expire(now)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class BloomDedupTable(DedupTable):
+    """Versao probabilistica da DedupTable para taxas muito altas.
+
+    Usa dois filtros de Bloom de tamanho fixo: as insercoes vao para o atual e as
+    consultas olham os dois. O atual vira o anterior quando enche ou a cada max_age/2,
+    entao a memoria nao cresce e um id e lembrado por pelo menos max_age/2.
+    Falsos positivos descartam uma mensagem nova com probabilidade ~error_rate.
+    """
+
+    def __init__(self, max_entries: int = DEDUP_MAX_ENTRIES, max_age: float = DEDUP_MAX_AGE,
+                 clock: Callable[[], float] = time.monotonic, error_rate: float = 0.001):
+        super().__init__(max_entries, max_age, clock)
+        self.error_rate = error_rate
+        self.current = BloomFilter(max_entries, error_rate)
+        self.previous = BloomFilter(max_entries, error_rate)
+        self.rotated_at = clock()
+
+    def _expire(self, now: float):
+        if self.current.count >= self.max_entries or now - self.rotated_at >= self.max_age / 2:
+            self.previous = self.current
+            self.current = BloomFilter(self.max_entries, self.error_rate)
+            self.rotated_at = now
+
+    def __contains__(self, item: Hashable) -> bool:
+        key = repr(item)
+        with self.lock:
+            self._expire(self.clock())
+            self.lookups += 1
+            if key in self.current or key in self.previous:
+                self.hits += 1
+                return True
+            return False
+
+    def add(self, item: Hashable):
+        key = repr(item)
+        with self.lock:
+            self._expire(self.clock())
+            self.current.add(key)
+
+    def __len__(self) -> int:
+        return self.current.count + self.previous.count
+
+
+class ResultCache:
+    """Cache LRU de pares chave-valor aprendidos por mensagens VAL, com expiracao por TTL."""
+
+    def __init__(self, capacity: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, self.clock() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SearchState:
+    """Estado de uma busca neste no: vizinhos para quem ja mandou, o pai na arvore da BP e
+    o maior TTL com que ja repassou uma rodada do anel expansivo e os walkers KW parados
+    aqui esperando a origem responder o CHECK."""
+    __slots__ = ("visited", "parent", "reach", "parked", "last_seen")
+
+    def __init__(self, now: float):
+        self.visited: Set[str] = set()
+        self.parent: Optional[str] = None
+        self.reach = 0
+        self.parked: Dict[str, tuple] = {}
+        self.last_seen = now
+
+
+class SearchStateTable:
+    """Tabela (origin, seqno) -> SearchState, para que buscas simultaneas nao se misturem.
+
+    Estados sem atividade ha mais de idle_timeout segundos sao removidos.
+    """
+
+    def __init__(self, idle_timeout: float = SEARCH_STATE_IDLE_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.states: "OrderedDict[Tuple[str, str], SearchState]" = OrderedDict()
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    def get(self, search_id: Tuple[str, str]) -> Tuple[SearchState, bool]:
+        """Devolve o estado da busca e se ele acabou de ser criado."""
+        with self.lock:
+            now = self.clock()
+            while self.states:
+                oldest = next(iter(self.states.values()))
+                if now - oldest.last_seen <= self.idle_timeout:
+                    break
+                self.states.popitem(last=False)
+            state = self.states.get(search_id)
+            created = state is None
+            if created:
+                state = self.states[search_id] = SearchState(now)
+            else:
+                state.last_seen = now
+                self.states.move_to_end(search_id)
+            return state, created
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+
+class PendingSearch:
+    """Busca repassada por este no ainda sem VAL e as buscas pela mesma chave presas a ela."""
+    __slots__ = ("search_id", "hop_count", "expires", "waiters")
+
+    def __init__(self, search_id: Tuple[str, str], hop_count: int, expires: float):
+        self.search_id = search_id
+        self.hop_count = hop_count
+        self.expires = expires
+        # (origin, seqno) -> (mode, hop_count com que a busca chegou aqui)
+        self.waiters: Dict[Tuple[str, str], Tuple[str, int]] = {}
+
+
+class CoalescingTable:
+    """Tabela chave -> PendingSearch para coalescer buscas iguais em andamento.
+
+    A primeira busca por uma chave e repassada e registrada; as seguintes (de outras origens
+    ou outros seqnos) ficam presas a ela esperando o mesmo VAL. Uma entrada vale por timeout
+    segundos: depois disso a proxima busca pela chave volta a ser repassada.
+    """
+
+    def __init__(self, timeout: float = COALESCE_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.entries: "OrderedDict[str, PendingSearch]" = OrderedDict()
+        self.timeout = timeout
+        self.clock = clock
+        self.forwarded = 0
+        self.coalesced = 0
+        self.lock = threading.Lock()
+
+    def attach(self, key: str, search_id: Tuple[str, str], mode: str, hop_count: int) -> Tuple[bool, Optional[Tuple[str, str]]]:
+        """Registra a busca e devolve se ela ficou presa a outra (e nao deve ser repassada) e,
+        se ela foi a primeira presa, o id da busca cuja origem precisa avisar este no do VAL."""
+        with self.lock:
+            now = self.clock()
+            entries = self.entries
+            while entries:
+                oldest = next(iter(entries.values()))
+                if oldest.expires > now:
+                    break
+                entries.popitem(last=False)
+            entry = entries.get(key)
+            if entry is None:
+                entries[key] = PendingSearch(search_id, hop_count, now + self.timeout)
+                self.forwarded += 1
+                return False, None
+            if entry.search_id == search_id:
+                return False, None
+            if search_id in entry.waiters:
+                return True, None
+            first = not entry.waiters
+            entry.waiters[search_id] = (mode, hop_count)
+            self.coalesced += 1
+            return True, entry.search_id if first else None
+
+    def resolve(self, key: str) -> Optional[PendingSearch]:
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def ratio(self) -> float:
+        total = self.forwarded + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+
+class FailureDetector:
+    """Estado dos vizinhos (alive, suspect, dead) a partir dos HEARTBEAT recebidos e das falhas de envio.
+
+    Um vizinho so passa a ser vigiado no primeiro HEARTBEAT, para que um no sem detector (ou
+    mais antigo) nunca fique suspeito por nao mandar HEARTBEAT nem por uma falha de envio
+    passageira. O tempo so piora o estado; qualquer mensagem do vizinho o devolve a alive, e
+    um envio feito desfaz a suspeita que veio de uma falha de envio.
+    """
+
+    def __init__(self, interval: float, suspect_after: int = SUSPECT_AFTER, dead_after: int = DEAD_AFTER,
+                 clock: Callable[[], float] = time.monotonic):
+        self.suspect_timeout = interval * suspect_after
+        self.dead_timeout = interval * dead_after
+        self.clock = clock
+        self.last_seen: Dict[str, float] = {}
+        self.states: Dict[str, str] = {}
+        # Vizinhos suspeitos por falha de envio (e nao por silencio)
+        self.send_failures: Set[str] = set()
+        self.suspicions = 0
+        self.recoveries = 0
+        self.lock = threading.Lock()
+
+    def heard(self, peer: str) -> bool:
+        """Registra um HEARTBEAT; True se o vizinho estava suspeito ou morto."""
+        with self.lock:
+            previous = self.states.get(peer)
+            self.last_seen[peer] = self.clock()
+            self.states[peer] = "alive"
+            self.send_failures.discard(peer)
+            if previous in ("suspect", "dead"):
+                self.recoveries += 1
+                return True
+        return False
+
+    def contacted(self, peer: str) -> bool:
+        """Registra outra mensagem do vizinho; True se ele estava suspeito ou morto."""
+        if peer not in self.last_seen:
+            return False
+        return self.heard(peer)
+
+    def failed(self, peer: str):
+        # Conexao recusada ou envio com erro: suspeito na hora, sem esperar os HEARTBEAT perdidos
+        with self.lock:
+            if peer in self.last_seen and self.states[peer] == "alive":
+                self.states[peer] = "suspect"
+                self.send_failures.add(peer)
+                self.suspicions += 1
+
+    def delivered(self, peer: str) -> bool:
+        """Envio feito depois de uma falha; True se isso desfez a suspeita."""
+        with self.lock:
+            if peer not in self.send_failures:
+                return False
+            self.send_failures.discard(peer)
+            self.states[peer] = "alive"
+            self.recoveries += 1
+        return True
+
+    def forget(self, peer: str):
+        with self.lock:
+            self.last_seen.pop(peer, None)
+            self.states.pop(peer, None)
+            self.send_failures.discard(peer)
+
+    def check(self) -> List[Tuple[str, str]]:
+        """Aplica os prazos e devolve os (vizinho, novo estado) que mudaram."""
+        now = self.clock()
+        changed = []
+        with self.lock:
+            for peer, seen in self.last_seen.items():
+                state = self.states[peer]
+                if state != "dead" and now - seen > self.dead_timeout:
+                    new_state = "dead"
+                elif state == "alive" and now - seen > self.suspect_timeout:
+                    new_state = "suspect"
+                else:
+                    continue
+                if state == "alive":
+                    self.suspicions += 1
+                # Em silencio: so outra mensagem do vizinho o readmite
+                self.send_failures.discard(peer)
+                self.states[peer] = new_state
+                changed.append((peer, new_state))
+        return changed
+
+    def state(self, peer: str) -> str:
+        return self.states.get(peer, "alive")
+
+    def available(self, peer: str) -> bool:
+        return self.states.get(peer, "alive") == "alive"
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return {state: sum(1 for current in self.states.values() if current == state) for state in PEER_STATES}
+
+
+class LatencyHistogram:
+    """Histograma de latencias em baldes de potencias de 2 de microssegundos.
+
+    record() so faz uma conta de bits e um incremento, sem lock: incrementos concorrentes
+    podem perder uma contagem rara, o que e aceitavel para estatistica e mantem o custo baixo.
+    """
+    __slots__ = ("counts", "total", "sum")
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.total = 0
+        self.sum = 0.0
+
+    def record(self, seconds: float):
+        self.counts[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.total += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Limite superior, em segundos, do balde onde cai o quantil q."""
+        target = q * self.total
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "n": self.total,
+            "media_ms": self.sum / self.total * 1000 if self.total else 0.0,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+        }
+
+
+class NodeMetrics:
+    """Contadores do caminho quente de um no, sempre ligados e lidos por show_statistics e por STATS."""
+
+    def __init__(self):
+        self.received: Counter = Counter()
+        self.sent: Counter = Counter()
+        self.dropped_ttl = 0
+        self.dropped_dedup = 0
+        self.bytes_in = 0
+        self.connections = 0
+        self.processing = LatencyHistogram()
+        self.searches = LatencyHistogram()
+
+
+class Query:
+    """Uma busca iniciada por este no, resolvida pelo primeiro VAL com o seu seqno."""
+    __slots__ = ("mode", "key", "seqno", "started", "deadline", "finished", "value", "hop_count", "status", "done", "clock",
+                 "histogram", "trace")
+
+    def __init__(self, mode: str, key: str, seqno: Optional[str], timeout: float,
+                 clock: Callable[[], float] = time.monotonic, histogram: Optional[LatencyHistogram] = None):
+        self.mode = mode
+        self.histogram = histogram
+        self.key = key
+        self.seqno = seqno
+        self.clock = clock
+        self.started = clock()
+        self.deadline = self.started + timeout
+        self.finished: Optional[float] = None
+        self.value: Optional[str] = None
+        self.hop_count: Optional[int] = None
+        self.status = "pendente"
+        self.done = threading.Event()
+        self.trace: Optional[dict] = None
+
+    def resolve(self, status: str, value: Optional[str] = None, hop_count: Optional[int] = None):
+        self.finished = self.clock()
+        self.status = status
+        self.value = value
+        self.hop_count = hop_count
+        self.done.set()
+        if status == "ok" and self.histogram is not None:
+            self.histogram.record(self.finished - self.started)
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+
+def make_dedup_table(mode: str, max_entries: int = DEDUP_MAX_ENTRIES, max_age: float = DEDUP_MAX_AGE,
+                     clock: Callable[[], float] = time.monotonic) -> DedupTable:
+    if mode == "bloom":
+        return BloomDedupTable(max_entries, max_age, clock)
+    return DedupTable(max_entries, max_age, clock)
+
+
+def index_key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class MappedKeyValueStore(Mapping):
+    """Tabela chave-valor somente leitura sobre um indice mapeado em memoria.
+
+    Abrir o indice so le o cabecalho; as buscas sondam a tabela de slots direto no
+    mmap (enderecamento aberto, O(1) esperado) e comparam a chave sem copia-la.
+    Apenas o valor encontrado vira str. O indice e gerado por build_key_value_index.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, self.count, self.slots_offset, self.slot_count = INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} nao e um indice chave-valor")
+        self.mask = self.slot_count - 1
+
+    def _find(self, key: bytes) -> int:
+        key_hash = index_key_hash(key)
+        slot = key_hash & self.mask
+        while True:
+            slot_hash, offset = INDEX_SLOT.unpack_from(self.map, self.slots_offset + slot * INDEX_SLOT.size)
+            if offset == 0:
+                return 0
+            if slot_hash == key_hash:
+                key_size, _ = INDEX_RECORD.unpack_from(self.map, offset)
+                start = offset + INDEX_RECORD.size
+                if self.view[start:start + key_size] == key:
+                    return offset
+            slot = (slot + 1) & self.mask
+
+    def __getitem__(self, key: str) -> str:
+        offset = self._find(key.encode())
+        if not offset:
+            raise KeyError(key)
+        key_size, value_size = INDEX_RECORD.unpack_from(self.map, offset)
+        start = offset + INDEX_RECORD.size + key_size
+        return str(self.view[start:start + value_size], "utf-8")
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._find(key.encode()) != 0
+
+    def __iter__(self):
+        for slot in range(self.slot_count):
+            _, offset = INDEX_SLOT.unpack_from(self.map, self.slots_offset + slot * INDEX_SLOT.size)
+            if offset:
+                key_size, _ = INDEX_RECORD.unpack_from(self.map, offset)
+                start = offset + INDEX_RECORD.size
+                yield str(self.view[start:start + key_size], "utf-8")
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def is_key_value_index(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def build_key_value_index(text_path: str, index_path: str) -> int:
+    """Converte um arquivo 'chave valor' por linha num indice para MappedKeyValueStore.
+
+    Como no dict, uma chave repetida fica com o ultimo valor. Devolve o numero de chaves.
+    O indice e escrito ao lado e so entao renomeado, entao quem ja tem o antigo aberto
+    continua lendo o antigo (truncar um arquivo mapeado derrubaria o processo).
+    """
+    hashes: List[int] = []
+    offsets: List[int] = []
+    final_path, index_path = index_path, index_path + ".tmp"
+    with open(index_path, "wb") as out:
+        out.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0))
+        offset = INDEX_HEADER.size
+        with open(text_path, "rb") as f:
+            for line in f:
+                fields = line.split()
+                if not fields:
+                    continue
+                key, value = fields
+                out.write(INDEX_RECORD.pack(len(key), len(value)))
+                out.write(key)
+                out.write(value)
+                hashes.append(index_key_hash(key))
+                offsets.append(offset)
+                offset += INDEX_RECORD.size + len(key) + len(value)
+    # Fator de carga de no maximo 1/2 mantem as sondagens curtas
+    slot_count = 1
+    while slot_count < 2 * len(offsets):
+        slot_count *= 2
+    slots = bytearray(slot_count * INDEX_SLOT.size)
+    count = 0
+    with open(index_path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for key_hash, offset in zip(hashes, offsets):
+                key_size, _ = INDEX_RECORD.unpack_from(data, offset)
+                key = data[offset + INDEX_RECORD.size:offset + INDEX_RECORD.size + key_size]
+                slot = key_hash & (slot_count - 1)
+                while True:
+                    slot_hash, slot_offset = INDEX_SLOT.unpack_from(slots, slot * INDEX_SLOT.size)
+                    if slot_offset == 0:
+                        count += 1
+                        break
+                    if slot_hash == key_hash:
+                        other_size, _ = INDEX_RECORD.unpack_from(data, slot_offset)
+                        start = slot_offset + INDEX_RECORD.size
+                        if data[start:start + other_size] == key:
+                            break
+                    slot = (slot + 1) & (slot_count - 1)
+                INDEX_SLOT.pack_into(slots, slot * INDEX_SLOT.size, key_hash, offset)
+        finally:
+            data.close()
+    with open(index_path, "r+b") as out:
+        out.seek(0, 2)
+        slots_offset = out.tell()
+        out.write(slots)
+        out.seek(0)
+        out.write(INDEX_HEADER.pack(INDEX_MAGIC, count, slots_offset, slot_count))
+    os.replace(index_path, final_path)
+    return count
+
+
+def trace_hop(trace: str, address: str, arrived: float, started: float, finished: float) -> str:
+    """Campo T= com mais um salto; os instantes vem em segundos do relogio de parede."""
+    base = int(trace.split(TRACE_SEPARATOR, 1)[0])
+    return (f"{trace}{TRACE_SEPARATOR}{address}/{int(arrived * 1e6) - base}/{int((started - arrived) * 1e6)}/"
+            f"{int((finished - started) * 1e6)}")
+
+
+def parse_trace(trace: str) -> Tuple[float, List[dict]]:
+    """(inicio da busca em segundos, saltos com os instantes em ms desde o inicio) do campo T=."""
+    base, *hops = trace.split(TRACE_SEPARATOR)
+    parsed = []
+    for hop in hops:
+        address, arrived, queued, processing = hop.split("/")
+        started = int(arrived) + int(queued)
+        parsed.append({"no": address, "chegada": int(arrived) / 1000, "inicio": started / 1000,
+                       "saida": (started + int(processing)) / 1000})
+    return int(base) / 1e6, parsed
+
+
+# Os enderecos sao sempre os mesmos poucos vizinhos e origens: as conversoes ficam em cache
+@functools.lru_cache(maxsize=4096)
+def pack_address(address: str) -> Optional[bytes]:
+    """'ip:porta' em 6 bytes (IPv4 e porta), ou None se nao for um IPv4 canonico."""
+    ip, port = address.split(':')
+    try:
+        packed = socket.inet_aton(ip)
+    except OSError:
+        return None
+    if socket.inet_ntoa(packed) != ip:
+        return None
+    return packed + int(port).to_bytes(2, "big")
+
+
+@functools.lru_cache(maxsize=4096)
+def unpack_address(packed: bytes) -> Tuple[str, str, str]:
+    """(ip, porta, 'ip:porta') dos 6 bytes de pack_address."""
+    ip, port = socket.inet_ntoa(packed[:4]), str(int.from_bytes(packed[4:], "big"))
+    return ip, port, f"{ip}:{port}"
+
+
+def encode_binary(origin: str, seqno: str, ttl: int, operation: str, mode: str, last_hop: str, hop_count: int,
+                  key: str, extra: str) -> Optional[bytearray]:
+    """Frame binario da mensagem, ou None se algum campo nao couber (a mensagem vai em texto)."""
+    origin_addr = pack_address(origin)
+    last_hop_addr = pack_address(last_hop)
+    code = BINARY_CODES.get((operation, mode))
+    if origin_addr is None or last_hop_addr is None or code is None or not seqno.isdigit():
+        return None
+    key_bytes = key.encode()
+    extra_bytes = extra.encode()
+    length = BINARY_HEADER.size - BINARY_PREFIX.size + len(key_bytes) + len(extra_bytes)
+    try:
+        header = BINARY_HEADER.pack(BINARY_MARKER, length, origin_addr, int(seqno), ttl, code, last_hop_addr, hop_count,
+                                    len(key_bytes), len(extra_bytes))
+    except struct.error:
+        return None
+    return bytearray(header + key_bytes + extra_bytes)
+
+
+def decode_binary(frame) -> Tuple[str, str, int, str, str, str, str, int, str, str]:
+    """(origem, seqno, ttl, operacao, modo, ip e porta do ultimo salto, saltos, chave, extras) do frame."""
+    _, _, origin, seqno, ttl, code, last_hop, hop_count, key_size, extra_size = BINARY_HEADER.unpack_from(frame)
+    start = BINARY_HEADER.size
+    key = frame[start:start + key_size].decode()
+    extra = frame[start + key_size:start + key_size + extra_size].decode()
+    try:
+        operation = BINARY_OPS[code[0]]
+        mode = SEARCH_MODES[code[1]]
+    except IndexError:
+        raise ValueError("operacao ou modo desconhecido no frame binario")
+    last_hop_ip, last_hop_port, _ = unpack_address(last_hop)
+    return (unpack_address(origin)[2], str(seqno), ttl, operation, mode, last_hop_ip, last_hop_port, hop_count,
+            key, extra)
+
+
+class WireMessage:
+    """SEARCH ou VAL a enviar, codificado em texto ou binario conforme o vizinho.
+
+    Cada codificacao e gerada uma vez e reaproveitada para todos os vizinhos. Se a busca
+    chegou em binario (frame), o frame encaminhado e uma copia do recebido com TTL, ultimo
+    salto e saltos trocados no lugar, sem recodificar chave e campos extras.
+    """
+    __slots__ = ("origin", "seqno", "ttl", "operation", "mode", "last_hop", "hop_count", "key", "extra", "frame",
+                 "_text", "_binary")
+
+    def __init__(self, origin: str, seqno: str, ttl: int, operation: str, mode: str, last_hop: str, hop_count: int,
+                 key: str, extra: str = "", frame: Optional[bytearray] = None):
+        self.origin = origin
+        self.seqno = seqno
+        self.ttl = ttl
+        self.operation = operation
+        self.mode = mode
+        self.last_hop = last_hop
+        self.hop_count = hop_count
+        self.key = key
+        self.extra = extra
+        self.frame = frame
+        self._text: Optional[bytes] = None
+        self._binary: Optional[bytearray] = None
+
+    def text(self) -> bytes:
+        if self._text is None:
+            if self.operation == "VAL":
+                line = f"{self.origin} {self.seqno} {self.ttl} VAL {self.mode} {self.key} {self.extra} {self.hop_count}\n"
+            else:
+                last_hop_ip, last_hop_port = self.last_hop.split(':')
+                line = (f"{self.origin} {self.seqno} {self.ttl} {self.operation} {self.mode} {last_hop_ip} "
+                        f"{last_hop_port} {self.key} {self.hop_count}{self.extra}\n")
+            self._text = line.encode()
+        return self._text
+
+    def binary(self) -> Optional[bytearray]:
+        if self._binary is None:
+            frame = self.frame
+            # O frame recebido so serve se so mudaram os campos de rota (nao o modo nem os extras,
+            # que crescem quando a replicacao acrescenta um no ao caminho R=)
+            if (frame is not None
+                    and frame[BINARY_OP_OFFSET:BINARY_OP_OFFSET + 2] == BINARY_CODES.get((self.operation, self.mode))
+                    and frame[BINARY_HEADER.size + len(self.key.encode()):] == self.extra.encode()):
+                last_hop = pack_address(self.last_hop)
+                if last_hop is not None:
+                    frame = bytearray(frame)
+                    BINARY_TTL.pack_into(frame, BINARY_TTL_OFFSET, self.ttl)
+                    BINARY_ROUTE.pack_into(frame, BINARY_ROUTE_OFFSET, last_hop, self.hop_count)
+                    self._binary = frame
+                    return frame
+            self._binary = encode_binary(self.origin, self.seqno, self.ttl, self.operation, self.mode, self.last_hop,
+                                         self.hop_count, self.key, self.extra)
+        return self._binary
+
+    def __str__(self) -> str:
+        return self.text().decode().strip()
+
+
+class MessageFramer:
+    """Separa o stream TCP de uma conexao em mensagens terminadas por '\n' e frames binarios.
+
+    Bytes de uma mensagem incompleta ficam no buffer ate a proxima leitura, entao
+    varias mensagens coalescidas numa leitura, ou uma mensagem dividida entre
+    leituras, sao entregues inteiras e na ordem. Mensagens de texto saem como str e
+    frames binarios como bytearray.
+    """
+
+    def __init__(self, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.buffer = bytearray()
+        self.max_message_size = max_message_size
+
+    def feed(self, data) -> List[str or bytearray]:
+        self.buffer += data
+        if BINARY_MARKER in self.buffer:
+            return self.feed_mixed()
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            self.check_size(len(self.buffer))
+            return []
+        complete = self.buffer[:end].decode()
+        del self.buffer[:end + 1]
+        return [message for message in complete.split("\n") if message.strip()]
+
+    def feed_mixed(self) -> List[str or bytearray]:
+        buffer = self.buffer
+        size = len(buffer)
+        messages = []
+        start = 0
+        while start < size:
+            if buffer[start] == BINARY_MARKER:
+                if size - start < BINARY_PREFIX.size:
+                    break
+                _, length = BINARY_PREFIX.unpack_from(buffer, start)
+                end = start + BINARY_PREFIX.size + length
+                if end > size:
+                    self.check_size(length)
+                    break
+                messages.append(buffer[start:end])
+                start = end
+            else:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    self.check_size(size - start)
+                    break
+                # Linhas de texto seguidas saem de uma vez, como em feed
+                next_frame = buffer.find(BINARY_MARKER, end)
+                stop = buffer.rfind(b"\n", start, size if next_frame < 0 else next_frame)
+                messages.extend(line for line in buffer[start:stop].decode().split("\n") if line.strip())
+                start = stop + 1
+        if start:
+            del buffer[:start]
+        return messages
+
+    def check_size(self, size: int):
+        if size > self.max_message_size:
+            self.buffer.clear()
+            raise ValueError("Mensagem excede o tamanho maximo")
+
+
+class NeighborWriter:
+    """Fila de saida de um vizinho, esvaziada por uma thread propria.
+
+    Quem envia so enfileira e retorna. A thread junta as mensagens que estiverem
+    na fila num unico sendall e reconecta com backoff exponencial quando o envio
+    falha; se a fila estiver cheia a mensagem e descartada e contada. Ociosa por
+    idle_timeout segundos, a thread pede ao on_idle para sair e fecha o socket.
+    """
+    Full = queue.Full
+    Empty = queue.Empty
+    attempts = RECONNECT_ATTEMPTS
+
+    def __init__(self, addr: str, queue_size: int, log: Callable[[str], None],
+                 on_sent: Callable[[float], None] = lambda latency: None,
+                 on_failed: Callable[[str], None] = lambda addr: None,
+                 idle_timeout: Optional[float] = None,
+                 on_idle: Callable[["NeighborWriter"], bool] = lambda writer: False,
+                 on_recovered: Callable[[str], None] = lambda addr: None):
+        self.addr = addr
+        self.ip, port = addr.split(':')
+        self.port = int(port)
+        self.log = log
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.on_recovered = on_recovered
+        self.failing = False
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self.queue = self.make_queue(queue_size)
+        self.backoff = RECONNECT_BACKOFF_MIN
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.expired = 0
+        self.batches = 0
+        self.bytes_sent = 0
+        self.max_depth = 0
+        self.start()
+
+    def make_queue(self, queue_size: int):
+        return queue.Queue(maxsize=queue_size)
+
+    def start(self):
+        self.sock: Optional[socket.socket] = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, item: OutboundItem) -> bool:
+        try:
+            self.queue.put_nowait(item)
+        except self.Full:
+            self.dropped += 1
+            self.log(f"Fila de saida para {self.addr} cheia, descartando mensagem")
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def next_batch(self, first: OutboundItem) -> Tuple[List[OutboundItem], bool]:
+        batch = [first]
+        size = len(first[0])
+        while size < SEND_BATCH_BYTES:
+            try:
+                item = self.queue.get_nowait()
+            except self.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            size += len(item[0])
+        return batch, False
+
+    def live(self, batch: List[OutboundItem]) -> List[OutboundItem]:
+        # Descarta mensagens cujo prazo de envio ja passou (ex.: presas atras de um vizinho fora do ar)
+        now = time.monotonic()
+        alive = [item for item in batch if item[2] is None or item[2] > now]
+        self.expired += len(batch) - len(alive)
+        return alive
+
+    def record_sent(self, batch: List[OutboundItem], size: int):
+        self.backoff = RECONNECT_BACKOFF_MIN
+        if self.failing:
+            self.failing = False
+            self.on_recovered(self.addr)
+        self.sent += len(batch)
+        self.batches += 1
+        self.bytes_sent += size
+        now = time.monotonic()
+        for data, started, _ in batch:
+            if started is not None:
+                self.on_sent(now - started)
+            if not data.endswith(b" HEARTBEAT\n"):
+                self.log(f'\tEnvio feito com sucesso: "{data.decode(errors="backslashreplace").strip()}"')
+
+    def run(self):
+        closing = False
+        while not closing:
+            try:
+                first = self.queue.get(timeout=self.idle_timeout)
+            except self.Empty:
+                if self.on_idle(self):
+                    break
+                continue
+            if first is None:
+                break
+            batch, closing = self.next_batch(first)
+            self.write(batch)
+        if self.sock is not None:
+            self.sock.close()
+
+    def connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect((self.ip, self.port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def write(self, batch: List[OutboundItem]) -> bool:
+        for attempt in range(self.attempts):
+            batch = self.live(batch)
+            if not batch:
+                return False
+            data = b"".join(item[0] for item in batch)
+            try:
+                if self.sock is None:
+                    self.sock = self.connect()
+                self.sock.sendall(data)
+            except OSError as e:
+                self.failing = True
+                self.on_failed(self.addr)
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+                if attempt == self.attempts - 1:
+                    self.log(f"Erro no envio da mensagem para {self.addr}: {e}")
+                    break
+                time.sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, RECONNECT_BACKOFF_MAX)
+                continue
+            self.record_sent(batch, len(data))
+            return True
+        self.dropped += len(batch)
+        return False
+
+    def close(self, timeout: float):
+        started = time.monotonic()
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(max(0.0, timeout - (time.monotonic() - started)))
+
+    def backpressure_stats(self) -> Dict[str, int]:
+        return {
+            "fila": self.queue.qsize(),
+            "fila_max": self.max_depth,
+            "enfileiradas": self.enqueued,
+            "enviadas": self.sent,
+            "descartadas": self.dropped,
+            "expiradas": self.expired,
+            "lotes": self.batches,
+            "bytes": self.bytes_sent,
+        }
+
+
+class AsyncNeighborWriter(NeighborWriter):
+    """Mesma fila de saida do NeighborWriter, esvaziada por uma task no event loop do no."""
+    Full = asyncio.QueueFull
+    Empty = asyncio.QueueEmpty
+
+    def make_queue(self, queue_size: int):
+        return asyncio.Queue(maxsize=queue_size)
+
+    def start(self):
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        closing = False
+        try:
+            while not closing:
+                try:
+                    first = await asyncio.wait_for(self.queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if self.on_idle(self):
+                        break
+                    continue
+                if first is None:
+                    break
+                batch, closing = self.next_batch(first)
+                await self.write(batch)
+        finally:
+            # Tambem quando a task e cancelada no encerramento do no
+            if self.writer is not None:
+                self.writer.close()
+
+    async def write(self, batch: List[OutboundItem]) -> bool:
+        for attempt in range(self.attempts):
+            batch = self.live(batch)
+            if not batch:
+                return False
+            data = b"".join(item[0] for item in batch)
+            try:
+                if self.writer is None or self.writer.is_closing():
+                    _, self.writer = await asyncio.wait_for(asyncio.open_connection(self.ip, self.port), CONNECT_TIMEOUT)
+                    self.writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                self.writer.write(data)
+                await self.writer.drain()
+            except (OSError, asyncio.TimeoutError) as e:
+                self.failing = True
+                self.on_failed(self.addr)
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+                if attempt == self.attempts - 1:
+                    self.log(f"Erro no envio da mensagem para {self.addr}: {e}")
+                    break
+                await asyncio.sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, RECONNECT_BACKOFF_MAX)
+                continue
+            self.record_sent(batch, len(data))
+            return True
+        self.dropped += len(batch)
+        return False
+
+    async def close(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.queue.put(None), timeout)
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+class InlineNeighborWriter(NeighborWriter):
+    """Envia na thread de quem chama, sem fila nem nova tentativa.
+
+    E o comportamento original do send_message, mantido como fanout "sequential"
+    para comparar a latencia de encaminhamento com os writers concorrentes.
+    """
+    attempts = 1
+
+    def start(self):
+        self.sock: Optional[socket.socket] = None
+        self.lock = threading.Lock()
+
+    def put(self, item: OutboundItem) -> bool:
+        with self.lock:
+            self.enqueued += 1
+            return self.write([item])
+
+    def close(self, timeout: float):
+        if self.sock is not None:
+            self.sock.close()
+
+
+class ConnectionManager:
+    """Mantem um writer com fila limitada para cada destino.
+
+    send() so enfileira, entao um vizinho lento ou fora do ar nunca bloqueia quem
+    envia e o encaminhamento para varios vizinhos acontece em paralelo. No modo
+    async os writers sao tasks no event loop do no. Writers ociosos por
+    idle_timeout saem do dicionario; os contadores deles continuam nas estatisticas.
+    """
+
+    def __init__(self, log: Callable[[str], None], queue_size: int = SEND_QUEUE_SIZE,
+                 loop: Optional[asyncio.AbstractEventLoop] = None, fanout: str = "concurrent",
+                 on_failed: Callable[[str], None] = lambda addr: None,
+                 idle_timeout: Optional[float] = WRITER_IDLE_TIMEOUT,
+                 on_recovered: Callable[[str], None] = lambda addr: None):
+        if fanout not in FANOUT_MODES:
+            raise ValueError(f"Modo de fanout invalido: {fanout}")
+        if fanout == "sequential" and loop is not None:
+            raise ValueError("O fanout sequential bloquearia o event loop do transporte async")
+        self.log = log
+        self.queue_size = queue_size
+        self.loop = loop
+        self.writer_class = InlineNeighborWriter if fanout == "sequential" else NeighborWriter
+        self.writers: Dict[str, NeighborWriter] = {}
+        # O writer inline nao tem thread, entao nada o fecha por ociosidade
+        self.idle_timeout = idle_timeout if fanout == "concurrent" else None
+        self.retired: Dict[str, Dict[str, int]] = {}
+        self.on_failed = on_failed
+        self.on_recovered = on_recovered
+        self.lock = threading.Lock()
+        self.forward_latencies: "deque[float]" = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_latency(self, latency: float):
+        self.forward_latencies.append(latency)
+
+    def send(self, neighbor_addr: str, data: bytes, started: Optional[float] = None, deadline: Optional[float] = None):
+        item = (data, started, deadline)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.enqueue_async, neighbor_addr, item)
+            return
+        with self.lock:
+            writer = self.writers.get(neighbor_addr)
+            if writer is None:
+                writer = self.writers[neighbor_addr] = self.writer_class(neighbor_addr, self.queue_size, self.log,
+                                                                         self.record_latency, self.on_failed,
+                                                                         self.idle_timeout, self.retire,
+                                                                         self.on_recovered)
+            if self.idle_timeout is not None:
+                # Enfileira com o lock: o writer ocioso so sai, sob o mesmo lock, com a fila vazia
+                writer.put(item)
+                return
+        writer.put(item)
+
+    def enqueue_async(self, neighbor_addr: str, item: OutboundItem):
+        # Roda no event loop, mas o menu e as estatisticas leem o dicionario de outras threads
+        with self.lock:
+            writer = self.writers.get(neighbor_addr)
+            if writer is None:
+                writer = self.writers[neighbor_addr] = AsyncNeighborWriter(neighbor_addr, self.queue_size, self.log,
+                                                                           self.record_latency, self.on_failed,
+                                                                           self.idle_timeout, self.retire,
+                                                                           self.on_recovered)
+        writer.put(item)
+
+    def retire(self, writer: NeighborWriter) -> bool:
+        """Tira do dicionario um writer ocioso; chamado pela thread (ou task) dele."""
+        with self.lock:
+            if not writer.queue.empty() or self.writers.get(writer.addr) is not writer:
+                return False
+            del self.writers[writer.addr]
+            totals = self.retired.setdefault(writer.addr, {})
+            for name, value in writer.backpressure_stats().items():
+                if name == "fila_max":
+                    totals[name] = max(totals.get(name, 0), value)
+                else:
+                    totals[name] = totals.get(name, 0) + value
+        return True
+
+    def close(self, timeout: float = CONNECT_TIMEOUT):
+        if self.loop is not None:
+            # Passa pelo loop para que os envios enfileirados antes do close ja tenham writer
+            asyncio.run_coroutine_threadsafe(self.close_async(timeout), self.loop).result()
+            return
+        with self.lock:
+            writers = list(self.writers.values())
+            self.writers.clear()
+        # Um unico prazo para todos, para que vizinhos fora do ar nao somem seus timeouts
+        deadline = time.monotonic() + timeout
+        for writer in writers:
+            writer.close(max(0.0, deadline - time.monotonic()))
+
+    async def close_async(self, timeout: float):
+        with self.lock:
+            writers = list(self.writers.values())
+            self.writers.clear()
+        await asyncio.gather(*(writer.close(timeout) for writer in writers))
+
+    async def abort_async(self):
+        """Cancela os writers que ainda restarem (ex.: abertos por respostas depois do close)."""
+        with self.lock:
+            writers = list(self.writers.values())
+            self.writers.clear()
+        for writer in writers:
+            writer.task.cancel()
+        await asyncio.gather(*(writer.task for writer in writers), return_exceptions=True)
+
+    def backpressure_stats(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            stats = {addr: dict(totals) for addr, totals in self.retired.items()}
+            for addr, writer in self.writers.items():
+                current = writer.backpressure_stats()
+                if addr in stats:
+                    for name, value in current.items():
+                        if name == "fila_max":
+                            current[name] = max(value, stats[addr][name])
+                        elif name != "fila":
+                            current[name] = value + stats[addr][name]
+                stats[addr] = current
+            return stats
+
 
 class Node:
-    def __init__(self, ip: str, port: int, neighbors_file: Optional[str] = None, key_value_file: Optional[str] = None):
+    # Um so lock para o stdout do processo: threads, writers e nos de um mesmo hospedeiro
+    # nao intercalam as linhas do log
+    log_lock = threading.Lock()
+
+    def __init__(self, ip: str, port: int, neighbors_file: Optional[str] = None, key_value_file: Optional[str] = None,
+                 transport: str = "thread", verbose: bool = True, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 dedup: str = "exact", dedup_max_entries: int = DEDUP_MAX_ENTRIES, dedup_max_age: float = DEDUP_MAX_AGE,
+                 cache_size: int = 0, cache_ttl: float = RESULT_CACHE_TTL,
+                 fanout: str = "concurrent", send_deadline: float = SEND_DEADLINE, network=None,
+                 summary_depth: int = 0, summary_interval: float = SUMMARY_INTERVAL,
+                 expanding_ring: bool = False, ring_timeout: float = RING_HOP_TIMEOUT,
+                 walkers: int = WALKERS, checkback: int = CHECKBACK_HOPS, coalesce: bool = False,
+                 coalesce_timeout: float = COALESCE_TIMEOUT, wire: str = "text", replication: str = "off",
+                 replica_sample: int = REPLICA_SAMPLE, replica_size: int = REPLICA_STORE_SIZE,
+                 replica_ttl: float = REPLICA_TTL, heartbeat: float = 0.0, trace: bool = False,
+                 trace_file: Optional[str] = None):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Transporte invalido: {transport}")
+        if (transport == "memory") != (network is not None):
+            raise ValueError("O transporte memory precisa de uma rede (network) e so ele a usa")
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"Modo de deduplicacao invalido: {dedup}")
+        if wire not in WIRE_PROTOCOLS:
+            raise ValueError(f"Protocolo invalido: {wire}")
+        if replication not in REPLICATION_POLICIES:
+            raise ValueError(f"Politica de replicacao invalida: {replication}")
+        if wire == "binary" and network is not None:
+            raise ValueError("O protocolo binario so e usado sobre sockets")
         self.ip = ip
         self.port = port
+        self.transport = transport
+        self.verbose = verbose
         self.neighbors: List[str] = []
         self.neighbors_possiveis: List[str] = []
-        self.key_value_store: Dict[str, str] = {}
+        self.key_value_store: Mapping = {}
         self.load_file(neighbors_file, self.neighbors_possiveis)
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.bind((self.ip, self.port))
-        self.server_socket.listen(5)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.server_socket: Optional[socket.socket] = None
+        if network is None:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.ip, self.port))
+            self.server_socket.listen(5)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.network = network
+        self.clock: Callable[[], float] = network.clock if network is not None else time.monotonic
         self.running = True
         self.ttl_default = 100
-        self.message_seen: Set[Tuple[str, str]] = set()
-        self.search_received: Set[Tuple[str, str]] = set()
+        self.message_seen = make_dedup_table(dedup, dedup_max_entries, dedup_max_age, self.clock)
+        self.result_cache = ResultCache(cache_size, cache_ttl, self.clock)
+        # Replicas ficam fora do key_value_store (que continua so com as chaves do arquivo), num
+        # LRU proprio que nao disputa espaco com o cache de resultados
+        self.replication = replication
+        self.replica_sample = replica_sample
+        self.replica_store = ResultCache(replica_size if replication != "off" else 0, replica_ttl, self.clock)
         self.lock = threading.Lock()
-        self.connections: Dict[str, socket.socket] = {}
-        self.visited_nodes: List[str] = []  # Initialize as a list
-        self.vizinhos_pai: List[str] = []  # Initialize as a list
+        self.search_states = SearchStateTable(clock=self.clock)
+        self.pending_queries: Dict[Tuple[str, str], Query] = {}
+        # Buscas de varias chaves iniciadas aqui: seqno -> chave -> consulta ainda sem resposta
+        self.pending_multi: Dict[str, Dict[str, Query]] = {}
+        # Coalescencia: nos com buscas presas as buscas deste no (seqno -> nos) e as respostas
+        # recentes, para avisar quem pedir depois que a busca ja terminou
+        self.coalescing = CoalescingTable(coalesce_timeout, self.clock) if coalesce else None
+        self.coalesce_watchers: Dict[str, List[str]] = {}
+        self.answered_queries: "OrderedDict[str, Tuple[str, str, str, int]]" = OrderedDict()
+        self.queries_lock = threading.Lock()
+        # Um timer de expiracao por vez, enquanto houver consultas pendentes
+        self.expiry_scheduled = False
+        self.seqno_lock = threading.Lock()
         self.seqno = 1  # Inicializa o número de sequência
-        print(f"Servidor criado: {self.ip}:{self.port}\n")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._owns_loop = False
+        # Com heartbeat > 0 as buscas pulam os vizinhos suspeitos ou mortos
+        self.heartbeat = heartbeat
+        self.failure_detector = FailureDetector(heartbeat, clock=self.clock) if heartbeat > 0 else None
+        if self.transport == "async":
+            self.init_event_loop(loop)
+        if network is not None:
+            self.connection_manager = network.attach(self)
+        else:
+            self.connection_manager = ConnectionManager(self.log, loop=self.loop, fanout=fanout,
+                                                        on_failed=self.peer_unreachable,
+                                                        on_recovered=self.peer_reachable)
+        self.send_deadline = send_deadline
+        # Vizinhos que anunciaram WIRE=binary no HELLO/HELLO_OK e recebem SEARCH e VAL em binario
+        self.wire = wire
+        self.binary_peers: Set[str] = set()
+        self.expanding_ring = expanding_ring
+        self.ring_timeout = ring_timeout
+        self.walkers = walkers
+        self.checkback = checkback
+        self.log(f"Servidor criado: {self.ip}:{self.port}\n")
         self.stats = self.initialize_stats()
+        self.metrics = NodeMetrics()
+        # Coletas de STATS iniciadas aqui: seqno -> no -> metricas recebidas
+        self.stats_replies: Dict[str, Dict[str, dict]] = {}
+        # Com trace as buscas iniciadas aqui levam T= e os rastros que voltam ficam em traces (e
+        # numa linha JSON cada em trace_file); os instantes seguem o relogio virtual no simulador
+        self.trace = trace or trace_file is not None
+        self.trace_file = trace_file
+        self.trace_clock: Callable[[], float] = network.clock if network is not None else time.time
+        self.traces: "deque[dict]" = deque(maxlen=TRACE_STORE)
+        self.trace_lock = threading.Lock()
 
+        if key_value_file and is_key_value_index(key_value_file):
+            self.key_value_store = MappedKeyValueStore(key_value_file)
+            self.log(f"Indice chave-valor {key_value_file} aberto: {len(self.key_value_store)} chaves")
+        else:
+            self.load_file(key_value_file, self.key_value_store, is_key_value=True)
+        # Resumos de chaves (filtros de Bloom atenuados): o nivel 0 sao as chaves deste no e o
+        # nivel i junta o nivel i-1 dos vizinhos. Com summary_depth 0 nada e trocado.
+        self.summary_depth = summary_depth
+        self.summary_interval = summary_interval
+        self.key_summary = self.build_key_summary() if summary_depth > 0 else None
+        # Niveis saturados ficam como None
+        self.neighbor_summaries: Dict[str, List[Optional[BloomFilter]]] = {}
+        self.sent_summaries: Dict[str, List[Optional[bytearray]]] = {}
         self.initialize_neighbors()
-        self.load_file(key_value_file, self.key_value_store, is_key_value=True)
+
+    def log(self, message: str):
+        if self.verbose:
+            with self.log_lock:
+                print(message)
+
+    def call_later(self, delay: float, callback: Callable[[], None]):
+        """Agenda callback sem bloquear: no event loop, na rede simulada ou numa thread de timer."""
+        if self.network is not None:
+            self.network.schedule(delay, callback)
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+        else:
+            timer = threading.Timer(delay, callback)
+            timer.daemon = True
+            timer.start()
+
+    def init_event_loop(self, loop: Optional[asyncio.AbstractEventLoop]):
+        # No modo async um unico event loop cuida de accept, leitura e envio para todos os vizinhos.
+        # O loop pode ser compartilhado entre varios nos do mesmo processo.
+        self._client_tasks: Set[asyncio.Task] = set()
+        self._async_server: Optional[asyncio.AbstractServer] = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._owns_loop = True
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+        self.loop = loop
 
     def initialize_stats(self) -> Dict[str, int or List[int]]:
         return {
             "Total de mensagens de flooding vistas": 0,
             "Total de mensagens de random walk vistas": 0,
             "Total de mensagens de busca em profundidade vistas": 0,
+            "Total de mensagens de busca guiada vistas": 0,
+            "Total de mensagens de anel expansivo vistas": 0,
+            "Rodadas de anel expansivo": 0,
+            "Total de mensagens de k random walks vistas": 0,
+            "Consultas de walkers a origem": 0,
+            "Buscas respondidas por replica": 0,
+            "Replicas recebidas": 0,
+            "Total de mensagens recebidas": 0,
             "flooding_hops": [],
             "random_walk_hops": [],
-            "depth_first_hops": []
+            "depth_first_hops": [],
+            "guided_hops": [],
+            "expanding_ring_hops": [],
+            "k_walker_hops": []
         }
 
     def load_file(self, filename: Optional[str], storage: List[str] or Dict[str, str], is_key_value: bool = False):
@@ -50,41 +1488,180 @@ class Node:
                     if is_key_value:
                         key, value = line.strip().split()
                         storage[key] = value
-                        print(f"Adicionando par ({key}, {value}) na tabela local")
+                        self.log(f"Adicionando par ({key}, {value}) na tabela local")
                     else:
                         storage.append(line.strip())
 
     def initialize_neighbors(self):
         for neighbor in self.neighbors_possiveis:
-            print(f"Tentando adicionar vizinho {neighbor}")
+            self.log(f"Tentando adicionar vizinho {neighbor}")
             self.send_hello_message(neighbor)
 
     def send_hello_message(self, neighbor: str):
         neighbor_ip, neighbor_port = neighbor.split(':')
-        message = f"{self.ip}:{self.port} {self.seqno} 1 HELLO\n"
-        self.seqno += 1
+        message = f"{self.ip}:{self.port} {self.next_seqno()} 1 HELLO{self.summary_field(neighbor)}{self.wire_field()}\n"
         try:
             self.send_message(neighbor_ip, int(neighbor_port), message)
         except socket.error:
             print(f"\tErro ao conectar com {neighbor_ip}:{neighbor_port}")
     def send_hello_ok_message(self, neighbor: str):
         neighbor_ip, neighbor_port = neighbor.split(':')
-        message = f"{self.ip}:{self.port} {self.seqno} 1 HELLO_OK\n"
-        self.seqno += 1
+        message = f"{self.ip}:{self.port} {self.next_seqno()} 1 HELLO_OK{self.summary_field(neighbor)}{self.wire_field()}\n"
         try:
             self.send_message(neighbor_ip, int(neighbor_port), message)
         except socket.error:
             print(f"\tErro ao conectar com {neighbor_ip}:{neighbor_port}")
 
-    def start(self):
-        threading.Thread(target=self.accept_connections).start()
-        self.menu()
+    def wire_field(self) -> str:
+        return " WIRE=binary" if self.wire == "binary" else ""
+
+    def handle_hello_fields(self, origin: str, fields: List[str]):
+        # Campos opcionais do HELLO/HELLO_OK: o resumo de chaves e o anuncio do protocolo binario
+        for field in fields:
+            if field.startswith("WIRE="):
+                if field == "WIRE=binary" and self.wire == "binary":
+                    self.binary_peers.add(origin)
+            else:
+                self.handle_summary(origin, field)
+
+    def build_key_summary(self) -> Optional[BloomFilter]:
+        summary = BloomFilter(SUMMARY_CAPACITY, SUMMARY_ERROR_RATE)
+        for count, key in enumerate(self.key_value_store, 1):
+            summary.add(key)
+            # Com um indice de milhoes de chaves nao vale percorrer tudo: ja saturou
+            if count % SUMMARY_CAPACITY == 0 and summary.false_positive_rate() > SUMMARY_MAX_FALSE_RATE:
+                break
+        if summary.false_positive_rate() > SUMMARY_MAX_FALSE_RATE:
+            self.log(f"Resumo de chaves saturado com {len(self.key_value_store)} chaves: nao sera anunciado")
+            return None
+        return summary
+
+    def summary_for(self, neighbor: str) -> List[BloomFilter]:
+        # O vizinho nao recebe de volta o que ele mesmo anunciou
+        levels = [self.key_summary]
+        for level in range(1, self.summary_depth):
+            merged = BloomFilter(SUMMARY_CAPACITY, SUMMARY_ERROR_RATE)
+            for other, filters in list(self.neighbor_summaries.items()):
+                if other != neighbor and len(filters) >= level and filters[level - 1] is not None:
+                    merged.update(filters[level - 1])
+            levels.append(merged if merged.false_positive_rate() <= SUMMARY_MAX_FALSE_RATE else None)
+        return levels
+
+    def summary_field(self, neighbor: str) -> str:
+        if not self.summary_depth:
+            return ""
+        levels = self.summary_for(neighbor)
+        self.sent_summaries[neighbor] = [level.bits if level is not None else None for level in levels]
+        return " " + ",".join(level.encode() if level is not None else SUMMARY_SATURATED for level in levels)
+
+    def push_summaries(self):
+        """Manda SUMMARY aos vizinhos cujo resumo mudou desde o ultimo envio."""
+        with self.lock:
+            neighbors = list(self.neighbors)
+        for neighbor in neighbors:
+            levels = self.summary_for(neighbor)
+            if self.sent_summaries.get(neighbor) == [level.bits if level is not None else None for level in levels]:
+                continue
+            neighbor_ip, neighbor_port = neighbor.split(':')
+            message = f"{self.ip}:{self.port} {self.next_seqno()} 1 SUMMARY{self.summary_field(neighbor)}\n"
+            self.send_message(neighbor_ip, int(neighbor_port), message)
+
+    def refresh_summaries(self):
+        # Cada rodada propaga os resumos um nivel adiante; reenviar so o que mudou evita que
+        # cada atualizacao recebida dispare uma cascata de SUMMARY pela rede
+        while self.running:
+            time.sleep(self.summary_interval)
+            if self.running:
+                self.push_summaries()
+
+    def monitor_neighbors(self):
+        rounds = 0
+        while self.running:
+            time.sleep(self.heartbeat)
+            if self.running:
+                self.send_heartbeats(rounds)
+                rounds += 1
+
+    def send_heartbeats(self, rounds: int):
+        for peer, state in self.failure_detector.check():
+            self.log(f"Vizinho {peer} agora {state}")
+        with self.lock:
+            neighbors = list(self.neighbors)
+        message = f"{self.ip}:{self.port} {self.next_seqno()} 1 HEARTBEAT\n".encode()
+        for neighbor in neighbors:
+            # Um vizinho morto so recebe uma sonda de vez em quando, para notar que voltou
+            if self.failure_detector.state(neighbor) != "dead" or rounds % DEAD_PROBE_EVERY == 0:
+                self.metrics.sent["HEARTBEAT"] += 1
+                self.connection_manager.send(neighbor, message)
+
+    def handle_heartbeat(self, origin: str):
+        if self.failure_detector is None:
+            return
+        with self.lock:
+            if origin not in self.neighbors:
+                return
+        if self.failure_detector.heard(origin):
+            self.log(f"Vizinho {origin} voltou a responder")
+
+    def peer_unreachable(self, peer: str):
+        if self.failure_detector is not None:
+            self.failure_detector.failed(peer)
+
+    def peer_reachable(self, peer: str):
+        if self.failure_detector is not None and self.failure_detector.delivered(peer):
+            self.log(f"Vizinho {peer} voltou a aceitar envios")
+
+    def peer_contacted(self, peer: str):
+        if self.failure_detector.contacted(peer):
+            self.log(f"Vizinho {peer} voltou a responder")
+
+    def search_neighbors(self) -> List[str]:
+        """Vizinhos para onde as buscas podem seguir: sem detector, todos; com ele, so os vivos."""
+        if self.failure_detector is None:
+            return self.neighbors
+        return [neighbor for neighbor in self.neighbors if self.failure_detector.available(neighbor)]
+
+    def handle_summary(self, origin: str, summary: str):
+        if not self.summary_depth:
+            return
+        filters = []
+        for level in summary.split(",")[:self.summary_depth]:
+            bloom = BloomFilter.decode(level, SUMMARY_CAPACITY, SUMMARY_ERROR_RATE) if level != SUMMARY_SATURATED else None
+            # Um filtro saturado (ex.: de um no mais antigo) apontaria para o vizinho em toda busca
+            filters.append(bloom if bloom is not None and bloom.false_positive_rate() <= SUMMARY_MAX_FALSE_RATE
+                           else None)
+        with self.lock:
+            if origin not in self.neighbors:
+                return
+        self.neighbor_summaries[origin] = filters
+
+    def summary_level(self, neighbor: str, key: str) -> Optional[int]:
+        """Menor nivel do resumo do vizinho que pode conter a chave, ou None."""
+        for level, summary in enumerate(self.neighbor_summaries.get(neighbor, ())):
+            if summary is not None and key in summary:
+                return level
+        return None
+
+    def start(self, interactive: bool = True):
+        if self.transport == "async":
+            asyncio.run_coroutine_threadsafe(self.serve_async(), self.loop).result()
+        elif self.transport == "thread":
+            threading.Thread(target=self.accept_connections, daemon=True).start()
+        if self.summary_depth and self.transport != "memory":
+            threading.Thread(target=self.refresh_summaries, daemon=True).start()
+        if self.failure_detector is not None and self.transport != "memory":
+            threading.Thread(target=self.monitor_neighbors, daemon=True).start()
+        if interactive:
+            self.menu()
+
+    async def serve_async(self):
+        self._async_server = await asyncio.start_server(self.handle_client_async, sock=self.server_socket)
 
     def accept_connections(self):
         while self.running:
             try:
                 client_socket, client_ip = self.server_socket.accept()
-                threading.Thread(target=self.handle_client, args=(client_socket,)).start()
+                threading.Thread(target=self.handle_client, args=(client_socket,), daemon=True).start()
             except socket.error as e:
                 if self.running:
                     print(f"Socket error: {e}")
@@ -93,218 +1670,553 @@ class Node:
     def handle_client(self, client_socket: socket.socket):
         with client_socket:
             client_socket.settimeout(None)
+            framer = MessageFramer()
+            buffer = bytearray(RECV_BUFFER_SIZE)
+            view = memoryview(buffer)
+            self.metrics.connections += 1
             try:
                 while True:
-                    message = client_socket.recv(1024).decode()
-                    if not message:
+                    received = client_socket.recv_into(buffer)
+                    if not received:
                         break
-                    self.process_message(message, client_socket)
+                    self.metrics.bytes_in += received
+                    self.process_messages(framer.feed(view[:received]), client_socket)
             except socket.error as e:
                 print(f"Socket error: {e}")
             except Exception as e:
                 print(f"Unexpected error: {e}")
+            finally:
+                self.metrics.connections -= 1
 
-    def process_message(self, message: str, client_socket: socket.socket):
+    async def handle_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        framer = MessageFramer()
+        self.metrics.connections += 1
+        try:
+            while self.running:
+                data = await reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                self.metrics.bytes_in += len(data)
+                self.process_messages(framer.feed(data), writer)
+        except (ConnectionError, OSError) as e:
+            print(f"Socket error: {e}")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+        finally:
+            self.metrics.connections -= 1
+            self._client_tasks.discard(task)
+            writer.close()
+
+    def process_messages(self, messages: List[str], client_socket):
+        self.stats["Total de mensagens recebidas"] += len(messages)
+        record = self.metrics.processing.record
+        # Chegada do lote, para os rastros: a diferenca ate o inicio de cada mensagem e a fila dela
+        arrived = self.trace_clock()
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                if isinstance(message, str):
+                    self.process_message(message, client_socket, arrived)
+                else:
+                    self.process_frame(message, client_socket, arrived)
+            except (ValueError, IndexError, struct.error) as e:
+                self.log(f'Mensagem invalida descartada "{message.strip()}": {e}')
+            record(time.perf_counter() - started)
+
+    def process_frame(self, frame: bytearray, client_socket, arrived: Optional[float] = None):
+        (origin, seqno, ttl, operation, mode, last_hop_ip, last_hop_port, hop_count, key,
+         extra) = decode_binary(frame)
+        self.metrics.received[operation] += 1
+        if ttl <= 0:
+            self.metrics.dropped_ttl += 1
+            self.log("TTL igual a zero, descartando mensagem")
+            return
+        self.log(f"Mensagem binaria recebida: {origin} {seqno} {ttl} {operation} {mode} {key} {hop_count}")
+        if self.failure_detector is not None:
+            self.peer_contacted(f"{last_hop_ip}:{last_hop_port}" if operation == "SEARCH" else origin)
+        if operation == "SEARCH":
+            options = dict(field.split("=", 1) for field in extra.split())
+            self.handle_search(origin, seqno, ttl, mode, last_hop_ip, last_hop_port, key, hop_count, client_socket,
+                               options, frame, arrived)
+        else:
+            self.handle_val(mode, key, extra, hop_count, seqno)
+
+    def process_message(self, message: str, client_socket: socket.socket, arrived: Optional[float] = None):
         parts = message.split()
         origin, seqno, ttl, operation = parts[:4]
         ttl = int(ttl)
+        self.metrics.received[operation] += 1
 
         if ttl <= 0:
-            print("TTL igual a zero, descartando mensagem")
+            self.metrics.dropped_ttl += 1
+            self.log("TTL igual a zero, descartando mensagem")
+            return
+        if operation == "HEARTBEAT":
+            # Chega a cada intervalo de cada vizinho: fica fora do log
+            self.handle_heartbeat(origin)
             return
+        if self.failure_detector is not None:
+            # Qualquer mensagem de um vizinho vigiado mostra que ele esta no ar; no SEARCH quem
+            # entregou e o ultimo salto, nao a origem
+            self.peer_contacted(f"{parts[5]}:{parts[6]}" if operation == "SEARCH" else origin)
 
-        print(f'Mensagem recebida: "{message.strip()}"')
+        self.log(f'Mensagem recebida: "{message.strip()}"')
 
         if operation == "HELLO":
+            # Os campos vem depois: o resumo so e aceito de quem ja esta na tabela de vizinhos
             self.handle_hello(origin, client_socket)
+            self.handle_hello_fields(origin, parts[4:])
         elif operation == "HELLO_OK":
-            print(f"Received HELLO_OK from {origin}")
+            self.log(f"Received HELLO_OK from {origin}")
             self.handle_hello_ok(origin, client_socket)
+            self.handle_hello_fields(origin, parts[4:])
+        elif operation == "SUMMARY":
+            self.handle_summary(origin, parts[4])
         elif operation == "SEARCH":
-            mode, last_hop_ip, last_hop_port, key, hop_count = parts[4:]
+            mode, last_hop_ip, last_hop_port, key, hop_count = parts[4:9]
             hop_count = int(hop_count)
-            self.handle_search(origin, seqno, ttl, mode, last_hop_ip, last_hop_port, key, hop_count, client_socket)
+            # Campos extras opcionais NOME=valor depois do hop_count, usados por alguns modos
+            options = dict(field.split("=", 1) for field in parts[9:])
+            self.handle_search(origin, seqno, ttl, mode, last_hop_ip, last_hop_port, key, hop_count, client_socket,
+                               options, arrived=arrived)
         elif operation == "VAL":
-            mode, key, value, hop_count = parts[4:]
-            self.handle_val(mode, key, value, int(hop_count))
+            mode, key, value, hop_count = parts[4:8]
+            # N=1: aviso para um no com buscas presas a busca que recebeu esta resposta; T: rastro
+            options = dict(field.split("=", 1) for field in parts[8:])
+            self.handle_val(mode, key, value, int(hop_count), seqno, notice="N" in options, trace=options.get("T"),
+                            arrived=arrived)
+        elif operation == "VALS":
+            mode, hop_count = parts[4:6]
+            self.handle_vals(mode, dict(zip(parts[6::2], parts[7::2])), int(hop_count), seqno)
         elif operation == "BYE":
             self.handle_bye(origin)
+        elif operation == "CHECK":
+            self.handle_check(origin, seqno, parts[4])
+        elif operation == "CONTINUE":
+            self.handle_continue(origin, seqno, parts[4])
+        elif operation == "WAIT":
+            self.handle_wait(origin, seqno, parts[4])
+        elif operation == "REPLICA":
+            self.handle_replica(parts[4], parts[5])
+        elif operation == "STATS":
+            self.handle_stats_request(origin, seqno, ttl)
+        elif operation == "STATS_OK":
+            self.handle_stats_reply(origin, seqno, message.split(None, 4)[4])
 
     def handle_hello(self, origin: str, client_socket: socket.socket):
+        if self.failure_detector is not None:
+            # Um vizinho que reinicia se apresenta de novo: volta a contar como vivo
+            self.failure_detector.forget(origin)
         with self.lock:
             if origin not in self.neighbors:
                 self.neighbors.append(origin)
-                print(f"Adicionando vizinho na tabela: {origin}")
-                self.seqno += 1
+                self.log(f"Adicionando vizinho na tabela: {origin}")
+                self.next_seqno()
                 self.send_hello_ok_message(origin)
             else:
-                print(f"Vizinho já está na tabela: {origin}")
+                self.log(f"Vizinho já está na tabela: {origin}")
     def handle_hello_ok(self, origin: str, client_socket: socket.socket):
         with self.lock:
             if origin not in self.neighbors:
                 self.neighbors.append(origin)
-                print(f"Adicionando vizinho na tabela: {origin}")
+                self.log(f"Adicionando vizinho na tabela: {origin}")
             else:
-                print(f"Vizinho já está na tabela: {origin}")
+                self.log(f"Vizinho já está na tabela: {origin}")
 
     def handle_bye(self, origin: str):
         with self.lock:
             if origin in self.neighbors:
                 self.neighbors.remove(origin)
-                print(f"Removendo vizinho da tabela: {origin}")
+                self.log(f"Removendo vizinho da tabela: {origin}")
+        self.neighbor_summaries.pop(origin, None)
+        self.sent_summaries.pop(origin, None)
+        self.binary_peers.discard(origin)
+        if self.failure_detector is not None:
+            self.failure_detector.forget(origin)
 
-    def send_response(self, client_socket: Optional[socket.socket], response: str):
+    def send_response(self, client_socket, response: str):
         if client_socket:
             try:
-                client_socket.sendall(response.encode())
-                print(f"Sent {response.strip()}")
+                if isinstance(client_socket, asyncio.StreamWriter):
+                    client_socket.write(response.encode())
+                else:
+                    client_socket.sendall(response.encode())
+                self.log(f"Sent {response.strip()}")
             except socket.error as e:
                 print(f"Socket error: {e}")
         else:
-            print("Client socket is None, cannot send response")
+            self.log("Client socket is None, cannot send response")
 
-    def send_message(self, neighbor_ip: str, neighbor_port: int, message: str):
+    def send_message(self, neighbor_ip: str, neighbor_port: int, message: str or WireMessage,
+                     started: Optional[float] = None, deadline: Optional[float] = None):
         neighbor_addr = f"{neighbor_ip}:{neighbor_port}"
-        print(f'Encaminhando mensagem "{message.strip()}" para {neighbor_addr}')
-        try:
-            neighbor_socket = self.connections.get(neighbor_addr)
-            if neighbor_socket is None or neighbor_socket.fileno() == -1:
-                neighbor_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                neighbor_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                neighbor_socket.settimeout(5)
-                neighbor_socket.connect((neighbor_ip, neighbor_port))
-                self.connections[neighbor_addr] = neighbor_socket
-
-            neighbor_socket.sendall(message.encode())
-            print(f'\tEnvio feito com sucesso: "{message.strip()}"')
-        except socket.error as e:
-            print(f"Erro no envio da mensagem para {neighbor_addr}: {e}")
-            self.connections.pop(neighbor_addr, None)
-            try:
-                neighbor_socket.close()
-            except:
-                pass
-        except Exception as e:
-            print(f"Unexpected error while sending to {neighbor_addr}: {e}")
-            self.connections.pop(neighbor_addr, None)
-            try:
-                neighbor_socket.close()
-            except:
-                pass
+        if isinstance(message, WireMessage):
+            self.metrics.sent[message.operation] += 1
+            data = message.binary() if neighbor_addr in self.binary_peers else None
+            if data is None:
+                data = message.text()
+        else:
+            self.metrics.sent[message.split(None, 4)[3]] += 1
+            data = message.encode()
+        if self.verbose:
+            self.log(f'Encaminhando mensagem "{str(message).strip()}" para {neighbor_addr}')
+        self.connection_manager.send(neighbor_addr, data, started, deadline)
+
+    def search_message(self, origin: str, seqno: str, ttl: int, mode: str, key: str, hop_count: int, extra: str = "",
+                       frame: Optional[bytearray] = None) -> WireMessage:
+        return WireMessage(origin, seqno, ttl, "SEARCH", mode, f"{self.ip}:{self.port}", hop_count, key, extra, frame)
+
+    async def shutdown_async(self):
+        if self._async_server is not None:
+            self._async_server.close()
+        tasks = list(self._client_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Sem isso as tasks dos writers ficam pendentes quando o loop para
+        await self.connection_manager.abort_async()
 
-    def handle_search(self, origin: str, seqno: str, ttl: int, mode: str, last_hop_ip: str, last_hop_port: str, key: str, hop_count: int, client_socket: Optional[socket.socket] = None):
+    def handle_search(self, origin: str, seqno: str, ttl: int, mode: str, last_hop_ip: str, last_hop_port: str, key: str, hop_count: int, client_socket: Optional[socket.socket] = None,
+                      options: Optional[Dict[str, str]] = None, frame: Optional[bytearray] = None,
+                      arrived: Optional[float] = None):
+        options = options or {}
+        trace = options.get("T")
+        if trace is not None:
+            started = self.trace_clock()
+            arrived = arrived if arrived is not None else started
         message_id = (last_hop_ip, last_hop_port, origin, seqno)
-        search_id = (origin, seqno)
-        if search_id not in self.search_received:
-            self.visited_nodes.clear()
-        else:
-            self.search_received.add(search_id)
+        if mode in ("RW", "BG", "ER", "KW"):
+            # O passeio pode voltar por uma aresta ja usada e cada rodada do anel expansivo repassa
+            # pelas mesmas arestas; o TTL distingue cada passo e cada rodada, e W cada walker
+            message_id += (ttl, options.get("W"))
         if message_id in self.message_seen:
-            print(F"MESSAGE_ID:{message_id}")
-            print("Message already seen, discarding")
+            self.metrics.dropped_dedup += 1
+            self.log(F"MESSAGE_ID:{message_id}")
+            self.log("Message already seen, discarding")
             return
         self.message_seen.add(message_id)
 
-        if key in self.key_value_store:
-            value = self.key_value_store[key]
-            response = f"{self.ip}:{self.port} {seqno} {ttl} VAL {mode} {key} {value} {hop_count}\n"
-            self.send_response(client_socket, response)
-            self.send_message(origin.split(':')[0], int(origin.split(':')[1]), response)
+        path = options.get("R", "")
+        multi_key = "B" in options
+        if multi_key:
+            remaining = self.answer_keys(origin, seqno, ttl, mode, key, hop_count, client_socket, path)
+            if not remaining:
+                return
+            if remaining != key:
+                # Chaves a menos: o frame recebido nao serve mais para o repasse
+                key, frame = remaining, None
+            value = None
+        else:
+            value = self.lookup_key(key)
+        if value is not None:
+            responder = f"{self.ip}:{self.port}"
+            if trace is not None:
+                # O VAL binario nao tem campos extras: com rastro a resposta vai em texto
+                trace = trace_hop(trace, responder, arrived, started, self.trace_clock())
+                response = f"{responder} {seqno} {ttl} VAL {mode} {key} {value} {hop_count} T={trace}"
+            else:
+                response = WireMessage(responder, seqno, ttl, "VAL", mode, responder, hop_count, key, value)
+            self.send_response(client_socket, str(response) + "\n")
+            self.send_message(origin.split(':')[0], int(origin.split(':')[1]),
+                              response + "\n" if trace is not None else response)
+            # So o dono replica: num flooding muitos nos com replica respondem a mesma busca, e se
+            # cada um replicasse de novo as copias se multiplicariam a cada busca
+            if path and self.replication != "off" and key in self.key_value_store:
+                self.replicate(seqno, key, value, path.split(","))
             return
 
         ttl -= 1
         if ttl <= 0:
-            print("TTL expired, discarding message")
+            self.metrics.dropped_ttl += 1
+            self.log("TTL expired, discarding message")
             return
 
+        if self.coalescing is not None and mode in COALESCE_MODES and not multi_key:
+            attached, watch = self.coalescing.attach(key, (origin, seqno), mode, hop_count)
+            if attached:
+                self.log(f"Busca por {key} presa a outra busca em andamento, nao sera repassada")
+                if watch is not None and watch[0] != f"{self.ip}:{self.port}":
+                    # Pede a origem da busca repassada que mande o VAL tambem para este no
+                    owner_ip, owner_port = watch[0].split(':')
+                    self.send_message(owner_ip, int(owner_port), f"{self.ip}:{self.port} {watch[1]} 1 WAIT {key}\n")
+                return
+
+        # O caminho segue adiante mesmo por nos que nao replicam; os que replicam se acrescentam
+        address = f"{self.ip}:{self.port}"
+        if self.replication != "off" and origin != address:
+            route = path.split(",") if path else []
+            if address in route:
+                # Voltou a um no do caminho (retrocesso da BP, passeio em ciclo): corta o laco
+                del route[route.index(address):]
+            path = ",".join((route + [address])[-REPLICA_PATH_MAX:])
+        extra = (" B=1" if multi_key else "") + (f" R={path}" if path else "")
+        if trace is not None:
+            extra += f" T={trace_hop(trace, address, arrived, started, self.trace_clock())}"
+
         hop_count += 1
         if mode == "FL":
-            self.flood_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port)
+            self.flood_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, extra=extra, frame=frame)
         elif mode == "RW":
-            self.random_walk_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port)
+            self.random_walk_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, extra=extra,
+                                    frame=frame)
         elif mode == "BP":
-            self.depth_first_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port)
+            self.depth_first_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, extra=extra,
+                                    frame=frame)
+        elif mode == "BG":
+            self.guided_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, extra=extra, frame=frame)
+        elif mode == "ER":
+            self.expanding_ring_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, extra=extra,
+                                       frame=frame)
+        elif mode == "KW":
+            self.k_walker_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, options, extra=extra,
+                                 frame=frame)
         else:
             print("Invalid search mode")
             return
 
-    def flood_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str):
-        print(f"recebi de {last_hop_ip}:{last_hop_port}")
-        for neighbor in self.neighbors:
+    def lookup_key(self, key: str) -> Optional[str]:
+        value = self.key_value_store.get(key)
+        if value is None:
+            value = self.replica_store.get(key)
+            if value is not None:
+                self.stats["Buscas respondidas por replica"] += 1
+                self.log(f"Chave {key} respondida por uma replica")
+        if value is None:
+            value = self.result_cache.get(key)
+            if value is not None:
+                self.log(f"Chave {key} respondida pelo cache de resultados")
+        return value
+
+    def answer_keys(self, origin: str, seqno: str, ttl: int, mode: str, keys: str, hop_count: int,
+                    client_socket, path: str) -> str:
+        """Responde num VALS as chaves da busca de varias chaves que este no tem; devolve as que faltam."""
+        found = []
+        remaining = []
+        for key in keys.split(MULTI_KEY_SEPARATOR):
+            value = self.lookup_key(key)
+            if value is None:
+                remaining.append(key)
+            else:
+                found.append((key, value))
+        if found:
+            responder = f"{self.ip}:{self.port}"
+            pairs = " ".join(f"{key} {value}" for key, value in found)
+            response = f"{responder} {seqno} {ttl} VALS {mode} {hop_count} {pairs}\n"
+            self.send_response(client_socket, response)
+            self.send_message(origin.split(':')[0], int(origin.split(':')[1]), response)
+            if path and self.replication != "off":
+                for key, value in found:
+                    if key in self.key_value_store:
+                        self.replicate(seqno, key, value, path.split(","))
+        return MULTI_KEY_SEPARATOR.join(remaining)
+
+    def flood_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                     mode: str = "FL", extra: str = "", frame: Optional[bytearray] = None):
+        self.log(f"recebi de {last_hop_ip}:{last_hop_port}")
+        # A mensagem e a mesma para todos os vizinhos; cada writer envia em paralelo e
+        # descarta a copia que nao sair dentro do prazo
+        started = self.clock()
+        deadline = started + self.send_deadline
+        new_message = self.search_message(origin, seqno, ttl, mode, key, hop_count, extra, frame)
+        for neighbor in self.search_neighbors():
             neighbor_ip, neighbor_port = neighbor.split(':')
             if neighbor_port != last_hop_port or neighbor_ip != last_hop_ip:
-                new_message = f"{origin} {seqno} {ttl} SEARCH FL {self.ip} {self.port} {key} {hop_count}\n"
-                self.send_message(neighbor_ip, int(neighbor_port), new_message)
-
-    def random_walk_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str): # Clear visited nodes at the start of the search
-        candidate_neighbors = [n for n in self.neighbors if n.split(':')[1] != last_hop_port or n.split(':')[0] != last_hop_ip and n not in self.visited_nodes]
-        print(f"recebi de {last_hop_ip}:{last_hop_port}")
-        if not candidate_neighbors:
-            if f"{self.ip}:{self.port}" == origin:
-                print(f"BP: Não foi possível localizar a chave {key}")
-                return
-            else:
-                print(f"BP: Não foi possível localizar a chave {key}")
-                neighbor = f"{last_hop_ip}:{last_hop_port}"
-        else:
-            # Separar o nó de origem dos candidatos
-            origin_ip, origin_port = origin.split(':')
-            non_origin_neighbors = [n for n in candidate_neighbors if n != f"{origin_ip}:{origin_port}" and n not in self.visited_nodes]
-        
-            if non_origin_neighbors:
-                neighbor = random.choice(non_origin_neighbors)
-                non_pai_neighbors = [n for n in non_origin_neighbors if n not in self.vizinhos_pai and n not in self.visited_nodes]
-                if non_pai_neighbors:
-                    neighbor = random.choice(non_pai_neighbors)
-                else:
-                    non_pai_neighbors = [n for n in non_pai_neighbors if n not in self.visited_nodes]
-                    neighbor = random.choice(non_pai_neighbors)
+                self.send_message(neighbor_ip, int(neighbor_port), new_message, started, deadline)
+
+    def expanding_ring_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                              extra: str = "", frame: Optional[bytearray] = None):
+        # Uma rodada so e repassada se for mais longe que as anteriores (ou que outra copia desta
+        # rodada) ja foram a partir deste no
+        state, _ = self.search_states.get((origin, seqno))
+        if ttl <= state.reach:
+            self.log("Rodada do anel ja repassada daqui com TTL maior ou igual, descartando")
+            return
+        state.reach = ttl
+        self.flood_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, mode="ER", extra=extra,
+                          frame=frame)
+
+    def ring_wait_scale(self, query: Query) -> float:
+        """Fator das esperas das rodadas do anel para que todas caibam na metade do prazo da busca.
+
+        A outra metade fica para a ultima rodada, com o TTL cheio, ir e voltar.
+        """
+        waits = 0.0
+        radius = 1
+        while radius + 1 < self.ttl_default:
+            waits += self.ring_timeout * (radius + 1)
+            radius *= 2
+        budget = (query.deadline - query.started) / 2
+        return min(1.0, budget / waits) if waits else 1.0
+
+    def expanding_ring_round(self, query: Query, radius: int, scale: Optional[float] = None):
+        if query.done.is_set():
+            return
+        if scale is None:
+            scale = self.ring_wait_scale(query)
+        self.stats["Rodadas de anel expansivo"] += 1
+        # Um raio de r saltos e um TTL r + 1: a origem tambem desconta um
+        ttl = min(radius + 1, self.ttl_default)
+        self.handle_search(f"{self.ip}:{self.port}", query.seqno, ttl, "ER", self.ip, self.port, query.key, 0,
+                           options=self.trace_options())
+        if ttl < self.ttl_default:
+            # A rodada espera o tempo de ida ate a borda do anel e a volta direta do VAL, encurtado
+            # quando as rodadas somadas passariam do prazo da busca
+            self.call_later(self.ring_timeout * (radius + 1) * scale,
+                            lambda: self.expanding_ring_round(query, radius * 2, scale))
+
+    def pick_next_hop(self, state: SearchState, origin: str, last_hop: str) -> Optional[str]:
+        # Prefere vizinhos que ainda nao receberam esta busca daqui e que nao sao a origem nem o pai
+        candidates = [n for n in self.search_neighbors() if n != last_hop and n != state.parent and n not in state.visited]
+        preferred = [n for n in candidates if n != origin]
+        if preferred:
+            return random.choice(preferred)
+        if candidates:
+            return random.choice(candidates)
+        return None
+
+    def random_walk_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                           mode: str = "RW", extra: str = "", frame: Optional[bytearray] = None):
+        self.log(f"recebi de {last_hop_ip}:{last_hop_port}")
+        state, _ = self.search_states.get((origin, seqno))
+        last_hop = f"{last_hop_ip}:{last_hop_port}"
+        neighbor = self.pick_next_hop(state, origin, last_hop)
+        if neighbor is None:
+            # Todos os vizinhos ja receberam o passeio daqui: segue ao acaso ate o TTL acabar
+            neighbors = self.search_neighbors()
+            others = [n for n in neighbors if n != last_hop]
+            if others:
+                neighbor = random.choice(others)
+            elif last_hop in neighbors:
+                neighbor = last_hop
             else:
-                neighbor = f"{origin_ip}:{origin_port}"
+                self.log(f"RW: Não foi possível localizar a chave {key}")
+                return
 
-        self.visited_nodes.append(neighbor)
+        state.visited.add(neighbor)
         neighbor_ip, neighbor_port = neighbor.split(':')
-        new_message = f"{origin} {seqno} {ttl} SEARCH RW {self.ip} {self.port} {key} {hop_count}\n"
+        new_message = self.search_message(origin, seqno, ttl, mode, key, hop_count, extra, frame)
         self.send_message(neighbor_ip, int(neighbor_port), new_message)
 
-    def depth_first_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str):# Clear visited nodes at the start of the search
-        print(f"recebi de {last_hop_ip}:{last_hop_port}")
-        candidate_neighbors = [n for n in self.neighbors if  n.split(':')[1] != last_hop_port or n.split(':')[0] != last_hop_ip and n not in self.visited_nodes]
-        self.vizinhos_pai.append(f"{last_hop_ip}:{last_hop_port}")
-        if not candidate_neighbors:
-            if f"{self.ip}:{self.port}" == origin:
-                print(f"BP: Não foi possível localizar a chave {key}")
+    def k_walker_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                        options: Dict[str, str], extra: str = "", frame: Optional[bytearray] = None):
+        walker = options.get("W", "0")
+        checkback = int(options.get("C", CHECKBACK_HOPS))
+        if f"{self.ip}:{self.port}" == origin:
+            with self.queries_lock:
+                running = (origin, seqno) in self.pending_queries
+            if not running:
+                self.log(f"KW: walker {walker} parado, a busca ja terminou")
                 return
-            else:
-                print(f"BP: Não foi possível localizar a chave {key}")
-                next_neighbor = f"{last_hop_ip}:{last_hop_port}"
-            
-        else:
-            # Separar o nó de origem dos candidatos
+        elif checkback > 0 and hop_count % checkback == 0:
+            # Estaciona o walker e pergunta a origem; ele so segue se vier um CONTINUE
+            state, _ = self.search_states.get((origin, seqno))
+            state.parked[walker] = (ttl, key, hop_count, last_hop_ip, last_hop_port, checkback, extra)
             origin_ip, origin_port = origin.split(':')
-            non_origin_neighbors = [n for n in candidate_neighbors if n != f"{origin_ip}:{origin_port}" and n not in self.visited_nodes]
-            print(f"candidate_neighbors: {candidate_neighbors}")
-            print(f"self.visited_nodes: {self.visited_nodes}")
-            print(f"non_origin_neighbors: {non_origin_neighbors}")
-            if non_origin_neighbors:
-                print("manda pro aleatorio")
-                non_pai_neighbors = [n for n in non_origin_neighbors if n not in self.vizinhos_pai and n not in self.visited_nodes]
-                if non_pai_neighbors:
-                    next_neighbor = random.choice(non_pai_neighbors)
-                else:
-                    non_pai_neighbors = [n for n in non_pai_neighbors if n not in self.visited_nodes]
-                    next_neighbor = random.choice(non_pai_neighbors)
+            self.send_message(origin_ip, int(origin_port), f"{self.ip}:{self.port} {seqno} 1 CHECK {walker}\n")
+            return
+        self.random_walk_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, mode="KW",
+                                extra=f" W={walker} C={checkback}{extra}", frame=frame)
 
-            else:
-                print("devolve pra origem")
-                next_neighbor = f"{origin_ip}:{origin_port}"
-        self.visited_nodes.append(next_neighbor)  # Append to list instead of assigning
+    def handle_check(self, walker_node: str, seqno: str, walker: str):
+        self.stats["Consultas de walkers a origem"] += 1
+        with self.queries_lock:
+            running = (f"{self.ip}:{self.port}", seqno) in self.pending_queries
+        # Busca ja respondida (ou expirada): nao responder faz o walker parar onde esta
+        if running:
+            walker_ip, walker_port = walker_node.split(':')
+            self.send_message(walker_ip, int(walker_port), f"{self.ip}:{self.port} {seqno} 1 CONTINUE {walker}\n")
+
+    def handle_continue(self, origin: str, seqno: str, walker: str):
+        state, _ = self.search_states.get((origin, seqno))
+        parked = state.parked.pop(walker, None)
+        if parked is None:
+            return
+        ttl, key, hop_count, last_hop_ip, last_hop_port, checkback, extra = parked
+        self.random_walk_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, mode="KW",
+                                extra=f" W={walker} C={checkback}{extra}")
+
+    def guided_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                      extra: str = "", frame: Optional[bytearray] = None):
+        self.log(f"recebi de {last_hop_ip}:{last_hop_port}")
+        state, _ = self.search_states.get((origin, seqno))
+        last_hop = f"{last_hop_ip}:{last_hop_port}"
+        # Encaminha so aos vizinhos cujo resumo pode ter a chave no nivel mais proximo
+        levels = {}
+        for neighbor in self.search_neighbors():
+            if neighbor != last_hop and neighbor not in state.visited:
+                level = self.summary_level(neighbor, key)
+                if level is not None:
+                    levels[neighbor] = level
+        if not levels:
+            self.log(f"BG: nenhum resumo indica a chave {key}, seguindo como random walk")
+            self.random_walk_search(origin, seqno, ttl, key, hop_count, last_hop_ip, last_hop_port, mode="BG", extra=extra,
+                                    frame=frame)
+            return
+        nearest = min(levels.values())
+        neighbor = random.choice([neighbor for neighbor, level in levels.items() if level == nearest])
+        state.visited.add(neighbor)
+        neighbor_ip, neighbor_port = neighbor.split(':')
+        new_message = self.search_message(origin, seqno, ttl, "BG", key, hop_count, extra, frame)
+        self.send_message(neighbor_ip, int(neighbor_port), new_message)
+
+    def depth_first_search(self, origin: str, seqno: str, ttl: int, key: str, hop_count: int, last_hop_ip: str, last_hop_port: str,
+                           extra: str = "", frame: Optional[bytearray] = None):
+        self.log(f"recebi de {last_hop_ip}:{last_hop_port}")
+        state, created = self.search_states.get((origin, seqno))
+        last_hop = f"{last_hop_ip}:{last_hop_port}"
+        is_origin = f"{self.ip}:{self.port}" == origin
+        if created and not is_origin:
+            state.parent = last_hop
+        elif not created and last_hop not in state.visited:
+            # Ja visitado por outro caminho (ciclo): devolve a busca para quem mandou
+            # e marca o vizinho, que tambem ja foi visitado, para nao manda-la de novo a ele
+            self.log("devolve pra quem mandou")
+            state.visited.add(last_hop)
+            next_neighbor = last_hop
+            next_ip, next_port = next_neighbor.split(':')
+            new_message = self.search_message(origin, seqno, ttl, "BP", key, hop_count, extra, frame)
+            self.send_message(next_ip, int(next_port), new_message)
+            return
+
+        next_neighbor = self.pick_next_hop(state, origin, last_hop)
+        if next_neighbor is None:
+            if state.parent is None:
+                self.log(f"BP: Não foi possível localizar a chave {key}")
+                return
+            self.log("devolve pro pai")
+            next_neighbor = state.parent
+        else:
+            state.visited.add(next_neighbor)
         next_ip, next_port = next_neighbor.split(':')
-        new_message = f"{origin} {seqno} {ttl} SEARCH BP {self.ip} {self.port} {key} {hop_count}\n"
+        new_message = self.search_message(origin, seqno, ttl, "BP", key, hop_count, extra, frame)
         self.send_message(next_ip, int(next_port), new_message)
 
-    def handle_val(self, mode: str, key: str, value: str, hop_count: int):
-        print(f"\tValor encontrado!\n \t\tchave: {key}, valor: {value}")
+    def handle_val(self, mode: str, key: str, value: str, hop_count: int, seqno: Optional[str] = None,
+                   notice: bool = False, trace: Optional[str] = None, arrived: Optional[float] = None):
+        self.log(f"\tValor encontrado!\n \t\tchave: {key}, valor: {value}")
+        self.result_cache.put(key, value)
+        if self.coalescing is not None:
+            self.release_coalesced(key, value, hop_count)
+        if notice:
+            return
+        if seqno is not None:
+            with self.queries_lock:
+                query = self.pending_queries.pop((f"{self.ip}:{self.port}", seqno), None)
+                if query is not None:
+                    self.answered_queries[seqno] = (mode, key, value, hop_count)
+                    if len(self.answered_queries) > COALESCE_ANSWERS:
+                        self.answered_queries.popitem(last=False)
+                watchers = self.coalesce_watchers.pop(seqno, [])
+            if query is not None:
+                if trace is not None:
+                    self.record_trace(query, trace, arrived if arrived is not None else self.trace_clock())
+                query.resolve("ok", value, hop_count)
+            for watcher in watchers:
+                self.send_val_notice(watcher, seqno, mode, key, value, hop_count)
         if mode == "FL":
             self.stats["flooding_hops"].append(hop_count)
             self.stats["Total de mensagens de flooding vistas"] += 1
@@ -314,6 +2226,170 @@ class Node:
         elif mode == "BP":
             self.stats["depth_first_hops"].append(hop_count)
             self.stats["Total de mensagens de busca em profundidade vistas"] += 1
+        elif mode == "BG":
+            self.stats["guided_hops"].append(hop_count)
+            self.stats["Total de mensagens de busca guiada vistas"] += 1
+        elif mode == "ER":
+            self.stats["expanding_ring_hops"].append(hop_count)
+            self.stats["Total de mensagens de anel expansivo vistas"] += 1
+        elif mode == "KW":
+            self.stats["k_walker_hops"].append(hop_count)
+            self.stats["Total de mensagens de k random walks vistas"] += 1
+
+    def record_trace(self, query: Query, trace: str, arrived: float):
+        started, hops = parse_trace(trace)
+        query.trace = {
+            "origem": f"{self.ip}:{self.port}",
+            "seqno": query.seqno,
+            "modo": query.mode,
+            "chave": query.key,
+            "inicio": started,
+            "saltos": hops,
+            "resposta": round((arrived - started) * 1000, 3),
+        }
+        self.traces.append(query.trace)
+        if self.trace_file is not None:
+            with self.trace_lock, open(self.trace_file, "a") as f:
+                f.write(json.dumps(query.trace) + "\n")
+
+    def trace_options(self) -> Dict[str, str]:
+        return {"T": str(int(self.trace_clock() * 1e6))} if self.trace else {}
+
+    def replicate(self, seqno: str, key: str, value: str, path: List[str]):
+        address = f"{self.ip}:{self.port}"
+        targets = [node for node in path if node and node != address]
+        if self.replication == "sample" and len(targets) > self.replica_sample:
+            targets = random.sample(targets, self.replica_sample)
+        for node in targets:
+            node_ip, node_port = node.split(':')
+            self.send_message(node_ip, int(node_port), f"{address} {seqno} 1 REPLICA {key} {value}\n")
+
+    def handle_replica(self, key: str, value: str):
+        self.stats["Replicas recebidas"] += 1
+        if key not in self.key_value_store:
+            self.replica_store.put(key, value)
+
+    def handle_vals(self, mode: str, values: Dict[str, str], hop_count: int, seqno: str):
+        for key, value in values.items():
+            self.handle_val(mode, key, value, hop_count)
+        with self.queries_lock:
+            waiting = self.pending_multi.get(seqno)
+            if waiting is None:
+                return
+            queries = [waiting.pop(key) for key in values if key in waiting]
+            if not waiting:
+                del self.pending_multi[seqno]
+        for query in queries:
+            query.resolve("ok", values[query.key], hop_count)
+
+    def metrics_snapshot(self) -> dict:
+        """Metricas deste no num dict serializavel, o mesmo que vai no STATS_OK."""
+        queues = self.connection_manager.backpressure_stats()
+        connections = self.metrics.connections
+        return {
+            "no": f"{self.ip}:{self.port}",
+            "recebidas": dict(self.metrics.received),
+            "enviadas": dict(self.metrics.sent),
+            "descartadas_ttl": self.metrics.dropped_ttl,
+            "descartadas_dedup": self.metrics.dropped_dedup,
+            "bytes_recebidos": self.metrics.bytes_in,
+            "bytes_enviados": sum(stats["bytes"] for stats in queues.values()),
+            "processamento": self.metrics.processing.summary(),
+            "buscas": self.metrics.searches.summary(),
+            "filas": {addr: stats["fila"] for addr, stats in queues.items()},
+            "fila_max": max((stats["fila_max"] for stats in queues.values()), default=0),
+            "descartadas_fila": sum(stats["descartadas"] + stats["expiradas"] for stats in queues.values()),
+            "conexoes": connections,
+            "threads_processo": threading.active_count(),
+            "vizinhos": len(self.neighbors),
+        }
+
+    def handle_stats_request(self, origin: str, seqno: str, ttl: int):
+        # A coleta inunda a rede como um flooding; cada no responde direto a quem coletou
+        request_id = ("STATS", origin, seqno)
+        if request_id in self.message_seen:
+            self.metrics.dropped_dedup += 1
+            return
+        self.message_seen.add(request_id)
+        me = f"{self.ip}:{self.port}"
+        if origin != me:
+            origin_ip, origin_port = origin.split(':')
+            snapshot = json.dumps(self.metrics_snapshot(), separators=(",", ":"))
+            self.send_message(origin_ip, int(origin_port), f"{me} {seqno} 1 STATS_OK {snapshot}\n")
+        if ttl > 1:
+            for neighbor in self.search_neighbors():
+                neighbor_ip, neighbor_port = neighbor.split(':')
+                self.send_message(neighbor_ip, int(neighbor_port), f"{origin} {seqno} {ttl - 1} STATS\n")
+
+    def handle_stats_reply(self, origin: str, seqno: str, snapshot: str):
+        with self.queries_lock:
+            replies = self.stats_replies.get(seqno)
+            if replies is not None:
+                replies[origin] = json.loads(snapshot)
+
+    def collect_stats(self, ttl: int = STATS_TTL, wait: float = STATS_WAIT,
+                      targets: Optional[List[str]] = None) -> Dict[str, dict]:
+        """Inunda um STATS a partir dos vizinhos (ou de targets) e junta as respostas por wait segundos."""
+        me = f"{self.ip}:{self.port}"
+        seqno = str(self.next_seqno())
+        with self.queries_lock:
+            self.stats_replies[seqno] = {me: self.metrics_snapshot()}
+        self.message_seen.add(("STATS", me, seqno))
+        for target in (targets if targets is not None else self.search_neighbors()):
+            target_ip, target_port = target.split(':')
+            self.send_message(target_ip, int(target_port), f"{me} {seqno} {ttl} STATS\n")
+        time.sleep(wait)
+        with self.queries_lock:
+            return self.stats_replies.pop(seqno)
+
+    def print_overlay_stats(self, snapshots: Dict[str, dict]):
+        print(f"{'no':>21} {'recebidas':>9} {'enviadas':>9} {'desc. ttl':>9} {'desc. dedup':>11} {'KB in/out':>13} "
+              f"{'proc. p50/p99 (ms)':>18} {'busca p50/p99 (ms)':>18} {'fila max':>8} {'conexoes':>8}")
+        for addr, snapshot in sorted(snapshots.items()):
+            processing = snapshot["processamento"]
+            searches = snapshot["buscas"]
+            traffic = f"{snapshot['bytes_recebidos'] // 1024}/{snapshot['bytes_enviados'] // 1024}"
+            print(f"{addr:>21} {sum(snapshot['recebidas'].values()):>9} {sum(snapshot['enviadas'].values()):>9} "
+                  f"{snapshot['descartadas_ttl']:>9} {snapshot['descartadas_dedup']:>11} {traffic:>13} "
+                  f"{processing['p50_ms']:>8.3f}/{processing['p99_ms']:<9.3f} "
+                  f"{searches['p50_ms']:>8.1f}/{searches['p99_ms']:<9.1f} {snapshot['fila_max']:>8} "
+                  f"{snapshot['conexoes']:>8}")
+        received = Counter()
+        for snapshot in snapshots.values():
+            received.update(snapshot["recebidas"])
+        print(f"{len(snapshots)} nos responderam; mensagens recebidas por operacao: {dict(received)}")
+
+    def collect_overlay_stats(self):
+        self.print_overlay_stats(self.collect_stats())
+
+    def handle_wait(self, watcher: str, seqno: str, key: str):
+        with self.queries_lock:
+            if (f"{self.ip}:{self.port}", seqno) in self.pending_queries:
+                self.coalesce_watchers.setdefault(seqno, []).append(watcher)
+                return
+            answer = self.answered_queries.get(seqno)
+        # Busca ja respondida: avisa na hora; expirada ou desconhecida: as presas expiram com ela
+        if answer is not None and answer[1] == key:
+            self.send_val_notice(watcher, seqno, *answer)
+
+    def send_val_notice(self, watcher: str, seqno: str, mode: str, key: str, value: str, hop_count: int):
+        watcher_ip, watcher_port = watcher.split(':')
+        self.send_message(watcher_ip, int(watcher_port),
+                          f"{self.ip}:{self.port} {seqno} 1 VAL {mode} {key} {value} {hop_count} N=1\n")
+
+    def release_coalesced(self, key: str, value: str, hop_count: int):
+        entry = self.coalescing.resolve(key)
+        if entry is None:
+            return
+        address = f"{self.ip}:{self.port}"
+        for (origin, seqno), (mode, waiter_hops) in entry.waiters.items():
+            # Saltos ate aqui pela busca presa mais os que a busca repassada deu depois daqui
+            hops = waiter_hops + max(0, hop_count - entry.hop_count)
+            if origin == address:
+                self.handle_val(mode, key, value, hops, seqno)
+            else:
+                origin_ip, origin_port = origin.split(':')
+                self.send_message(origin_ip, int(origin_port), f"{address} {seqno} 1 VAL {mode} {key} {value} {hops}\n")
 
     def calculate_mean_std(self, data: List[int]) -> Tuple[float, float]:
         if data:
@@ -323,24 +2399,6 @@ class Node:
             mean = stddev = 0.0
         return mean, stddev
 
-    def show_statistics(self):
-        print("Estatisticas:")
-        stats_to_print = {
-            "Total de mensagens de flooding vistas": self.stats["Total de mensagens de flooding vistas"],
-            "Total de mensagens de random walk vistas": self.stats["Total de mensagens de random walk vistas"],
-            "Total de mensagens de busca em profundidade vistas": self.stats["Total de mensagens de busca em profundidade vistas"],
-        }
-        flooding_mean, flooding_std = self.calculate_mean_std(self.stats["flooding_hops"])
-        random_walk_mean, random_walk_std = self.calculate_mean_std(self.stats["random_walk_hops"])
-        depth_first_mean, depth_first_std = self.calculate_mean_std(self.stats["depth_first_hops"])
-
-        print(f"\tTotal de mensagens de flooding vistas: {stats_to_print['Total de mensagens de flooding vistas']}")
-        print(f"\tTotal de mensagens de random walk vistas: {stats_to_print['Total de mensagens de random walk vistas']}")
-        print(f"\tTotal de mensagens de busca em profundidade vistas: {stats_to_print['Total de mensagens de busca em profundidade vistas']}")
-        print(f"\tMedia de saltos ate encontrar destino por flooding: {flooding_mean:.1f} (dp {flooding_std:.2f})")
-        print(f"\tMedia de saltos ate encontrar destino por random walk: {random_walk_mean:.1f} (dp {random_walk_std:.2f})")
-        print(f"\tMedia de saltos ate encontrar destino por busca em profundidade: {depth_first_mean:.1f} (dp {depth_first_std:.2f})")
-
     def menu(self):
         commands = {
             0: self.list_neighbors,
@@ -350,7 +2408,10 @@ class Node:
             4: self.handle_search_depth_first,
             5: self.show_statistics,
             6: self.change_ttl,
+            7: self.handle_search_guided,
+            8: self.handle_search_k_walkers,
             9: self.exit_program,
+            10: self.collect_overlay_stats,
         }
 
         while True:
@@ -363,7 +2424,10 @@ Escolha o comando:
 \t[4] SEARCH (busca em profundidade)
 \t[5] Estatisticas
 \t[6] Alterar valor padrao de TTL
+\t[7] SEARCH (busca guiada por resumos)
+\t[8] SEARCH (k random walks)
 \t[9] Sair
+\t[10] Estatisticas da rede (STATS)
 """)
 
 
@@ -380,7 +2444,10 @@ Escolha o comando:
         print(f"Há {len(self.neighbors)} vizinhos na tabela:")
         for index, neighbor in enumerate(self.neighbors):
             neighbor_ip, neighbor_port = neighbor.split(':')
-            print(f"\t[{index}] {neighbor_ip} {neighbor_port}")
+            state = ""
+            if self.failure_detector is not None and not self.failure_detector.available(neighbor):
+                state = f" ({self.failure_detector.state(neighbor)})"
+            print(f"\t[{index}] {neighbor_ip} {neighbor_port}{state}")
 
     def send_hello(self):
         print("Escolha o vizinho:")
@@ -389,8 +2456,7 @@ Escolha o comando:
             number = int(input())
             if 0 <= number < len(self.neighbors):
                 neighbor_ip, neighbor_port = self.neighbors[number].split(':')
-                message = f"{self.ip}:{self.port} {self.seqno} 1 HELLO\n"
-                self.seqno += 1  # Incrementa o número de sequência
+                message = f"{self.ip}:{self.port} {self.next_seqno()} 1 HELLO\n"
                 self.send_message(neighbor_ip, int(neighbor_port), message)
             else:
                 print("Vizinho invalido. Escolha um numero valido")
@@ -398,66 +2464,260 @@ Escolha o comando:
             print("Entrada invalida. Escolha um numero valido")
 
     def handle_search_flooding(self):
-        key = input("Digite a chave a ser buscada\n")
+        self.start_search("ER" if self.expanding_ring else "FL", input("Digite a chave a ser buscada\n"))
+
+    def handle_search_random_walk(self):
+        self.start_search("RW", input("Digite a chave a ser buscada\n"))
+
+    def handle_search_depth_first(self):
+        self.start_search("BP", input("Digite a chave a ser buscada\n"))
+
+    def handle_search_guided(self):
+        self.start_search("BG", input("Digite a chave a ser buscada\n"))
+
+    def handle_search_k_walkers(self):
+        self.start_search("KW", input("Digite a chave a ser buscada\n"))
+
+    def next_seqno(self) -> int:
+        with self.seqno_lock:
+            seqno = self.seqno
+            self.seqno += 1  # Incrementa o número de sequência
+            return seqno
+
+    def start_search(self, mode: str, key: str, timeout: float = QUERY_TIMEOUT) -> Query:
         if key in self.key_value_store:
-            print(f"Valor na tabela local!\n chave: {key}, valor: {self.key_value_store[key]}")
-            return
+            self.log(f"Valor na tabela local!\n chave: {key}, valor: {self.key_value_store[key]}")
+            query = Query(mode, key, None, timeout, self.clock)
+            query.resolve("local", self.key_value_store[key], 0)
+            return query
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            self.log(f"Valor no cache de resultados!\n chave: {key}, valor: {cached}")
+            query = Query(mode, key, None, timeout, self.clock)
+            query.resolve("cache", cached, 0)
+            return query
 
+        self.expire_queries()
         origin = f"{self.ip}:{self.port}"
-        seqno = self.seqno
-        self.seqno += 1  # Incrementa o número de sequência
+        seqno = str(self.next_seqno())
+        query = Query(mode, key, seqno, timeout, self.clock, self.metrics.searches)
+        with self.queries_lock:
+            self.pending_queries[(origin, seqno)] = query
+        self.schedule_expiry(timeout)
         ttl = self.ttl_default
         last_hop_ip = self.ip
         last_hop_port = self.port
         hop_count = 0
-        self.visited_nodes.clear()
-        self.handle_search(origin, str(seqno), ttl, "FL", last_hop_ip, last_hop_port, key, hop_count)
+        if mode == "ER":
+            self.expanding_ring_round(query, 1)
+        elif mode == "KW":
+            for walker in range(self.walkers):
+                self.handle_search(origin, seqno, ttl, mode, last_hop_ip, last_hop_port, key, hop_count,
+                                   options={"W": str(walker), "C": str(self.checkback), **self.trace_options()})
+        else:
+            self.handle_search(origin, seqno, ttl, mode, last_hop_ip, last_hop_port, key, hop_count,
+                               options=self.trace_options())
+        return query
 
-    def handle_search_random_walk(self):
-        key = input("Digite a chave a ser buscada\n")
-        if key in self.key_value_store:
-            print(f"Valor na tabela local!\n chave: {key}, valor: {self.key_value_store[key]}")
-            return
+    def start_multi_search(self, mode: str, keys: List[str], timeout: float = QUERY_TIMEOUT) -> List[Query]:
+        """Busca varias chaves com um SEARCH so por ate MULTI_KEY_MAX chaves; uma consulta por chave, na ordem."""
+        if mode not in MULTI_KEY_MODES:
+            return [self.start_search(mode, key, timeout) for key in keys]
+        queries: List[Query] = []
+        waiting: Dict[str, Query] = {}
+        for key in keys:
+            if key in waiting:
+                queries.append(waiting[key])
+            elif MULTI_KEY_SEPARATOR in key or key in self.key_value_store:
+                queries.append(self.start_search(mode, key, timeout))
+            else:
+                query = Query(mode, key, None, timeout, self.clock, self.metrics.searches)
+                cached = self.result_cache.get(key)
+                if cached is not None:
+                    query.resolve("cache", cached, 0)
+                else:
+                    waiting[key] = query
+                queries.append(query)
 
+        self.expire_queries()
+        if waiting:
+            self.schedule_expiry(timeout)
         origin = f"{self.ip}:{self.port}"
-        seqno = self.seqno
-        self.seqno += 1  # Incrementa o número de sequência
-        ttl = self.ttl_default
-        last_hop_ip = self.ip
-        last_hop_port = self.port
-        hop_count = 0
-        self.visited_nodes.clear()
-        self.handle_search(origin, str(seqno), ttl, "RW", last_hop_ip, last_hop_port, key, hop_count)
+        pending = list(waiting.values())
+        for start in range(0, len(pending), MULTI_KEY_MAX):
+            chunk = pending[start:start + MULTI_KEY_MAX]
+            seqno = str(self.next_seqno())
+            with self.queries_lock:
+                for query in chunk:
+                    query.seqno = seqno
+                self.pending_multi[seqno] = {query.key: query for query in chunk}
+            keys_field = MULTI_KEY_SEPARATOR.join(query.key for query in chunk)
+            self.handle_search(origin, seqno, self.ttl_default, mode, self.ip, self.port, keys_field, 0,
+                               options={"B": "1"})
+        return queries
 
-    def handle_search_depth_first(self):
-        key = input("Digite a chave a ser buscada\n")
-        if key in self.key_value_store:
-            print(f"Valor na tabela local!\n chave: {key}, valor: {self.key_value_store[key]}")
+    def expire_queries(self):
+        now = self.clock()
+        with self.queries_lock:
+            expired = [search_id for search_id, query in self.pending_queries.items() if query.deadline <= now]
+            queries = [self.pending_queries.pop(search_id) for search_id in expired]
+            for _, seqno in expired:
+                self.coalesce_watchers.pop(seqno, None)
+            for seqno, waiting in list(self.pending_multi.items()):
+                # As chaves de uma busca de varias chaves tem o mesmo prazo
+                if next(iter(waiting.values())).deadline <= now:
+                    queries += self.pending_multi.pop(seqno).values()
+        for query in queries:
+            query.resolve("timeout")
+
+    def schedule_expiry(self, delay: float):
+        # Na rede simulada quem roda as buscas expira as consultas: um timer la adiantaria o relogio virtual
+        if self.network is not None:
             return
+        with self.queries_lock:
+            if self.expiry_scheduled:
+                return
+            self.expiry_scheduled = True
+        self.call_later(delay, self.expiry_tick)
 
-        origin = f"{self.ip}:{self.port}"
-        seqno = self.seqno
-        self.seqno += 1  # Incrementa o número de sequência
-        ttl = self.ttl_default
-        last_hop_ip = self.ip
-        last_hop_port = self.port
-        hop_count = 0
-        self.visited_nodes.clear()
-        self.handle_search(origin, str(seqno), ttl, "BP", last_hop_ip, last_hop_port, key, hop_count)
+    def expiry_tick(self):
+        """Expira as consultas vencidas e agenda o proximo timer para o menor prazo pendente."""
+        with self.queries_lock:
+            self.expiry_scheduled = False
+        if not self.running:
+            return
+        self.expire_queries()
+        with self.queries_lock:
+            deadlines = [query.deadline for query in self.pending_queries.values()]
+            deadlines += [next(iter(waiting.values())).deadline for waiting in self.pending_multi.values()]
+        if deadlines:
+            self.schedule_expiry(max(0.0, min(deadlines) - self.clock()))
+
+    def run_batch(self, queries: List[Tuple[str, str]], in_flight: int = BATCH_IN_FLIGHT,
+                  timeout: float = QUERY_TIMEOUT, keys_per_search: int = 1) -> List[Query]:
+        """Executa as buscas (modo, chave) mantendo ate in_flight delas em andamento.
+
+        Com keys_per_search > 1, chaves seguidas do mesmo modo vao juntas num SEARCH de varias chaves.
+        """
+        groups: List[List[Tuple[str, str]]] = []
+        for mode, key in queries:
+            if groups and groups[-1][0][0] == mode and len(groups[-1]) < keys_per_search:
+                groups[-1].append((mode, key))
+            else:
+                groups.append([(mode, key)])
+
+        results: List[Query] = []
+        running: List[Query] = []
+        for group in groups:
+            while True:
+                running = [query for query in running if not query.done.is_set()]
+                # Um SEARCH de varias chaves conta como uma busca em andamento
+                if len({query.seqno for query in running}) < in_flight:
+                    break
+                self.expire_queries()
+                running[0].done.wait(0.01)
+            mode = group[0][0]
+            if len(group) > 1:
+                started = self.start_multi_search(mode, [key for _, key in group], timeout)
+            else:
+                started = [self.start_search(mode, group[0][1], timeout)]
+            results += started
+            running += started
+        for query in running:
+            while not query.done.wait(0.01):
+                self.expire_queries()
+        return results
+
+    def print_batch_report(self, results: List[Query], elapsed: float):
+        for query in results:
+            latency = f"{query.latency * 1000:.2f}" if query.latency is not None else "-"
+            hops = query.hop_count if query.hop_count is not None else "-"
+            print(f"{query.mode} {query.key} {query.status} {latency} ms {hops} saltos")
+        answered = [query for query in results if query.status != "timeout"]
+        latencies = sorted(query.latency * 1000 for query in answered)
+        print(f"Consultas: {len(results)}, respondidas: {len(answered)}, falhas: {len(results) - len(answered)}, "
+              f"{len(results) / elapsed if elapsed else 0.0:.1f} consultas/s")
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            print(f"Latencia: p50 {cuts[49]:.2f} ms, p95 {cuts[94]:.2f} ms, p99 {cuts[98]:.2f} ms")
+        hops = [query.hop_count for query in answered]
+        if hops:
+            print(f"Saltos: media {statistics.mean(hops):.2f}")
 
     def show_statistics(self):
         print("Estatisticas:")
         print(f"\tTotal de mensagens de flooding vistas: {self.stats['Total de mensagens de flooding vistas']}")
         print(f"\tTotal de mensagens de random walk vistas: {self.stats['Total de mensagens de random walk vistas']}")
         print(f"\tTotal de mensagens de busca em profundidade vistas: {self.stats['Total de mensagens de busca em profundidade vistas']}")
+        print(f"\tTotal de mensagens de busca guiada vistas: {self.stats['Total de mensagens de busca guiada vistas']}")
+        print(f"\tTotal de mensagens de anel expansivo vistas: {self.stats['Total de mensagens de anel expansivo vistas']} "
+              f"({self.stats['Rodadas de anel expansivo']} rodadas iniciadas)")
+        print(f"\tTotal de mensagens de k random walks vistas: {self.stats['Total de mensagens de k random walks vistas']} "
+              f"({self.stats['Consultas de walkers a origem']} consultas de walkers a este no)")
+        print(f"\tTotal de mensagens recebidas: {self.stats['Total de mensagens recebidas']}")
+        snapshot = self.metrics_snapshot()
+        print(f"\tMensagens por operacao: recebidas {snapshot['recebidas']}, enviadas {snapshot['enviadas']}")
+        print(f"\tDescartadas: {snapshot['descartadas_ttl']} por TTL, {snapshot['descartadas_dedup']} repetidas, "
+              f"{snapshot['descartadas_fila']} nas filas de saida")
+        print(f"\tBytes: {snapshot['bytes_recebidos']} recebidos, {snapshot['bytes_enviados']} enviados")
+        processing = snapshot["processamento"]
+        print(f"\tProcessamento por mensagem: p50 {processing['p50_ms']:.3f} ms, p95 {processing['p95_ms']:.3f} ms, "
+              f"p99 {processing['p99_ms']:.3f} ms ({processing['n']} mensagens)")
+        searches = snapshot["buscas"]
+        if searches["n"]:
+            print(f"\tBuscas iniciadas aqui (ponta a ponta): p50 {searches['p50_ms']:.1f} ms, "
+                  f"p95 {searches['p95_ms']:.1f} ms, p99 {searches['p99_ms']:.1f} ms ({searches['n']} respondidas)")
+        print(f"\tConexoes recebidas abertas: {snapshot['conexoes']}, threads no processo: {snapshot['threads_processo']}")
 
         flooding_mean, flooding_std = self.calculate_mean_std(self.stats["flooding_hops"])
         random_walk_mean, random_walk_std = self.calculate_mean_std(self.stats["random_walk_hops"])
         depth_first_mean, depth_first_std = self.calculate_mean_std(self.stats["depth_first_hops"])
+        guided_mean, guided_std = self.calculate_mean_std(self.stats["guided_hops"])
+        ring_mean, ring_std = self.calculate_mean_std(self.stats["expanding_ring_hops"])
+        walkers_mean, walkers_std = self.calculate_mean_std(self.stats["k_walker_hops"])
 
         print(f"\tMedia de saltos ate encontrar destino por flooding: {flooding_mean:.1f} (dp {flooding_std:.2f})")
         print(f"\tMedia de saltos ate encontrar destino por random walk: {random_walk_mean:.1f} (dp {random_walk_std:.2f})")
         print(f"\tMedia de saltos ate encontrar destino por busca em profundidade: {depth_first_mean:.1f} (dp {depth_first_std:.2f})")
+        print(f"\tMedia de saltos ate encontrar destino por busca guiada: {guided_mean:.1f} (dp {guided_std:.2f})")
+        print(f"\tMedia de saltos ate encontrar destino por anel expansivo: {ring_mean:.1f} (dp {ring_std:.2f})")
+        print(f"\tMedia de saltos ate encontrar destino por k random walks: {walkers_mean:.1f} (dp {walkers_std:.2f})")
+        print(f"\tTaxa de acerto da tabela de mensagens vistas: {self.message_seen.hit_rate:.1%} "
+              f"({self.message_seen.hits}/{self.message_seen.lookups}, {len(self.message_seen)} entradas)")
+        print(f"\tCache de resultados: {self.result_cache.hits} acertos, {self.result_cache.misses} falhas "
+              f"({len(self.result_cache)} entradas)")
+        print(f"\tBuscas RW/BP com estado neste no: {len(self.search_states)}")
+        if self.failure_detector is not None:
+            counts = self.failure_detector.counts()
+            print(f"\tDetector de falhas: {counts['suspect']} vizinhos suspeitos, {counts['dead']} mortos "
+                  f"({self.failure_detector.suspicions} suspeitas, {self.failure_detector.recoveries} recuperacoes)")
+        if self.trace:
+            destination = f", gravados em {self.trace_file}" if self.trace_file is not None else ""
+            print(f"\tRastros de buscas guardados: {len(self.traces)}{destination}")
+        if self.coalescing is not None:
+            print(f"\tTaxa de coalescencia: {self.coalescing.ratio:.1%} ({self.coalescing.coalesced} buscas presas a "
+                  f"outras, {self.coalescing.forwarded} repassadas, {len(self.coalescing)} esperando VAL)")
+        if self.replication != "off":
+            print(f"\tReplicas ({self.replication}): {len(self.replica_store)} entradas, "
+                  f"{self.stats['Replicas recebidas']} recebidas, {self.replica_store.evictions} descartadas, "
+                  f"{self.stats['Buscas respondidas por replica']} buscas respondidas por replica")
+            # Com chaves populares (Zipf) as replicas aparecem ao longo das buscas: compara o comeco com o fim
+            for label, name in (("flooding", "flooding_hops"), ("random walk", "random_walk_hops"),
+                                ("busca em profundidade", "depth_first_hops")):
+                hops = self.stats[name]
+                if len(hops) >= 2:
+                    half = len(hops) // 2
+                    print(f"\tSaltos por {label}: media {statistics.mean(hops[:half]):.1f} na primeira metade das "
+                          f"buscas, {statistics.mean(hops[half:]):.1f} na segunda")
+        latencies = list(self.connection_manager.forward_latencies)
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            print(f"\tLatencia de encaminhamento por salto (flooding): mediana {cuts[49] * 1000:.2f} ms, "
+                  f"p95 {cuts[94] * 1000:.2f} ms ({len(latencies)} envios)")
+        for neighbor_addr, stats in self.connection_manager.backpressure_stats().items():
+            print(f"\tFila de saida para {neighbor_addr}: {stats['fila']} (max {stats['fila_max']}), "
+                  f"{stats['enviadas']} enviadas em {stats['lotes']} lotes, {stats['descartadas']} descartadas, "
+                  f"{stats['expiradas']} expiradas")
 
     def change_ttl(self):
         try:
@@ -466,37 +2726,145 @@ Escolha o comando:
         except ValueError:
             print("Valor de TTL invalido")
 
+    def serve_forever(self):
+        while self.running:
+            time.sleep(1)
+
     def exit_program(self):
+        print("Saindo...")
+        self.stop()
+        sys.exit(0)
+
+    def stop(self, grace: float = 3.0):
+        self.leave()
+        self.shutdown(grace)
+
+    def leave(self):
+        """Manda BYE aos vizinhos e esvazia as filas de saida, com o servidor ainda aceitando conexoes."""
         with self.lock:
-            print("Saindo...")
             for neighbor in self.neighbors:
                 neighbor_ip, neighbor_port = neighbor.split(':')
-                message = f"{self.ip}:{self.port} {self.seqno} 1 BYE\n"
-                self.seqno += 1
+                message = f"{self.ip}:{self.port} {self.next_seqno()} 1 BYE\n"
                 try:
                     self.send_message(neighbor_ip, int(neighbor_port), message)
                 except socket.error as e:
                     print(f"Error sending BYE to {neighbor_ip}:{neighbor_port}: {e}")
-            for neighbor_socket in self.connections.values():
-                neighbor_socket.close()
-        time.sleep(3)
+        self.connection_manager.close()
+
+    def shutdown(self, grace: float = 3.0):
+        if self.transport == "async":
+            asyncio.run_coroutine_threadsafe(self.shutdown_async(), self.loop).result()
+        time.sleep(grace)
         self.running = False
-        self.server_socket.close()
-        sys.exit(0)
+        if self.server_socket is not None:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+        if self._owns_loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python node.py <address>:<port> [neighbors_file] [key_value_file]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(usage="python node.py <address>:<port> [neighbors_file] [key_value_file] [options]")
+    parser.add_argument("address_port")
+    parser.add_argument("neighbors_file", nargs="?")
+    parser.add_argument("key_value_file", nargs="?")
+    parser.add_argument("--transport", choices=("thread", "async"), default="thread",
+                        help="thread: uma thread por conexao; async: um event loop por no")
+    parser.add_argument("--quiet", action="store_true", help="nao imprime o trafego de mensagens")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default="exact",
+                        help="exact: tabela limitada de ids; bloom: filtros de Bloom rotativos (memoria fixa)")
+    parser.add_argument("--dedup-max-entries", type=int, default=DEDUP_MAX_ENTRIES)
+    parser.add_argument("--dedup-max-age", type=float, default=DEDUP_MAX_AGE, help="segundos")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help=f"entradas do cache de resultados (0, o padrao, desliga; ex.: {RESULT_CACHE_SIZE})")
+    parser.add_argument("--cache-ttl", type=float, default=RESULT_CACHE_TTL, help="segundos")
+    parser.add_argument("--fanout", choices=FANOUT_MODES, default="concurrent",
+                        help="concurrent: um writer por vizinho; sequential: envio bloqueante um vizinho por vez (original)")
+    parser.add_argument("--send-deadline", type=float, default=SEND_DEADLINE,
+                        help="prazo em segundos para uma copia de flooding sair para cada vizinho")
+    parser.add_argument("--summary-depth", type=int, default=0,
+                        help="niveis do resumo de chaves (filtro de Bloom) trocado com os vizinhos; 0 desativa")
+    parser.add_argument("--summary-interval", type=float, default=SUMMARY_INTERVAL,
+                        help="segundos entre reenvios dos resumos aos vizinhos")
+    parser.add_argument("--expanding-ring", action="store_true",
+                        help="o flooding do menu usa anel expansivo (ER): raio 1, 2, 4... ate a primeira resposta")
+    parser.add_argument("--ring-timeout", type=float, default=RING_HOP_TIMEOUT,
+                        help="segundos de espera por salto do raio em cada rodada do anel expansivo")
+    parser.add_argument("--walkers", type=int, default=WALKERS, help="random walks simultaneos do modo KW")
+    parser.add_argument("--checkback", type=int, default=CHECKBACK_HOPS,
+                        help="a cada quantos saltos um walker KW pergunta a origem se continua (0 nunca)")
+    parser.add_argument("--wire", choices=WIRE_PROTOCOLS, default="text",
+                        help="binary: SEARCH e VAL em frames binarios com os vizinhos que tambem anunciarem WIRE=binary "
+                             "(~35%% menos bytes, mais CPU por mensagem)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="prende buscas pela mesma chave a uma busca ja repassada por este no em vez de repassa-las")
+    parser.add_argument("--coalesce-timeout", type=float, default=COALESCE_TIMEOUT,
+                        help="segundos que uma busca repassada segura as buscas iguais esperando o VAL")
+    parser.add_argument("--replication", choices=REPLICATION_POLICIES, default="off",
+                        help="path: quem responde copia o par a todos os nos do caminho da busca; sample: a alguns deles")
+    parser.add_argument("--replica-sample", type=int, default=REPLICA_SAMPLE,
+                        help="nos do caminho sorteados para receber a copia com --replication sample")
+    parser.add_argument("--replica-size", type=int, default=REPLICA_STORE_SIZE,
+                        help="entradas do deposito de replicas (LRU, separado do cache de resultados)")
+    parser.add_argument("--heartbeat", type=float, default=0.0,
+                        help=f"segundos entre HEARTBEAT aos vizinhos; sem noticia por {SUSPECT_AFTER} intervalos o "
+                             f"vizinho fica suspeito e sai das buscas (0 desliga)")
+    parser.add_argument("--trace", action="store_true",
+                        help="as buscas iniciadas aqui levam T=: cada no acrescenta os instantes de chegada, inicio e "
+                             "repasse, e o VAL traz o rastro de volta")
+    parser.add_argument("--trace-file", help="com --trace implicito, grava cada rastro como uma linha JSON (ver rastros.py)")
+    parser.add_argument("--headless", action="store_true",
+                        help="sem menu; atende a rede ate Ctrl+C (tambem depois de --queries) e imprime as estatisticas ao sair")
+    parser.add_argument("--queries", help="arquivo com uma busca por linha: '<FL|RW|BP> <chave>' ou so '<chave>'")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default="FL", help="modo das linhas de --queries sem modo")
+    parser.add_argument("--in-flight", type=int, default=BATCH_IN_FLIGHT, help="buscas simultaneas no modo --queries")
+    parser.add_argument("--keys-per-search", type=int, default=1,
+                        help=f"chaves seguidas de --queries no mesmo modo ({'/'.join(MULTI_KEY_MODES)}) buscadas num "
+                             f"SEARCH so (ate {MULTI_KEY_MAX})")
+    parser.add_argument("--query-timeout", type=float, default=QUERY_TIMEOUT, help="segundos")
+    parser.add_argument("--warmup", type=float, default=1.0, help="segundos de espera pelos vizinhos antes das buscas")
+    args = parser.parse_args()
 
-    address_port = sys.argv[1]
-    address, port = address_port.split(":")
+    address, port = args.address_port.split(":")
     port = int(port)
-    neighbors_file = sys.argv[2] if len(sys.argv) > 2 else None
-    key_value_file = sys.argv[3] if len(sys.argv) > 3 else None
 
-    node = Node(address, port, neighbors_file, key_value_file)
+    node = Node(address, port, args.neighbors_file, args.key_value_file, transport=args.transport, verbose=not args.quiet,
+                dedup=args.dedup, dedup_max_entries=args.dedup_max_entries, dedup_max_age=args.dedup_max_age,
+                cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+                fanout=args.fanout, send_deadline=args.send_deadline,
+                summary_depth=args.summary_depth, summary_interval=args.summary_interval,
+                expanding_ring=args.expanding_ring, ring_timeout=args.ring_timeout,
+                walkers=args.walkers, checkback=args.checkback,
+                coalesce=args.coalesce, coalesce_timeout=args.coalesce_timeout, wire=args.wire,
+                replication=args.replication, replica_sample=args.replica_sample, replica_size=args.replica_size,
+                heartbeat=args.heartbeat, trace=args.trace, trace_file=args.trace_file)
     try:
-        node.start()
+        if args.queries:
+            with open(args.queries) as f:
+                queries = []
+                for line in f:
+                    fields = line.split()
+                    if fields:
+                        queries.append((fields[0], fields[1]) if len(fields) > 1 else (args.mode, fields[0]))
+            node.start(interactive=False)
+            time.sleep(args.warmup)
+            started = time.perf_counter()
+            results = node.run_batch(queries, args.in_flight, args.query_timeout, args.keys_per_search)
+            node.print_batch_report(results, time.perf_counter() - started)
+            if args.headless:
+                # Continua encaminhando as buscas dos outros nos ate Ctrl+C
+                node.serve_forever()
+            else:
+                node.stop()
+        elif args.headless:
+            node.start(interactive=False)
+            node.serve_forever()
+        else:
+            node.start()
     except KeyboardInterrupt:
+        if args.headless:
+            # Sem menu, a unica forma de ver as estatisticas e na saida
+            node.show_statistics()
         node.exit_program()
@@ -0,0 +1,111 @@
+"""Junta os rastros de buscas (node.py --trace-file) e mostra onde o tempo foi gasto.
+
+Cada rastro traz, por salto, os instantes de chegada do lote ao no, de inicio do
+processamento da busca e de repasse (ou resposta), e o instante em que o VAL chegou a
+origem. Daqui saem, por salto e por no, a fila (inicio - chegada) e o processamento
+(saida - inicio), e por enlace o tempo entre a saida de um no e a chegada ao seguinte
+(fila de saida, envio e rede). A volta do VAL, do no que respondeu direto a origem, aparece
+como o enlace "resposta -> origem". Fila e processamento usam o relogio de um no so; os
+enlaces entre maquinas diferentes dependem de relogios sincronizados.
+
+Uso:
+    python node.py 127.0.0.1:5001 topologia_grid3x3/1.txt --quiet --queries consultas.txt --trace-file rastros.jsonl
+    python rastros.py rastros.jsonl --top 10
+    python rastros.py rastros_no1.jsonl rastros_no5.jsonl --json
+"""
+import argparse
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {"n": len(values), "p50": percentile(values, 0.50), "p95": percentile(values, 0.95),
+            "max": max(values, default=0.0)}
+
+
+def merge_traces(traces: List[dict]) -> dict:
+    """Tempos em ms por salto, por no e por enlace, e a divisao do total entre fila, processamento e enlaces."""
+    by_hop = defaultdict(lambda: {"fila": [], "processamento": [], "enlace": []})
+    by_node = defaultdict(lambda: {"fila": [], "processamento": []})
+    by_link = defaultdict(list)
+    totals = {"fila": 0.0, "processamento": 0.0, "enlace": 0.0}
+    for trace in traces:
+        hops = trace["saltos"]
+        for index, hop in enumerate(hops):
+            queued = hop["inicio"] - hop["chegada"]
+            processing = hop["saida"] - hop["inicio"]
+            if index + 1 < len(hops):
+                link = (hop["no"], hops[index + 1]["no"])
+                elapsed = hops[index + 1]["chegada"] - hop["saida"]
+            else:
+                link = (hop["no"], f"{trace['origem']} (resposta)")
+                elapsed = trace["resposta"] - hop["saida"]
+            by_hop[index]["fila"].append(queued)
+            by_hop[index]["processamento"].append(processing)
+            by_hop[index]["enlace"].append(elapsed)
+            by_node[hop["no"]]["fila"].append(queued)
+            by_node[hop["no"]]["processamento"].append(processing)
+            by_link[link].append(elapsed)
+            totals["fila"] += queued
+            totals["processamento"] += processing
+            totals["enlace"] += elapsed
+    return {
+        "rastros": len(traces),
+        "total": summarize([trace["resposta"] for trace in traces]),
+        "divisao": totals,
+        "saltos": {index: {name: summarize(values) for name, values in times.items()}
+                   for index, times in sorted(by_hop.items())},
+        "nos": {node: {name: summarize(values) for name, values in times.items()} for node, times in by_node.items()},
+        "enlaces": {f"{src} -> {dst}": summarize(values) for (src, dst), values in by_link.items()},
+    }
+
+
+def print_report(merged: dict, top: int):
+    total = merged["total"]
+    spent = sum(merged["divisao"].values()) or 1.0
+    print(f"{merged['rastros']} rastros; ponta a ponta p50 {total['p50']:.2f} ms, p95 {total['p95']:.2f} ms, "
+          f"max {total['max']:.2f} ms")
+    print("Tempo somado: " + ", ".join(f"{name} {value / spent:.1%}" for name, value in merged["divisao"].items()))
+
+    print(f"\n{'salto':>5} {'n':>6} {'fila p50/p95 (ms)':>19} {'proc. p50/p95 (ms)':>19} {'enlace p50/p95 (ms)':>20}")
+    for index, times in merged["saltos"].items():
+        queued, processing, link = times["fila"], times["processamento"], times["enlace"]
+        print(f"{index:>5} {queued['n']:>6} {queued['p50']:>9.3f}/{queued['p95']:<9.3f} "
+              f"{processing['p50']:>9.3f}/{processing['p95']:<9.3f} {link['p50']:>9.3f}/{link['p95']:<10.3f}")
+
+    print(f"\n{'no mais lento':>21} {'n':>6} {'fila p50/p95 (ms)':>19} {'proc. p50/p95 (ms)':>19} {'proc. max':>9}")
+    nodes = sorted(merged["nos"].items(),
+                   key=lambda item: item[1]["fila"]["p95"] + item[1]["processamento"]["p95"], reverse=True)
+    for node, times in nodes[:top]:
+        queued, processing = times["fila"], times["processamento"]
+        print(f"{node:>21} {queued['n']:>6} {queued['p50']:>9.3f}/{queued['p95']:<9.3f} "
+              f"{processing['p50']:>9.3f}/{processing['p95']:<9.3f} {processing['max']:>9.3f}")
+
+    print(f"\n{'enlace mais lento':>56} {'n':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}")
+    links = sorted(merged["enlaces"].items(), key=lambda item: item[1]["p95"], reverse=True)
+    for link, times in links[:top]:
+        print(f"{link:>56} {times['n']:>6} {times['p50']:>9.3f} {times['p95']:>9.3f} {times['max']:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("arquivos", nargs="+", help="arquivos de rastros (uma linha JSON por busca)")
+    parser.add_argument("--top", type=int, default=10, help="nos e enlaces mais lentos mostrados")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    traces = []
+    for path in args.arquivos:
+        with open(path) as f:
+            traces += [json.loads(line) for line in f if line.strip()]
+    merged = merge_traces(traces)
+    if args.json:
+        print(json.dumps(merged, indent=2))
+    else:
+        print_report(merged, args.top)
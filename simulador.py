@@ -0,0 +1,404 @@
+"""Simulador de eventos discretos da rede sobreposta, em um unico processo.
+
+Os nos sao objetos Node comuns com o transporte "memory": a logica de busca
+(flood_search, random_walk_search, depth_first_search, handle_val) e exatamente a
+dos nos reais, mas as mensagens passam por uma fila de eventos com relogio virtual
+e uma latencia simulada por enlace, sem sockets nem threads.
+
+A rede pode vir de um diretorio topologia_* (mesmo formato <N>.txt dos scripts .ps1,
+com os nos se apresentando por HELLO) ou ser gerada: aleatoria, grade ou lei de
+potencia (Barabasi-Albert). Para cada modo e TTL o simulador roda as buscas uma a uma
+e mostra taxa de sucesso, mensagens por busca, saltos e latencia virtual.
+
+Limites: os padroes (mil nos, 100 buscas, so os passeios RW, BP, BG e KW) rodam em
+segundos, mas so porque deixam FL e ER de fora. Com 10 mil nos e 1000 buscas por TTL os
+passeios ainda terminam em segundos, porem com TTL 50 e uma copia de cada chave acham a
+chave em ~0,5% das buscas (KW em ~2%). FL e ER inundam a rede e entram so com --modos: a
+deduplicacao do node.py e por enlace (origem, seqno e ultimo salto), entao cada no repassa
+a busca uma vez por vizinho que a entrega, e com 10 mil nos e TTL 50 uma busca FL custa
+~157 mil mensagens e ~4 s (ER ~32 mil e ~1,2 s). Mil buscas FL por TTL levam mais de uma
+hora nesse tamanho.
+
+Uso:
+    python simulador.py --grafo powerlaw --nos 10000 --buscas 1000 --modos RW BP --ttls 10 50 100
+    python simulador.py --topologia topologia_grid3x3 --chaves "key_values/key_value{n}.txt"
+    python simulador.py --nos 2000 --resumo 3 --modos RW BG --ttls 50
+    python simulador.py --nos 2000 --zipf 1.0 --replicacao path --modos FL RW BP --ttls 100
+"""
+import argparse
+import heapq
+import io
+import itertools
+import math
+import os
+import random
+import statistics
+import time
+from collections import Counter, deque
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from hospedeiro import topology_files
+from node import (LATENCY_SAMPLES, REPLICATION_POLICIES, SEARCH_MODES, Node, ResultCache, SearchStateTable,
+                  make_dedup_table)
+
+GRAPHS = ("random", "grid", "powerlaw")
+# FL e ER custam da ordem das arestas da rede por busca; ficam fora dos modos padrao (ver Limites acima)
+DEFAULT_MODES = [mode for mode in SEARCH_MODES if mode not in ("FL", "ER")]
+LINK_LATENCY_MIN = 0.001
+LINK_LATENCY_MAX = 0.010
+
+Graph = Dict[int, Set[int]]
+
+
+class SimulatedConnections:
+    """Faz o papel do ConnectionManager de um no, entregando pela rede simulada."""
+
+    def __init__(self, network: "SimulatedNetwork", addr: str):
+        self.network = network
+        self.addr = addr
+        self.forward_latencies: "deque[float]" = deque(maxlen=LATENCY_SAMPLES)
+
+    def send(self, neighbor_addr: str, data: bytes, started: Optional[float] = None, deadline: Optional[float] = None):
+        # Nao ha fila de saida: o envio e instantaneo e o atraso fica todo no enlace
+        self.network.send(self.addr, neighbor_addr, data)
+
+    def close(self, timeout: float = 0.0):
+        pass
+
+    def backpressure_stats(self) -> Dict[str, Dict[str, int]]:
+        return {}
+
+
+class SimulatedNetwork:
+    """Fila de eventos (instante, ordem, destino, mensagem) com relogio virtual em segundos.
+
+    Timers dos nos (Node.call_later) entram na mesma fila, sem destino e com a funcao no
+    lugar da mensagem.
+    """
+
+    def __init__(self, latency_min: float = LINK_LATENCY_MIN, latency_max: float = LINK_LATENCY_MAX, seed: int = 0):
+        self.latency_min = latency_min
+        self.latency_max = latency_max
+        self.random = random.Random(seed)
+        self.now = 0.0
+        self.events: List[Tuple[float, int, Optional[str], Union[bytes, Callable[[], None]]]] = []
+        self.sequence = 0
+        self.nodes: Dict[str, Node] = {}
+        self.links: Dict[Tuple[str, str], float] = {}
+        self.messages: Counter = Counter()
+        self.bytes: Counter = Counter()
+        self.lost = 0
+        self.touched: Set[str] = set()
+
+    def clock(self) -> float:
+        return self.now
+
+    def attach(self, node: Node) -> SimulatedConnections:
+        addr = f"{node.ip}:{node.port}"
+        self.nodes[addr] = node
+        return SimulatedConnections(self, addr)
+
+    def latency(self, src: str, dst: str) -> float:
+        # Cada sentido de cada enlace tem uma latencia fixa, sorteada no primeiro uso
+        link = (src, dst)
+        latency = self.links.get(link)
+        if latency is None:
+            latency = self.links[link] = self.random.uniform(self.latency_min, self.latency_max)
+        return latency
+
+    def send(self, src: str, dst: str, data: bytes):
+        operation = data.split(None, 4)[3]
+        self.messages[operation] += 1
+        self.bytes[operation] += len(data)
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + self.latency(src, dst), self.sequence, dst, data))
+
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, self.sequence, None, callback))
+
+    def run(self, until: Optional[float] = None) -> int:
+        """Entrega mensagens ate a fila esvaziar (ou ate o instante until). Devolve quantas entregou."""
+        delivered = 0
+        events = self.events
+        while events and (until is None or events[0][0] <= until):
+            self.now, _, dst, data = heapq.heappop(events)
+            if dst is None:
+                data()
+                continue
+            node = self.nodes.get(dst)
+            if node is None or not node.running:
+                self.lost += 1
+                continue
+            self.touched.add(dst)
+            node.process_messages([data.decode()], None)
+            delivered += 1
+        if until is not None and until > self.now:
+            self.now = until
+        return delivered
+
+
+def random_graph(n: int, degree: int, rng: random.Random) -> Graph:
+    # Uma arvore aleatoria garante que o grafo e conexo; o resto das arestas e sorteado
+    graph: Graph = {i: set() for i in range(n)}
+    for i in range(1, n):
+        j = rng.randrange(i)
+        graph[i].add(j)
+        graph[j].add(i)
+    edges = n - 1
+    target = n * degree // 2
+    while edges < target and n > 1:
+        a, b = rng.randrange(n), rng.randrange(n)
+        if a != b and b not in graph[a]:
+            graph[a].add(b)
+            graph[b].add(a)
+            edges += 1
+    return graph
+
+
+def grid_graph(n: int) -> Graph:
+    side = math.ceil(math.sqrt(n))
+    graph: Graph = {i: set() for i in range(n)}
+    for i in range(n):
+        row, col = divmod(i, side)
+        for j in (i + 1 if col + 1 < side else None, i + side):
+            if j is not None and j < n:
+                graph[i].add(j)
+                graph[j].add(i)
+    return graph
+
+
+def powerlaw_graph(n: int, degree: int, rng: random.Random) -> Graph:
+    # Barabasi-Albert: cada no novo liga-se a m nos escolhidos com probabilidade proporcional ao grau
+    m = max(1, degree // 2)
+    graph: Graph = {i: set() for i in range(n)}
+    targets: List[int] = []
+    for i in range(min(m + 1, n)):
+        for j in range(i):
+            graph[i].add(j)
+            graph[j].add(i)
+            targets += (i, j)
+    for i in range(m + 1, n):
+        chosen: Set[int] = set()
+        while len(chosen) < m:
+            chosen.add(rng.choice(targets))
+        for j in chosen:
+            graph[i].add(j)
+            graph[j].add(i)
+            targets += (i, j)
+    return graph
+
+
+def node_addr(number: int) -> Tuple[str, int]:
+    # Mesma convencao dos arquivos de topologia: o no N escuta em 127.0.0.1:5000+N
+    return "127.0.0.1", 5000 + number
+
+
+def build_graph_nodes(network: SimulatedNetwork, graph: Graph, rng: random.Random, replicas: int = 1,
+                      **node_options) -> List[Node]:
+    """Cria um no por vertice e liga os vizinhos sem HELLO.
+
+    Ha tantas chaves (chave<K>) quanto nos, cada uma guardada em replicas nos sorteados.
+    """
+    nodes = []
+    for number in sorted(graph):
+        ip, port = node_addr(number)
+        nodes.append(Node(ip, port, transport="memory", network=network, verbose=False, **node_options))
+    for key in range(len(nodes)):
+        for node in rng.sample(nodes, min(replicas, len(nodes))):
+            node.key_value_store[f"chave{key}"] = f"valor{key}"
+    for node, number in zip(nodes, sorted(graph)):
+        node.neighbors = ["%s:%d" % node_addr(neighbor) for neighbor in sorted(graph[number])]
+    if node_options.get("summary_depth"):
+        for node in nodes:
+            node.key_summary = node.build_key_summary()
+        exchange_summaries(network, nodes, node_options["summary_depth"])
+    return nodes
+
+
+def exchange_summaries(network: SimulatedNetwork, nodes: List[Node], depth: int):
+    # Faz o papel do refresh periodico dos nos: cada rodada leva os resumos um nivel adiante
+    for _ in range(depth):
+        for node in nodes:
+            node.push_summaries()
+        network.run()
+
+
+def build_topology_nodes(network: SimulatedNetwork, directory: str, key_pattern: Optional[str] = None,
+                         **node_options) -> List[Node]:
+    """Carrega um diretorio topologia_* e deixa os nos se apresentarem por HELLO/HELLO_OK."""
+    nodes = []
+    for number, neighbors_file in topology_files(directory).items():
+        key_value_file = key_pattern.format(n=number) if key_pattern else None
+        if key_value_file and not os.path.exists(key_value_file):
+            key_value_file = None
+        ip, port = node_addr(number)
+        node = Node(ip, port, neighbors_file, key_value_file, transport="memory", network=network,
+                    verbose=False, **node_options)
+        nodes.append(node)
+    # Os HELLO enviados no __init__ de cada no so sao entregues aqui, quando todos ja existem
+    network.run()
+    if node_options.get("summary_depth"):
+        exchange_summaries(network, nodes, node_options["summary_depth"])
+    return nodes
+
+
+def add_graph_arguments(parser: argparse.ArgumentParser, nodes: int = 1000, replicas: int = 1):
+    """Opcoes do grafo gerado, comuns ao simulador e aos benchmarks que rodam sobre ele."""
+    parser.add_argument("--grafo", choices=GRAPHS, default="random", help="tipo de grafo gerado")
+    parser.add_argument("--nos", type=int, default=nodes, help="numero de nos do grafo gerado")
+    parser.add_argument("--grau", type=int, default=4, help="grau medio do grafo gerado (random/powerlaw)")
+    parser.add_argument("--replicas", type=int, default=replicas, help="copias de cada chave no grafo gerado")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def build_network_from_args(args: argparse.Namespace, network: Optional[SimulatedNetwork] = None,
+                            **node_options) -> Tuple[SimulatedNetwork, List[Node], random.Random]:
+    """Gera o grafo de --grafo/--nos/--grau/--replicas e monta os nos; devolve a rede, os nos e o rng."""
+    random.seed(args.seed)  # o random walk e o fanout usam o random global do node.py
+    rng = random.Random(args.seed)
+    if network is None:
+        network = SimulatedNetwork(seed=args.seed)
+    if args.grafo == "grid":
+        graph = grid_graph(args.nos)
+    elif args.grafo == "powerlaw":
+        graph = powerlaw_graph(args.nos, args.grau, rng)
+    else:
+        graph = random_graph(args.nos, args.grau, rng)
+    with redirect_stdout(io.StringIO()):
+        nodes = build_graph_nodes(network, graph, rng, args.replicas, **node_options)
+    return network, nodes, rng
+
+
+def forget_searches(node: Node, node_options: Dict):
+    # As buscas rodam uma de cada vez, entao o estado de dedup e de RW/BP de uma busca ja
+    # terminada nunca mais e consultado; descarta-lo mantem a memoria constante com 10k nos
+    node.message_seen = make_dedup_table(node_options.get("dedup", "exact"), clock=node.clock)
+    node.search_states = SearchStateTable(clock=node.clock)
+
+
+def forget_replicas(nodes: List[Node]):
+    # Cada modo comeca sem as replicas deixadas pelas buscas do modo anterior
+    for node in nodes:
+        store = node.replica_store
+        node.replica_store = ResultCache(store.capacity, store.ttl, node.clock)
+
+
+def run_queries(network: SimulatedNetwork, nodes: List[Node], mode: str, ttl: int, count: int,
+                rng: random.Random, timeout: float, node_options: Dict, zipf: float = 0.0) -> Dict[str, float]:
+    by_addr = {f"{node.ip}:{node.port}": node for node in nodes}
+    keys = sorted({key for node in nodes for key in node.key_value_store})
+    # Com zipf > 0 a chave de posicao r (em uma ordem sorteada) e buscada com peso 1/r^zipf
+    weights = None
+    if zipf > 0:
+        keys = rng.sample(keys, len(keys))
+        weights = list(itertools.accumulate(1 / rank ** zipf for rank in range(1, len(keys) + 1)))
+    successes = 0
+    sent: List[int] = []
+    hops: List[int] = []
+    latencies: List[float] = []
+    wall_started = time.perf_counter()
+    for _ in range(count):
+        origin = rng.choice(nodes)
+        drawn = rng.choices(keys, cum_weights=weights, k=8) if weights else (rng.choice(keys) for _ in range(8))
+        candidates = [key for key in drawn if key not in origin.key_value_store]
+        if not candidates:
+            continue
+        origin.ttl_default = ttl
+        before = sum(network.messages.values())
+        query = origin.start_search(mode, candidates[0], timeout)
+        network.run()
+        if not query.done.is_set():
+            network.run(until=query.deadline)
+            origin.expire_queries()
+        sent.append(sum(network.messages.values()) - before)
+        if query.status == "ok":
+            successes += 1
+            hops.append(query.hop_count)
+            latencies.append(query.latency)
+        network.touched.add(f"{origin.ip}:{origin.port}")
+        for addr in network.touched:
+            forget_searches(by_addr[addr], node_options)
+        network.touched.clear()
+    elapsed = time.perf_counter() - wall_started
+    latency_p95 = statistics.quantiles(latencies, n=100, method="inclusive")[94] if len(latencies) > 1 else 0.0
+    half = len(hops) // 2
+    return {
+        "buscas": len(sent),
+        "sucesso": successes / len(sent) if sent else 0.0,
+        "mensagens": statistics.mean(sent) if sent else 0.0,
+        "saltos": statistics.mean(hops) if hops else 0.0,
+        "saltos_inicio": statistics.mean(hops[:half]) if half else 0.0,
+        "saltos_fim": statistics.mean(hops[half:]) if half else 0.0,
+        "latencia": statistics.median(latencies) if latencies else 0.0,
+        "latencia_p95": latency_p95,
+        "tempo": elapsed,
+    }
+
+
+def print_report(rows: List[Tuple[str, int, Dict[str, float]]]):
+    # "1a/2a metade": media de saltos das buscas bem-sucedidas da primeira e da segunda metade
+    print(f"{'modo':>4} {'ttl':>5} {'buscas':>7} {'sucesso':>8} {'msgs/busca':>11} {'saltos':>7} "
+          f"{'1a/2a metade':>13} {'lat. med (ms)':>14} {'lat. p95 (ms)':>14} {'tempo (s)':>10}")
+    for mode, ttl, result in rows:
+        halves = f"{result['saltos_inicio']:.2f}/{result['saltos_fim']:.2f}"
+        print(f"{mode:>4} {ttl:>5} {result['buscas']:>7} {result['sucesso']:>8.1%} {result['mensagens']:>11.1f} "
+              f"{result['saltos']:>7.2f} {halves:>13} {result['latencia'] * 1000:>14.2f} "
+              f"{result['latencia_p95'] * 1000:>14.2f} {result['tempo']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topologia", help="diretorio topologia_* a carregar (em vez de gerar um grafo)")
+    parser.add_argument("--chaves", help='arquivos chave-valor da topologia, ex.: "key_values/key_value{n}.txt"')
+    add_graph_arguments(parser)
+    parser.add_argument("--buscas", type=int, default=100, help="buscas por modo e TTL")
+    parser.add_argument("--modos", nargs="+", choices=SEARCH_MODES, default=DEFAULT_MODES,
+                        help="padrao: so os passeios RW, BP, BG e KW, que com 10 mil nos e TTL 50 acham ~0,5%% das "
+                             "chaves de uma copia so. FL e ER inundam a rede: com 10 mil nos e TTL 50 cada busca FL "
+                             "leva ~4 s (~157 mil mensagens), mil buscas levam mais de uma hora")
+    parser.add_argument("--ttls", nargs="+", type=int, default=[5, 10, 50])
+    parser.add_argument("--latencia-min", type=float, default=LINK_LATENCY_MIN * 1000, help="ms")
+    parser.add_argument("--latencia-max", type=float, default=LINK_LATENCY_MAX * 1000, help="ms")
+    parser.add_argument("--timeout", type=float, default=60.0, help="prazo virtual de cada busca, em segundos")
+    parser.add_argument("--cache-size", type=int, default=0, help="cache de resultados por no (0 desliga)")
+    parser.add_argument("--anel-timeout", type=float, default=2 * LINK_LATENCY_MAX * 1000,
+                        help="espera por salto de cada rodada do anel expansivo (ER), em ms")
+    parser.add_argument("--resumo", type=int, default=0,
+                        help="niveis dos resumos de chaves trocados entre vizinhos (modo BG); 0 desliga")
+    parser.add_argument("--zipf", type=float, default=0.0,
+                        help="expoente da popularidade Zipf das chaves buscadas; 0 sorteia as chaves por igual")
+    parser.add_argument("--replicacao", choices=REPLICATION_POLICIES, default="off",
+                        help="replicacao dos pares encontrados nos nos do caminho da busca")
+    args = parser.parse_args()
+
+    network = SimulatedNetwork(args.latencia_min / 1000, args.latencia_max / 1000, args.seed)
+    node_options = {"cache_size": args.cache_size, "summary_depth": args.resumo,
+                    "ring_timeout": args.anel_timeout / 1000, "replication": args.replicacao}
+
+    started = time.perf_counter()
+    if args.topologia:
+        random.seed(args.seed)
+        rng = random.Random(args.seed)
+        with redirect_stdout(io.StringIO()):
+            nodes = build_topology_nodes(network, args.topologia, args.chaves, **node_options)
+        description = args.topologia
+    else:
+        network, nodes, rng = build_network_from_args(args, network, **node_options)
+        description = f"{args.grafo}, grau medio {sum(len(node.neighbors) for node in nodes) / len(nodes):.1f}"
+    print(f"{len(nodes)} nos ({description}) montados em {time.perf_counter() - started:.2f} s")
+
+    rows = []
+    for mode in args.modos:
+        for ttl in args.ttls:
+            forget_replicas(nodes)
+            rows.append((mode, ttl, run_queries(network, nodes, mode, ttl, args.buscas, rng, args.timeout,
+                                                node_options, args.zipf)))
+    print_report(rows)
+    print(f"Mensagens enviadas por tipo: {dict((op.decode(), n) for op, n in network.messages.items())}, "
+          f"{network.lost} para nos inexistentes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from node import BloomDedupTable, DedupTable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_oldest_entries_leave_when_full():
+    table = DedupTable(max_entries=3, max_age=60, clock=FakeClock())
+    for seqno in range(5):
+        table.add(("127.0.0.1:5001", str(seqno)))
+    assert len(table) == 3
+    assert ("127.0.0.1:5001", "1") not in table
+    assert ("127.0.0.1:5001", "2") in table
+    assert ("127.0.0.1:5001", "4") in table
+
+
+def test_readded_entry_moves_to_the_end():
+    table = DedupTable(max_entries=2, max_age=60, clock=FakeClock())
+    table.add("a")
+    table.add("b")
+    table.add("a")
+    table.add("c")
+    assert "a" in table
+    assert "b" not in table
+
+
+def test_entries_expire_by_age():
+    clock = FakeClock()
+    table = DedupTable(max_entries=100, max_age=10, clock=clock)
+    table.add("velha")
+    clock.now = 6
+    table.add("nova")
+    clock.now = 11
+    assert "velha" not in table
+    assert "nova" in table
+    assert len(table) == 1
+    assert table.hit_rate == 0.5
+
+
+def test_bloom_table_forgets_after_two_rotations_when_full():
+    table = BloomDedupTable(max_entries=4, max_age=60, clock=FakeClock())
+    for item in range(4):
+        table.add(item)
+    # A quinta insercao roda os filtros: as quatro primeiras continuam no anterior
+    table.add(4)
+    assert all(item in table for item in range(5))
+    for item in range(5, 9):
+        table.add(item)
+    assert not any(item in table for item in range(4))
+    assert all(item in table for item in range(4, 9))
+
+
+def test_bloom_table_rotates_every_half_max_age():
+    clock = FakeClock()
+    table = BloomDedupTable(max_entries=100, max_age=10, clock=clock)
+    table.add("velha")
+    clock.now = 5
+    assert "velha" in table
+    clock.now = 10
+    assert "velha" not in table
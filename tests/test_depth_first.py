@@ -0,0 +1,46 @@
+import random
+
+from node import Node
+from simulador import SimulatedNetwork
+
+
+def build_tree(tmp_path, key_node: int):
+    # 5001 liga a 5002 e 5003, e 5002 a 5004: um ramo sem saida e uma folha do outro lado
+    links = {1: "127.0.0.1:5002\n127.0.0.1:5003\n", 2: "127.0.0.1:5004\n", 3: "", 4: ""}
+    network = SimulatedNetwork()
+    nodes = []
+    for number, neighbors in links.items():
+        neighbors_file = tmp_path / f"{number}.txt"
+        neighbors_file.write_text(neighbors)
+        key_value_file = tmp_path / f"key_value{number}.txt"
+        key_value_file.write_text("alvo valor\n" if number == key_node else f"outra{number} valor\n")
+        nodes.append(Node("127.0.0.1", 5000 + number, str(neighbors_file), str(key_value_file), transport="memory",
+                          network=network, verbose=False))
+    network.run()
+    return network, nodes
+
+
+def test_backtracks_out_of_a_dead_end(tmp_path):
+    random.seed(1)
+    network, nodes = build_tree(tmp_path, key_node=3)
+    origin = nodes[0]
+    hops = set()
+    for _ in range(20):
+        query = origin.start_search("BP", "alvo", timeout=5.0)
+        network.run(until=query.deadline)
+        assert query.status == "ok"
+        hops.add(query.hop_count)
+    # Direto 5001 -> 5003, ou 5001 -> 5002 -> 5004, volta a 5002 e a 5001, e so entao 5003
+    assert hops == {1, 5}
+
+
+def test_reports_not_found_after_visiting_every_node(tmp_path):
+    network, nodes = build_tree(tmp_path, key_node=0)
+    origin = nodes[0]
+    messages = []
+    origin.log = messages.append
+    query = origin.start_search("BP", "alvo", timeout=5.0)
+    network.run(until=query.deadline)
+    assert "BP: Não foi possível localizar a chave alvo" in messages
+    for node in nodes[1:]:
+        assert ("127.0.0.1:5001", query.seqno) in node.search_states.states
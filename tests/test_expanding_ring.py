@@ -0,0 +1,23 @@
+from node import Node
+from simulador import SimulatedNetwork
+
+
+def test_far_key_is_found_before_the_query_deadline(tmp_path):
+    # Linha 5001 - 5002 - ... - 5012, com a chave a 11 saltos da origem
+    network = SimulatedNetwork()
+    nodes = []
+    for number in range(1, 13):
+        neighbors_file = tmp_path / f"{number}.txt"
+        neighbors_file.write_text(f"127.0.0.1:{5000 + number + 1}\n" if number < 12 else "")
+        key_value_file = tmp_path / f"key_value{number}.txt"
+        key_value_file.write_text("longe valor\n" if number == 12 else f"perto{number} valor\n")
+        nodes.append(Node("127.0.0.1", 5000 + number, str(neighbors_file), str(key_value_file), transport="memory",
+                          network=network, verbose=False, ring_timeout=0.05))
+    network.run()
+
+    origin = nodes[0]
+    query = origin.start_search("ER", "longe", timeout=1.0)
+    network.run(until=query.deadline)
+    origin.expire_queries()
+    assert query.status == "ok"
+    assert query.hop_count == 11
@@ -0,0 +1,40 @@
+from node import FailureDetector
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_send_failure_to_peer_without_heartbeats_is_ignored():
+    detector = FailureDetector(1.0, clock=Clock())
+    detector.failed("127.0.0.1:5002")
+    assert detector.available("127.0.0.1:5002")
+    assert detector.check() == []
+    assert detector.suspicions == 0
+
+
+def test_send_failure_is_cleared_by_next_delivery():
+    detector = FailureDetector(1.0, clock=Clock())
+    detector.heard("127.0.0.1:5002")
+    detector.failed("127.0.0.1:5002")
+    assert detector.state("127.0.0.1:5002") == "suspect"
+    assert detector.delivered("127.0.0.1:5002")
+    assert detector.available("127.0.0.1:5002")
+
+
+def test_silent_peer_needs_a_message_to_recover():
+    clock = Clock()
+    detector = FailureDetector(1.0, suspect_after=3, dead_after=10, clock=clock)
+    detector.heard("127.0.0.1:5002")
+    clock.now = 11.0
+    assert detector.check() == [("127.0.0.1:5002", "dead")]
+    # Um envio aceito nao prova que o vizinho trata as mensagens
+    assert not detector.delivered("127.0.0.1:5002")
+    assert detector.state("127.0.0.1:5002") == "dead"
+    assert not detector.contacted("127.0.0.1:5003")
+    assert detector.contacted("127.0.0.1:5002")
+    assert detector.available("127.0.0.1:5002")
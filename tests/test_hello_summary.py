@@ -0,0 +1,21 @@
+from node import Node
+from simulador import SimulatedNetwork
+
+
+def test_hello_initiator_summary_guides_search(tmp_path):
+    neighbors_file = tmp_path / "2.txt"
+    neighbors_file.write_text("127.0.0.1:5001\n")
+    key_value_file = tmp_path / "key_value2.txt"
+    key_value_file.write_text("chave valor\n")
+    network = SimulatedNetwork()
+    receiver = Node("127.0.0.1", 5001, transport="memory", network=network, verbose=False, summary_depth=1)
+    # O no 5002 e quem manda o HELLO, ja com o resumo das suas chaves
+    Node("127.0.0.1", 5002, str(neighbors_file), str(key_value_file), transport="memory", network=network,
+         verbose=False, summary_depth=1)
+    network.run()
+
+    assert receiver.summary_level("127.0.0.1:5002", "chave") == 0
+    query = receiver.start_search("BG", "chave")
+    network.run()
+    assert query.status == "ok"
+    assert query.value == "valor"
@@ -0,0 +1,64 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+
+from node import ConnectionManager, Node
+
+
+def listening_socket():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(5)
+    return server, f"127.0.0.1:{server.getsockname()[1]}"
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_idle_writer_thread_is_reaped_and_keeps_its_counters():
+    server, addr = listening_socket()
+    threads_before = threading.active_count()
+    manager = ConnectionManager(lambda message: None, idle_timeout=0.1)
+    manager.send(addr, b"127.0.0.1:1 1 1 VAL FL chave valor 1\n")
+    assert wait_until(lambda: not manager.writers)
+    assert wait_until(lambda: threading.active_count() == threads_before)
+    assert manager.backpressure_stats()[addr]["enviadas"] == 1
+
+    # O proximo envio abre outro writer e os contadores se somam
+    manager.send(addr, b"127.0.0.1:1 2 1 VAL FL chave valor 1\n")
+    assert wait_until(lambda: manager.backpressure_stats()[addr]["enviadas"] == 2)
+    manager.close()
+    server.close()
+
+
+def test_idle_async_writer_task_is_reaped():
+    server, addr = listening_socket()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    manager = ConnectionManager(lambda message: None, loop=loop, idle_timeout=0.1)
+    manager.send(addr, b"127.0.0.1:1 1 1 VAL FL chave valor 1\n")
+    assert wait_until(lambda: manager.backpressure_stats().get(addr, {}).get("enviadas") == 1)
+    assert wait_until(lambda: not manager.writers)
+    manager.close()
+    loop.call_soon_threadsafe(loop.stop)
+    server.close()
+
+
+def test_async_stop_leaves_no_pending_writer_tasks():
+    server, addr = listening_socket()
+    node = Node("127.0.0.1", random.randint(20000, 30000), transport="async", verbose=False)
+    node.start(interactive=False)
+    node.leave()
+    # Um envio depois do leave (ex.: uma resposta no prazo de encerramento) abre outro writer
+    node.connection_manager.send(addr, b"127.0.0.1:1 1 1 VAL FL chave valor 1\n")
+    assert wait_until(lambda: addr in node.connection_manager.backpressure_stats())
+    node.shutdown(grace=0)
+    assert wait_until(lambda: not node.loop.is_running())
+    assert [task for task in asyncio.all_tasks(node.loop) if not task.done()] == []
+    server.close()
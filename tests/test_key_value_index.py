@@ -0,0 +1,64 @@
+from node import MappedKeyValueStore, Node, build_key_value_index, is_key_value_index
+from simulador import SimulatedNetwork
+
+
+def test_lookups_match_the_text_file(tmp_path):
+    text_file = tmp_path / "chaves.txt"
+    text_file.write_text("".join(f"chave{n} valor{n}\n" for n in range(1000)) + "\nchave7 repetida\n")
+    index_file = tmp_path / "chaves.idx"
+    assert build_key_value_index(str(text_file), str(index_file)) == 1000
+    assert is_key_value_index(str(index_file))
+    assert not is_key_value_index(str(text_file))
+
+    store = MappedKeyValueStore(str(index_file))
+    assert len(store) == 1000
+    assert store["chave0"] == "valor0"
+    assert store["chave999"] == "valor999"
+    # Como no dict, a chave repetida fica com o ultimo valor
+    assert store["chave7"] == "repetida"
+    assert sorted(store) == sorted(f"chave{n}" for n in range(1000))
+
+
+def test_missing_keys(tmp_path):
+    text_file = tmp_path / "chaves.txt"
+    text_file.write_text("a 1\nb 2\n")
+    index_file = tmp_path / "chaves.idx"
+    build_key_value_index(str(text_file), str(index_file))
+    store = MappedKeyValueStore(str(index_file))
+    assert "c" not in store
+    assert "" not in store
+    assert 1 not in store
+    assert store.get("c") is None
+    try:
+        store["c"]
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("chave ausente deveria levantar KeyError")
+
+
+def test_rebuilt_index_replaces_the_stale_one(tmp_path):
+    text_file = tmp_path / "chaves.txt"
+    text_file.write_text("a 1\nb 2\n")
+    index_file = tmp_path / "chaves.idx"
+    build_key_value_index(str(text_file), str(index_file))
+    stale = MappedKeyValueStore(str(index_file))
+
+    text_file.write_text("b 3\nc 4\n")
+    assert build_key_value_index(str(text_file), str(index_file)) == 2
+    store = MappedKeyValueStore(str(index_file))
+    assert dict(store) == {"b": "3", "c": "4"}
+    # Quem abriu o indice antigo continua lendo o antigo
+    assert dict(stale) == {"a": "1", "b": "2"}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["chaves.idx", "chaves.txt"]
+
+
+def test_node_answers_from_the_index(tmp_path):
+    text_file = tmp_path / "chaves.txt"
+    text_file.write_text("a 1\n")
+    index_file = tmp_path / "chaves.idx"
+    build_key_value_index(str(text_file), str(index_file))
+    node = Node("127.0.0.1", 5001, key_value_file=str(index_file), transport="memory", network=SimulatedNetwork(),
+                verbose=False)
+    assert isinstance(node.key_value_store, MappedKeyValueStore)
+    assert node.key_value_store["a"] == "1"
@@ -0,0 +1,22 @@
+import random
+import socket
+
+from node import Node
+
+
+def test_unanswered_search_expires_without_batch():
+    # O vizinho aceita a conexao e nunca responde: a busca fica pendente, como no menu
+    silent = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(5)
+    node = Node("127.0.0.1", random.randint(20000, 30000), verbose=False)
+    node.start(interactive=False)
+    node.neighbors.append(f"127.0.0.1:{silent.getsockname()[1]}")
+    try:
+        query = node.start_search("FL", "ausente", timeout=0.2)
+        assert query.done.wait(5.0)
+        assert query.status == "timeout"
+        assert not node.pending_queries
+    finally:
+        node.stop(grace=0)
+        silent.close()
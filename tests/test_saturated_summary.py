@@ -0,0 +1,34 @@
+from node import SUMMARY_CAPACITY, SUMMARY_ERROR_RATE, BloomFilter, Node
+from simulador import SimulatedNetwork
+
+
+def test_saturated_summary_is_not_advertised(tmp_path):
+    neighbors_file = tmp_path / "2.txt"
+    neighbors_file.write_text("127.0.0.1:5001\n")
+    key_value_file = tmp_path / "key_value2.txt"
+    key_value_file.write_text("".join(f"chave{n} valor{n}\n" for n in range(20 * SUMMARY_CAPACITY)))
+    network = SimulatedNetwork()
+    receiver = Node("127.0.0.1", 5001, transport="memory", network=network, verbose=False, summary_depth=1)
+    sender = Node("127.0.0.1", 5002, str(neighbors_file), str(key_value_file), transport="memory", network=network,
+                  verbose=False, summary_depth=1)
+    network.run()
+
+    assert sender.key_summary is None
+    assert receiver.neighbor_summaries["127.0.0.1:5002"] == [None]
+    assert receiver.summary_level("127.0.0.1:5002", "qualquer") is None
+
+
+def test_saturated_filter_from_neighbor_is_ignored():
+    network = SimulatedNetwork()
+    receiver = Node("127.0.0.1", 5001, transport="memory", network=network, verbose=False, summary_depth=1)
+    receiver.neighbors.append("127.0.0.1:5002")
+    full = BloomFilter(SUMMARY_CAPACITY, SUMMARY_ERROR_RATE)
+    for n in range(20 * SUMMARY_CAPACITY):
+        full.add(f"chave{n}")
+    receiver.handle_summary("127.0.0.1:5002", full.encode())
+    assert receiver.summary_level("127.0.0.1:5002", "qualquer") is None
+
+    sparse = BloomFilter(SUMMARY_CAPACITY, SUMMARY_ERROR_RATE)
+    sparse.add("chave")
+    receiver.handle_summary("127.0.0.1:5002", sparse.encode())
+    assert receiver.summary_level("127.0.0.1:5002", "chave") == 0
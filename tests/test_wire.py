@@ -0,0 +1,57 @@
+from node import MessageFramer, WireMessage, decode_binary, encode_binary
+
+
+def test_binary_round_trip():
+    frame = encode_binary("127.0.0.1:5001", "7", 100, "SEARCH", "BP", "127.0.0.1:5002", 3, "chave", " R=127.0.0.1:5003")
+    assert frame is not None
+    assert decode_binary(frame) == ("127.0.0.1:5001", "7", 100, "SEARCH", "BP", "127.0.0.1", "5002", 3, "chave",
+                                    " R=127.0.0.1:5003")
+
+
+def test_ttl_over_16_bits_falls_back_to_text():
+    assert encode_binary("127.0.0.1:5001", "7", 70000, "SEARCH", "FL", "127.0.0.1:5002", 0, "chave", "") is None
+    message = WireMessage("127.0.0.1:5001", "7", 70000, "SEARCH", "FL", "127.0.0.1:5002", 0, "chave")
+    assert message.binary() is None
+    assert message.text() == b"127.0.0.1:5001 7 70000 SEARCH FL 127.0.0.1 5002 chave 0\n"
+
+
+def test_forwarded_frame_keeps_key_and_rewrites_route():
+    received = encode_binary("127.0.0.1:5001", "7", 100, "SEARCH", "RW", "127.0.0.1:5002", 3, "chave", "")
+    message = WireMessage("127.0.0.1:5001", "7", 99, "SEARCH", "RW", "127.0.0.1:5003", 4, "chave", frame=received)
+    forwarded = message.binary()
+    assert decode_binary(forwarded) == ("127.0.0.1:5001", "7", 99, "SEARCH", "RW", "127.0.0.1", "5003", 4, "chave", "")
+    # O frame recebido nao e alterado e a mesma codificacao serve a todos os vizinhos
+    assert decode_binary(received)[2] == 100
+    assert message.binary() is forwarded
+
+
+def test_framer_joins_split_messages():
+    framer = MessageFramer()
+    assert framer.feed(b"127.0.0.1:5001 1 100 SEA") == []
+    assert framer.feed(b"RCH FL 127.0.0.1 5001 chave 0\n127.0.0.1:5001 2 1") == [
+        "127.0.0.1:5001 1 100 SEARCH FL 127.0.0.1 5001 chave 0"]
+    assert framer.feed(b"00 SEARCH FL 127.0.0.1 5001 outra 0\n") == [
+        "127.0.0.1:5001 2 100 SEARCH FL 127.0.0.1 5001 outra 0"]
+
+    frame = bytes(encode_binary("127.0.0.1:5001", "3", 100, "SEARCH", "FL", "127.0.0.1:5001", 0, "chave", ""))
+    messages = []
+    for byte in range(len(frame)):
+        messages += framer.feed(frame[byte:byte + 1])
+    assert messages == [frame]
+    assert framer.buffer == bytearray()
+
+
+def test_framer_separates_mixed_text_and_binary():
+    first = bytes(encode_binary("127.0.0.1:5001", "1", 100, "SEARCH", "FL", "127.0.0.1:5001", 0, "a", ""))
+    second = bytes(encode_binary("127.0.0.1:5001", "2", 100, "VAL", "FL", "127.0.0.1:5002", 1, "b", "valor"))
+    stream = b"HELLO 1\nHELLO 2\n" + first + b"BYE\n" + second + b"HELLO 3\n"
+    framer = MessageFramer()
+    # Cortes que caem no meio do prefixo, do corpo do frame e de uma linha de texto
+    cuts = (5, 17, 20, len(stream) - len(second) - 2, len(stream) - 3)
+    messages = []
+    start = 0
+    for cut in cuts + (len(stream),):
+        messages += framer.feed(stream[start:cut])
+        start = cut
+    assert messages == ["HELLO 1", "HELLO 2", first, "BYE", second, "HELLO 3"]
+    assert framer.buffer == bytearray()